@@ -1,131 +1,448 @@
+import argparse
 import asyncio
-import json
+import http
+import os
+import secrets
+import signal
 import time
-import threading
-from typing import Set, Any
+from typing import Dict, Any, Optional
+from urllib.parse import parse_qs, urlsplit
 from server.playerHandler import PlayerHandler
+from server.codec import DecodeError, EncodedMessage, MapInterner, negotiate_subprotocol, select_codec
+from server.clientSession import ClientSession
+from server.chatStore import ChatStore
+from server.chatLog import ChatLog
+from server.chatRouter import CHANNELS, ChatRouter
+from server.checkpoint import Checkpointer, read_checkpoint
+from server.config import ServerSettings
+from server.tickScheduler import TickScheduler
+from server.metrics import (BYTES_IN, INBOUND_DROPPED, LOOP_LAG_SECONDS, LOOP_STALLS, MESSAGES_IN, REGISTRY,
+                            SERIALIZE_SECONDS, TICK_SECONDS, Gauge)
+from server.loopMonitor import LoopMonitor
+from server.tokenBucket import TokenBucket
+from server.compression import server_extensions
+from server.shards import SHARD_ID_STRIDE, ChatBusClient, ShardRoutes
+from server.deltaHistory import DeltaHistory
+from server.timingWheel import TimingWheel
 
 from websockets.asyncio.server import serve
 
-PORT = 8989
-
+# Recreated in main() once the deployment settings are parsed
 PLAYER_HANDLER = PlayerHandler()
-PLAYER_HANDLER.start()
-
-# ------------------------------
-# Simple in-memory chat storage
-# ------------------------------
-class ChatStore:
-    def __init__(self) -> None:
-        self._lock = threading.Lock()
-        self._next_id = 1
-        self._messages: list[dict] = []
-
-    def add(self, sender_id: int, text: str) -> dict:
-        # Sanitize
-        t = (text or "").strip()
-        if len(t) > 200:
-            t = t[:200]
-        if not t:
-            raise ValueError("empty")
-        with self._lock:
-            msg = {
-                "id": self._next_id,
-                "from": sender_id,
-                "text": t,
-                "ts": time.time(),
-            }
-            self._messages.append(msg)
-            self._next_id += 1
-            # Keep only the last N to avoid unbounded growth
-            if len(self._messages) > 1000:
-                self._messages = self._messages[-800:]
-            return msg
-
-    def list_since(self, since_id: int) -> list[dict]:
-        with self._lock:
-            if since_id <= 0:
-                return list(self._messages[-100:])  # cap response size
-            # Find first index with id > since_id
-            # Messages are appended in increasing id order
-            out: list[dict] = []
-            for m in self._messages:
-                if int(m.get("id", 0)) > since_id:
-                    out.append(m)
-            # Cap size
-            if len(out) > 200:
-                out = out[-200:]
-            return out
-
-CHAT = ChatStore()
+# Map ids shared by every binary connection so a frame encodes the same for all
+MAP_INTERNER = MapInterner()
+EncodedMessage.observe_encode = SERIALIZE_SECONDS.observe
+
+CHAT = ChatStore(ServerSettings.CHAT_CAPACITY)
+# Recipients of map and nearby chat (recreated in main() with the configured radius)
+CHAT_ROUTER = ChatRouter(ServerSettings.CHAT_NEARBY_TILES * ServerSettings.TILE_SIZE)
+
+# Set in main() when this process is one shard of a sharded deployment
+SHARD_ROUTES: ShardRoutes | None = None
+CHAT_BUS: ChatBusClient | None = None
 
 # Track connected clients
-CONNECTED_CLIENTS: Set[Any] = set()
-CLIENTS_LOCK = asyncio.Lock()
+CONNECTED_CLIENTS: Dict[Any, ClientSession] = {}
 
+# Message types clients send; anything else is counted as "other" so a client cannot mint metric series
+INBOUND_TYPES = frozenset(("player_update", "chat_send"))
 
-async def broadcast_player_update():
-    """Broadcast player list to all connected clients periodically"""
-    counter = 0
-    while True:
-        await asyncio.sleep(0.0167)  # 60 updates per second
-        players = PLAYER_HANDLER.list_players()
-        message = {
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
-        }
-        msg_json = json.dumps(message)
-        # Broadcast to all connected clients
-        counter += 1
-        if counter % 60 == 0:  # Print every ~1 second
-            print(f"[Server] Broadcasting {len(players)} players to {len(CONNECTED_CLIENTS)} clients")
-        disconnected = set()
-        async with CLIENTS_LOCK:
-            for client in CONNECTED_CLIENTS:
-                try:
-                    await client.send(msg_json)
-                except Exception:
-                    disconnected.add(client)
-            # Remove disconnected clients
-            CONNECTED_CLIENTS.difference_update(disconnected)
+
+# Per-map sequence number of the last players frame broadcast (keyframe or delta)
+PLAYERS_SEQ: Dict[str, int] = {}
+# Per-map record of which players changed at which seq, for resuming clients
+DELTA_HISTORY: Dict[str, DeltaHistory] = {}
+# Map names clients may report (loaded from MAPS_DIR in main()); None accepts any name within the limits
+KNOWN_MAPS: frozenset[str] | None = None
+# Maps with per-map state -> monotonic time someone was last seen on them
+MAP_LAST_OCCUPIED: Dict[str, float] = {}
+# Monotonic time of the next sweep for idle maps
+NEXT_MAP_SWEEP = 0.0
+
+# Resume tokens handed out at registration (token -> player id and back)
+RESUME_TOKENS: Dict[str, int] = {}
+PLAYER_TOKENS: Dict[int, str] = {}
+# The connection currently playing each player (a resume replaces it)
+SESSIONS_BY_PLAYER: Dict[int, ClientSession] = {}
+# Players whose connection dropped, kept in the world until RESUME_GRACE runs out
+HELD_PLAYERS = TimingWheel(ServerSettings.RESUME_GRACE)
+
+# Newest player_update of each client since the last tick (player id -> update arguments)
+PENDING_UPDATES: Dict[int, tuple] = {}
+# Chat messages accepted since the last tick; sent as one batch per client
+PENDING_CHAT: list[dict] = []
+
+
+def build_keyframe(map_name: str) -> EncodedMessage:
+    return EncodedMessage({
+        "type": "players_update",
+        "map": map_name,
+        "seq": PLAYERS_SEQ.get(map_name, 0),
+        "players": PLAYER_HANDLER.list_players(map_name),
+        "timestamp": time.time()
+    })
+
+
+def load_known_maps(maps_dir: str) -> frozenset[str] | None:
+    """Names of the *.tmx maps in ``maps_dir`` (relative to this file), or None if there are none."""
+    if not maps_dir:
+        return None
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), maps_dir)
+    try:
+        names = frozenset(name for name in os.listdir(path) if name.endswith(".tmx"))
+    except OSError as e:
+        print(f"[Server] Cannot list maps in {path} ({e}), accepting any map name")
+        return None
+    if not names:
+        print(f"[Server] No maps in {path}, accepting any map name")
+        return None
+    return names
+
+
+def accept_map(map_name: str) -> bool:
+    """Whether a client may report being on ``map_name``.
+
+    Per-map state is keyed by these names, so only known maps get in. Without
+    a map list, names are capped in length and in how many are tracked at once.
+    """
+    if KNOWN_MAPS is not None:
+        return map_name in KNOWN_MAPS
+    if PLAYER_HANDLER.has_map(map_name):
+        return True
+    return (len(map_name.encode("utf-8")) <= ServerSettings.MAX_MAP_NAME_BYTES
+            and PLAYER_HANDLER.map_count() < ServerSettings.MAX_MAPS)
+
+
+def prune_map_state(now: float) -> None:
+    """Drop the seq, delta history, map code and map id of maps nobody has been on for MAP_STATE_TTL."""
+    global NEXT_MAP_SWEEP
+    if now < NEXT_MAP_SWEEP:
+        return
+    NEXT_MAP_SWEEP = now + ServerSettings.MAP_STATE_TTL / 2
+    for map_name in PLAYER_HANDLER.count_by_map():
+        MAP_LAST_OCCUPIED[map_name] = now
+    for map_name in PLAYERS_SEQ.keys() | DELTA_HISTORY.keys():
+        MAP_LAST_OCCUPIED.setdefault(map_name, now)
+    for map_name, seen in list(MAP_LAST_OCCUPIED.items()):
+        if now - seen >= ServerSettings.MAP_STATE_TTL:
+            del MAP_LAST_OCCUPIED[map_name]
+            PLAYERS_SEQ.pop(map_name, None)
+            DELTA_HISTORY.pop(map_name, None)
+    PLAYER_HANDLER.prune_maps(keep=MAP_LAST_OCCUPIED)
+    # A queued frame of a pruned map interns it again when encoded; the next sweep frees it
+    for map_name in MAP_INTERNER.names():
+        if not PLAYER_HANDLER.has_map(map_name):
+            MAP_INTERNER.forget(map_name)
+
+
+# Monotonic time of the last heartbeat keyframe
+LAST_HEARTBEAT = 0.0
+
+
+def broadcast_tick() -> None:
+    """Broadcast player changes to the clients on each map (one scheduler tick).
+
+    Every client only receives the players on its own map. Each tick sends a
+    ``players_delta`` per map with the players that joined, changed or left
+    that map since the previous tick. When nothing changed no frame is built
+    at all, apart from a full ``players_update`` keyframe heartbeat every
+    ``HEARTBEAT_INTERVAL`` seconds. Clients that just connected or switched
+    maps get a keyframe of the new map.
+
+    Chat accepted since the previous tick goes out in the same pass: a
+    client that gets a players frame this tick finds the chat inside it
+    (``"chat"`` field), every other client gets one ``chat_update``. Either
+    way it is one frame per client per tick, however many people typed.
+    Map and nearby chat only reach their audience (see route_chat).
+
+    Frames are only enqueued on each client's session; per-client writer
+    tasks do the sending, so a slow client cannot stall the tick.
+    """
+    global LAST_HEARTBEAT
+    now = time.monotonic()
+
+    chat, personal_chat = route_chat(PENDING_CHAT)
+    PENDING_CHAT.clear()
+
+    # Apply the coalesced player updates received since the previous tick
+    for player_id, update in PENDING_UPDATES.items():
+        PLAYER_HANDLER.update(player_id, *update)
+    PENDING_UPDATES.clear()
+
+    # Expire inactive players; they go out as "removed" in this tick's deltas. A player whose
+    # connection is still open is only idle (clients send nothing while standing still), not gone
+    expired = PLAYER_HANDLER.expire(now, keep=SESSIONS_BY_PLAYER)
+    if expired:
+        print(f"[Server] Expired inactive players: {expired}")
+    expired += HELD_PLAYERS.advance(now)
+    for player_id in expired:
+        forget_player(player_id)
+    prune_map_state(now)
+
+    # Drop clients that stopped draining their outbound queue
+    for session in list(CONNECTED_CLIENTS.values()):
+        if session.is_backlogged(now):
+            session.disconnect("outbound backlog timeout")
+
+    periodic_keyframe = now - LAST_HEARTBEAT >= ServerSettings.HEARTBEAT_INTERVAL
+    if periodic_keyframe:
+        LAST_HEARTBEAT = now
+    elif not PLAYER_HANDLER.has_changes() and not any(
+            session.needs_keyframe for session in CONNECTED_CLIENTS.values()):
+        if chat or personal_chat:
+            deliver_chat(chat, personal_chat)
+        return
+    changes = PLAYER_HANDLER.collect_changes()
+    CHAT_ROUTER.apply_changes(changes)
+
+    # Group subscribers by map, picking up map switches since the last tick
+    subscribers: Dict[str, list[ClientSession]] = {}
+    for session in CONNECTED_CLIENTS.values():
+        map_name = PLAYER_HANDLER.get_map(session.player_id)
+        if map_name is not None and map_name != session.map_name:
+            session.map_name = map_name
+            session.needs_keyframe = True
+            CHAT_ROUTER.subscribe(session, map_name)
+        subscribers.setdefault(session.map_name, []).append(session)
+
+    for map_name in changes.keys() | (subscribers.keys() if periodic_keyframe else set()):
+        seq = PLAYERS_SEQ[map_name] = PLAYERS_SEQ.get(map_name, 0) + 1
+        changed, removed = changes.get(map_name, ((), ()))
+        DELTA_HISTORY.setdefault(map_name, DeltaHistory()).record(seq, changed, removed)
+
+    chat_update = EncodedMessage({"type": "chat_update", "messages": chat}) if chat else None
+
+    # Build each map's frames once, only if someone on that map receives them
+    # (and once per codec in use, see EncodedMessage)
+    for map_name, sessions in subscribers.items():
+        keyframe = None
+        delta = None
+        # Players frame id -> the same frame with this tick's chat attached
+        with_chat: Dict[int, EncodedMessage] = {}
+        for session in sessions:
+            frame = None
+            if periodic_keyframe or session.needs_keyframe:
+                if keyframe is None:
+                    keyframe = build_keyframe(map_name)
+                session.needs_keyframe = False
+                frame = keyframe
+            elif map_name in changes:
+                if delta is None:
+                    changed, removed = changes[map_name]
+                    delta = EncodedMessage({
+                        "type": "players_delta",
+                        "map": map_name,
+                        "seq": PLAYERS_SEQ[map_name],
+                        "changed": changed,
+                        "removed": removed,
+                        "timestamp": time.time()
+                    })
+                frame = delta
+            session_chat = personal_chat.get(session, chat) if personal_chat else chat
+            if not session_chat:
+                if frame is not None:
+                    session.push_snapshot(frame)
+            elif frame is None:
+                session.push_reliable(chat_update if session_chat is chat else
+                                      {"type": "chat_update", "messages": session_chat})
+            else:
+                # Chat must arrive, so the combined frame goes out reliably
+                if session_chat is not chat:
+                    combined = EncodedMessage({**frame.message, "chat": session_chat})
+                else:
+                    combined = with_chat.get(id(frame))
+                    if combined is None:
+                        combined = with_chat[id(frame)] = EncodedMessage({**frame.message, "chat": chat})
+                session.push_reliable(combined, replaces_snapshot=True)
+
+
+def route_chat(messages: list[dict]) -> tuple[list[dict], Dict[ClientSession, list[dict]]]:
+    """Split a tick's chat into the global messages and per-client lists.
+
+    Global chat goes to everyone. A client reached by map or nearby chat
+    gets its own list (its global and targeted messages, in id order). The
+    audience comes from CHAT_ROUTER's per-map sets and spatial grid, so
+    the work is proportional to the players reached, not the server size.
+    """
+    shared = [m for m in messages if m["channel"] == "global"]
+    personal: Dict[ClientSession, list[dict]] = {}
+    for message in messages:
+        channel = message["channel"]
+        if channel == "map":
+            audience = set(CHAT_ROUTER.on_map(message["map"]))
+        elif channel == "nearby":
+            audience = {SESSIONS_BY_PLAYER[pid] for pid in CHAT_ROUTER.nearby(message["from"])
+                        if pid in SESSIONS_BY_PLAYER}
+        else:
+            continue
+        # The sender always sees its own message
+        sender = SESSIONS_BY_PLAYER.get(message["from"])
+        if sender is not None:
+            audience.add(sender)
+        for session in audience:
+            received = personal.get(session)
+            if received is None:
+                received = personal[session] = []
+            received.append(message)
+    if shared:
+        for session, received in personal.items():
+            personal[session] = sorted(shared + received, key=lambda m: m["id"])
+    return shared, personal
+
+
+def deliver_chat(chat: list[dict], personal_chat: Dict[ClientSession, list[dict]]) -> None:
+    """Send a tick's chat in chat_update messages (ticks without players frames)."""
+    if chat:
+        shared = EncodedMessage({"type": "chat_update", "messages": chat})
+        for session in CONNECTED_CLIENTS.values():
+            if session not in personal_chat:
+                session.push_reliable(shared)
+    for session, messages in personal_chat.items():
+        session.push_reliable({"type": "chat_update", "messages": messages})
+
+
+def visible_chat(messages: list[dict], map_name: str) -> list[dict]:
+    """Chat history a client is shown: global chat and map chat of its map (nearby chat is not replayed)."""
+    return [m for m in messages if m.get("channel", "global") == "global"
+            or (m["channel"] == "map" and m.get("map") == map_name)]
+
+
+def forget_player(player_id: int) -> None:
+    """Remove a player for good; its resume token stops working."""
+    token = PLAYER_TOKENS.pop(player_id, None)
+    if token is not None:
+        RESUME_TOKENS.pop(token, None)
+    HELD_PLAYERS.discard(player_id)
+    PENDING_UPDATES.pop(player_id, None)
+    PLAYER_HANDLER.unregister(player_id)
+
+
+def parse_resume(websocket: Any) -> Optional[dict]:
+    """Resume parameters from the connect URL (``?resume=<token>&chat_since=&map=&seq=``).
+
+    None when the client did not ask to resume or the token is unknown
+    (expired, or issued by a previous server run).
+    """
+    query = parse_qs(urlsplit(websocket.request.path).query)
+    token = query.get("resume", [""])[0]
+    player_id = RESUME_TOKENS.get(token)
+    if player_id is None or player_id not in PLAYER_HANDLER:
+        return None
+    try:
+        chat_since = int(query.get("chat_since", ["0"])[0])
+        seq = int(query.get("seq", ["-1"])[0])
+    except ValueError:
+        chat_since, seq = 0, -1
+    return {"player_id": player_id, "chat_since": chat_since,
+            "map": query.get("map", [""])[0], "seq": seq}
+
+
+def push_resume_delta(session: ClientSession, map_name: str, seq: int) -> bool:
+    """Catch a resuming client up on its map with one delta instead of a keyframe.
+
+    Returns False (and the client gets a keyframe on the next tick) when the
+    player is on another map by now or ``seq`` is too old to answer.
+    """
+    if seq < 0 or PLAYER_HANDLER.get_map(session.player_id) != map_name:
+        return False
+    history = DELTA_HISTORY.get(map_name)
+    missed = history.since(seq) if history is not None else None
+    if missed is None:
+        return False
+    changed_ids, removed = missed
+    players = PLAYER_HANDLER.list_players(map_name) if changed_ids else {}
+    session.map_name = map_name
+    session.needs_keyframe = False
+    CHAT_ROUTER.subscribe(session, map_name)
+    if seq == history.seq:
+        # Nothing missed: the client is in sync already, and a delta repeating its seq would look like a gap
+        return True
+    session.push_snapshot(EncodedMessage({
+        "type": "players_delta",
+        "map": map_name,
+        "seq": history.seq,
+        "changed": {pid: players[pid] for pid in changed_ids if pid in players},
+        "removed": removed,
+        "timestamp": time.time()
+    }))
+    return True
+
+
+def handle_bus_chat(message: dict) -> None:
+    """Global chat relayed from another shard."""
+    PENDING_CHAT.append(CHAT.add(int(message["from"]), str(message["text"])))
 
 
 async def handle_client(websocket: Any):
     """Handle a WebSocket client connection"""
     player_id = -1
-    
-    async with CLIENTS_LOCK:
-        CONNECTED_CLIENTS.add(websocket)
+    # JSON unless the client negotiated the binary subprotocol
+    codec = select_codec(websocket.subprotocol, MAP_INTERNER)
+    session = None
     
     try:
-        # Register player on connection - server assigns ID
-        player_id = PLAYER_HANDLER.register()
-        await websocket.send(json.dumps({
+        resume = parse_resume(websocket)
+        if resume is not None:
+            # Reconnect within the grace period: same player, same slot
+            player_id = resume["player_id"]
+            HELD_PLAYERS.discard(player_id)
+            previous = SESSIONS_BY_PLAYER.get(player_id)
+            if previous is not None:
+                # The old connection has not noticed it is dead yet
+                previous.disconnect("resumed on a new connection")
+        else:
+            # Register player on connection - server assigns ID
+            player_id = PLAYER_HANDLER.register()
+            token = secrets.token_urlsafe(16)
+            RESUME_TOKENS[token] = player_id
+            PLAYER_TOKENS[player_id] = token
+        inbound = None
+        if ServerSettings.INBOUND_RATE > 0:
+            inbound = TokenBucket(ServerSettings.INBOUND_RATE, ServerSettings.INBOUND_BURST)
+        session = ClientSession(websocket, player_id, codec, inbound)
+        SESSIONS_BY_PLAYER[player_id] = session
+        session.start()
+        session.push_reliable({
             "type": "registered",
-            "id": player_id
-        }))
+            "id": player_id,
+            "resume": PLAYER_TOKENS[player_id],
+            "resumed": resume is not None
+        })
         
-        # Send initial player list
-        players = PLAYER_HANDLER.list_players()
-        await websocket.send(json.dumps({
-            "type": "players_update",
-            "players": players,
-            "timestamp": time.time()
-        }))
+        # The initial player list is sent as a keyframe on the next tick
+        CONNECTED_CLIENTS[websocket] = session
         
-        # Send recent chat messages
-        recent_chat = CHAT.list_since(0)
-        await websocket.send(json.dumps({
-            "type": "chat_update",
-            "messages": recent_chat
-        }))
+        if resume is not None:
+            # Only the chat the client missed, and a delta if its players seq is recent enough
+            session.push_reliable({
+                "type": "chat_update",
+                "messages": visible_chat(CHAT.list_since(resume["chat_since"]),
+                                         PLAYER_HANDLER.get_map(player_id) or "")
+            })
+            push_resume_delta(session, resume["map"], resume["seq"])
+        else:
+            # Send recent chat messages
+            recent_chat = visible_chat(CHAT.list_since(0), "")
+            session.push_reliable({
+                "type": "chat_update",
+                "messages": recent_chat
+            })
         
         # Handle incoming messages
         async for message in websocket:
+            # Over the rate limit: drop before spending any time decoding
+            if session.inbound is not None and not session.inbound.allow():
+                if session.rate_limited == 0:
+                    print(f"[Server] Player {player_id} exceeded the inbound rate limit")
+                session.rate_limited += 1
+                INBOUND_DROPPED.inc("rate_limited")
+                continue
             try:
-                data = json.loads(message)
+                data = codec.decode(message)
                 msg_type = data.get("type")
+                label = msg_type if isinstance(msg_type, str) and msg_type in INBOUND_TYPES else "other"
+                MESSAGES_IN.inc(label)
+                BYTES_IN.inc(label, amount=len(message))
                 
                 
                 if msg_type == "player_update":
@@ -136,10 +453,30 @@ async def handle_client(websocket: Any):
                     # 客戶端發送 "direction" 和 "is_moving"，轉換為 server 期望的 "dir" 和 "moving"
                     dir_name = str(data.get("direction", "down"))
                     moving = bool(data.get("is_moving", False))
+                    if not accept_map(map_name):
+                        INBOUND_DROPPED.inc("invalid_map")
+                        continue
+                    
+                    if SHARD_ROUTES is not None:
+                        owner = SHARD_ROUTES.shard_for(map_name)
+                        if owner != ServerSettings.SHARD_INDEX:
+                            # Map lives on another shard: hand the player off, the client reconnects there
+                            if not session.redirected:
+                                session.redirected = True
+                                session.push_reliable({
+                                    "type": "redirect",
+                                    "url": SHARD_ROUTES.urls[owner]
+                                })
+                            continue
                     
                     # 使用伺服器分配的玩家ID，忽略客戶端提供的ID
-                    ok = PLAYER_HANDLER.update(player_id, x, y, map_name, dir_name, moving)
-                    if not ok:
+                    if ServerSettings.COALESCE_UPDATES:
+                        # Only the newest update per tick is applied; older ones are superseded
+                        if player_id in PENDING_UPDATES:
+                            session.updates_coalesced += 1
+                            INBOUND_DROPPED.inc("coalesced")
+                        PENDING_UPDATES[player_id] = (x, y, map_name, dir_name, moving)
+                    elif not PLAYER_HANDLER.update(player_id, x, y, map_name, dir_name, moving):
                         print(f"[Server] Failed to update player {player_id}")
                     # Uncomment for debugging:
                     # print(f"[Server] Updated player {player_id}: map={map_name}, pos=({x}, {y}), dir={dir_name}, moving={moving}")
@@ -147,58 +484,290 @@ async def handle_client(websocket: Any):
                 elif msg_type == "chat_send":
                     # Send chat message - use server-assigned ID
                     text = str(data.get("text", ""))
-                    if text:
+                    channel = str(data.get("channel", "global"))
+                    if channel not in CHANNELS:
+                        session.push_reliable({
+                            "type": "error",
+                            "message": "invalid_channel"
+                        })
+                    elif text:
                         try:
-                            msg = CHAT.add(player_id, text)  # Use server-assigned ID
-                            # Broadcast to all clients
-                            chat_msg = {
-                                "type": "chat_update",
-                                "messages": [msg]
-                            }
-                            chat_json = json.dumps(chat_msg)
-                            async with CLIENTS_LOCK:
-                                disconnected = set()
-                                for client in CONNECTED_CLIENTS:
-                                    try:
-                                        await client.send(chat_json)
-                                    except Exception:
-                                        disconnected.add(client)
-                                CONNECTED_CLIENTS.difference_update(disconnected)
+                            msg = CHAT.add(player_id, text, channel, session.map_name)  # Use server-assigned ID
+                            # Sent to its audience with the next tick
+                            PENDING_CHAT.append(msg)
+                            if CHAT_BUS is not None and channel == "global":
+                                CHAT_BUS.publish({"from": player_id, "text": msg["text"]})
                         except ValueError:
-                            await websocket.send(json.dumps({
+                            session.push_reliable({
                                 "type": "error",
                                 "message": "empty_message"
-                            }))
+                            })
                             
-            except json.JSONDecodeError:
-                await websocket.send(json.dumps({
+            except DecodeError:
+                MESSAGES_IN.inc("invalid")
+                BYTES_IN.inc("invalid", amount=len(message))
+                session.push_reliable({
                     "type": "error",
-                    "message": "invalid_json"
-                }))
+                    "message": "invalid_message"
+                })
             except Exception as e:
-                await websocket.send(json.dumps({
+                session.push_reliable({
                     "type": "error",
                     "message": str(e)
-                }))
+                })
                 
-    except Exception:
+    except Exception as e:
         print(f"[Server] Client handler error: {e}")
     finally:
-        # Unregister player on disconnect
-        if player_id >= 0:
-            PLAYER_HANDLER.unregister(player_id)
-        async with CLIENTS_LOCK:
-            CONNECTED_CLIENTS.discard(websocket)
+        # Unregister player on disconnect, unless a resume already took the player over
+        if player_id >= 0 and SESSIONS_BY_PLAYER.get(player_id) is session:
+            SESSIONS_BY_PLAYER.pop(player_id, None)
+            if ServerSettings.RESUME_GRACE > 0 and session is not None and not session.redirected:
+                # Keep the player in the world so a quick reconnect can resume it
+                PENDING_UPDATES.pop(player_id, None)
+                HELD_PLAYERS.touch(player_id, time.monotonic())
+            else:
+                forget_player(player_id)
+        CONNECTED_CLIENTS.pop(websocket, None)
+        if session:
+            CHAT_ROUTER.unsubscribe(session)
+            await session.stop()
+
+
+def capture_state() -> dict:
+    """Everything a restarted server needs to let clients resume (see server/checkpoint.py)."""
+    # Updates not applied yet are lost with a restart; the clients resend their position anyway
+    return {
+        "players": PLAYER_HANDLER.snapshot(),
+        "resume_tokens": dict(RESUME_TOKENS),
+        "players_seq": dict(PLAYERS_SEQ),
+        # A durable chat log restores itself
+        "chat": [] if ServerSettings.CHAT_LOG_DIR else CHAT.snapshot(),
+    }
+
+
+def restore_state(state: dict) -> None:
+    """Load a checkpoint written by a previous run of this server."""
+    started = time.perf_counter()
+    players = []
+    if ServerSettings.RESUME_GRACE > 0:
+        # Nobody is connected yet: restored players wait for their client to resume
+        players = PLAYER_HANDLER.restore(state["players"])
+        now = time.monotonic()
+        for player_id in players:
+            HELD_PLAYERS.touch(player_id, now)
+        for token, player_id in state.get("resume_tokens", {}).items():
+            if player_id in PLAYER_HANDLER:
+                RESUME_TOKENS[token] = player_id
+                PLAYER_TOKENS[player_id] = token
+    PLAYERS_SEQ.update(state.get("players_seq", {}))
+    if not ServerSettings.CHAT_LOG_DIR:
+        CHAT.restore(state.get("chat", []))
+    age = time.time() - state.get("saved_at", time.time())
+    print(f"[Server] Restored checkpoint from {age:.1f} s ago: {len(players)} players, "
+          f"{len(CHAT)} chat messages in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+async def report_stats(scheduler: TickScheduler, monitor: LoopMonitor | None):
+    """Log the measured tick rate, overruns and loop lag every STATS_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(ServerSettings.STATS_INTERVAL)
+        stats = scheduler.report()
+        loop_stats = f", loop lag max {monitor.report()['max_lag_ms']:.2f} ms" if monitor else ""
+        if stats["window_errors"]:
+            loop_stats += f", {stats['window_errors']} failed ticks"
+        print(f"[Server] tick {stats['measured_rate_hz']:.1f}/{stats['rate_hz']:g} Hz, "
+              f"overruns {stats['overruns']}, mean tick {stats['mean_tick_ms']:.2f} ms, "
+              f"max tick {stats['max_tick_ms']:.2f} ms, "
+              f"{len(PLAYER_HANDLER)} players, {len(CONNECTED_CLIENTS)} clients{loop_stats}")
+
+
+def register_gauges(scheduler: TickScheduler, checkpointer: Checkpointer | None) -> None:
+    """Gauges read from server state when /metrics is scraped (no per-tick cost)."""
+    REGISTRY.register(Gauge("i2p_connected_clients", "Open websocket connections.",
+                            callback=lambda: len(CONNECTED_CLIENTS)))
+    REGISTRY.register(Gauge("i2p_players", "Registered players per map (\"\" before the first update).",
+                            ("map",), callback=lambda: PLAYER_HANDLER.count_by_map()))
+    REGISTRY.register(Gauge("i2p_chat_messages", "Chat messages held in memory.",
+                            callback=lambda: len(CHAT)))
+    REGISTRY.register(Gauge("i2p_outbound_queue_depth", "Messages waiting in a client's outbound queue.",
+                            ("player",), callback=lambda: {
+                                str(s.player_id): s.queue_depth() for s in CONNECTED_CLIENTS.values()}))
+    REGISTRY.register(Gauge("i2p_snapshots_dropped", "Unsent snapshots replaced by a newer one, per client.",
+                            ("player",), callback=lambda: {
+                                str(s.player_id): s.snapshots_dropped for s in CONNECTED_CLIENTS.values()}))
+    REGISTRY.register(Gauge("i2p_client_inbound_dropped", "Messages a client sent that were dropped, per reason.",
+                            ("player", "reason"), callback=lambda: {
+                                (str(s.player_id), reason): count
+                                for s in CONNECTED_CLIENTS.values()
+                                for reason, count in (("rate_limited", s.rate_limited),
+                                                      ("coalesced", s.updates_coalesced)) if count}))
+    REGISTRY.register(Gauge("i2p_process_cpu_seconds", "CPU time used by the server process.",
+                            callback=time.process_time))
+    REGISTRY.register(Gauge("i2p_tick_overruns", "Ticks that ran past the next tick's deadline.",
+                            callback=lambda: scheduler.overruns))
+    REGISTRY.register(Gauge("i2p_tick_errors", "Ticks that raised an exception (the schedule goes on).",
+                            callback=lambda: scheduler.errors))
+    if checkpointer is not None:
+        REGISTRY.register(Gauge("i2p_checkpoint_bytes", "Size of the last checkpoint written.",
+                                callback=lambda: checkpointer.last_bytes))
+        REGISTRY.register(Gauge("i2p_checkpoint_seconds", "Time the last checkpoint took to serialize and write.",
+                                callback=lambda: checkpointer.last_seconds))
+
+
+def process_request(connection: Any, request: Any):
+    """Answer metrics scrapes on the websocket port; anything else goes on to the handshake."""
+    if ServerSettings.METRICS_PATH and request.path == ServerSettings.METRICS_PATH:
+        return connection.respond(http.HTTPStatus.OK, REGISTRY.render())
+    return None
 
 
 async def main():
-    print(f"[Server] Running WebSocket server on ws://0.0.0.0:{PORT}")
+    global CHAT, CHAT_ROUTER, PLAYER_HANDLER, SHARD_ROUTES, CHAT_BUS, HELD_PLAYERS, KNOWN_MAPS
+    KNOWN_MAPS = load_known_maps(ServerSettings.MAPS_DIR)
+    HELD_PLAYERS = TimingWheel(ServerSettings.RESUME_GRACE)
+    CHAT_ROUTER = ChatRouter(ServerSettings.CHAT_NEARBY_TILES * ServerSettings.TILE_SIZE)
+    if ServerSettings.SHARD_CONFIG:
+        SHARD_ROUTES = ShardRoutes.load(ServerSettings.SHARD_CONFIG)
+        PLAYER_HANDLER = PlayerHandler(first_id=ServerSettings.SHARD_INDEX * SHARD_ID_STRIDE)
+        maps = ", ".join(SHARD_ROUTES.maps[ServerSettings.SHARD_INDEX])
+        print(f"[Server] Shard {ServerSettings.SHARD_INDEX} of {len(SHARD_ROUTES.urls)}: {maps}")
+        if SHARD_ROUTES.bus_path:
+            CHAT_BUS = ChatBusClient(SHARD_ROUTES.bus_path, handle_bus_chat)
+            asyncio.create_task(CHAT_BUS.run())
+    chat_log = None
+    if ServerSettings.CHAT_LOG_DIR:
+        chat_log = ChatLog(ServerSettings.CHAT_LOG_DIR,
+                           segment_bytes=ServerSettings.CHAT_SEGMENT_BYTES,
+                           max_segments=ServerSettings.CHAT_MAX_SEGMENTS)
+    CHAT = ChatStore(ServerSettings.CHAT_CAPACITY, chat_log)
+    if chat_log:
+        print(f"[Server] Chat log {ServerSettings.CHAT_LOG_DIR}: restored {len(CHAT)} messages")
+    checkpointer = None
+    if ServerSettings.CHECKPOINT_PATH:
+        state = read_checkpoint(ServerSettings.CHECKPOINT_PATH)
+        if state is not None:
+            restore_state(state)
+        checkpointer = Checkpointer(ServerSettings.CHECKPOINT_PATH, ServerSettings.CHECKPOINT_INTERVAL,
+                                    capture_state)
+    print(f"[Server] Running WebSocket server on ws://{ServerSettings.HOST}:{ServerSettings.PORT}")
     # Start broadcast task
-    asyncio.create_task(broadcast_player_update())
+    scheduler = TickScheduler(ServerSettings.TICK_RATE, broadcast_tick, TICK_SECONDS.observe)
+    register_gauges(scheduler, checkpointer)
+    asyncio.create_task(scheduler.run())
+    monitor = None
+    if ServerSettings.LOOP_STALL_THRESHOLD > 0:
+        monitor = LoopMonitor(ServerSettings.LOOP_MONITOR_INTERVAL, ServerSettings.LOOP_STALL_THRESHOLD,
+                              LOOP_LAG_SECONDS.observe, LOOP_STALLS.inc)
+        asyncio.create_task(monitor.run())
+    asyncio.create_task(report_stats(scheduler, monitor))
+    checkpoint_task = asyncio.create_task(checkpointer.run()) if checkpointer else None
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
     # Start server
-    async with serve(handle_client, "0.0.0.0", PORT):
-        await asyncio.Future()  # run forever
+    async with serve(handle_client, ServerSettings.HOST, ServerSettings.PORT,
+                     select_subprotocol=lambda connection, offered: negotiate_subprotocol(offered),
+                     process_request=process_request,
+                     compression=None,
+                     extensions=server_extensions(ServerSettings.COMPRESSION,
+                                                  ServerSettings.COMPRESSION_WINDOW_BITS,
+                                                  ServerSettings.COMPRESSION_MEM_LEVEL,
+                                                  ServerSettings.COMPRESSION_CONTEXT_TAKEOVER)):
+        await stop.wait()
+    if monitor:
+        monitor.stop()
+    # Connections are closed; save the latest state for the next run to pick up
+    if checkpoint_task:
+        checkpoint_task.cancel()
+        try:
+            # A periodic save may be mid-write; let it finish before writing the final one
+            await checkpoint_task
+        except asyncio.CancelledError:
+            pass
+        size = await checkpointer.save()
+        print(f"[Server] Checkpoint written to {ServerSettings.CHECKPOINT_PATH} ({size} bytes)")
+    print("[Server] Stopped")
+
+
+def parse_args() -> None:
+    """Override ServerSettings from the command line for this deployment."""
+    parser = argparse.ArgumentParser(description="Monster Go websocket server")
+    parser.add_argument("--host", default=ServerSettings.HOST)
+    parser.add_argument("--port", type=int, default=ServerSettings.PORT)
+    parser.add_argument("--tick-rate", type=float, default=ServerSettings.TICK_RATE,
+                        help="broadcast ticks per second")
+    parser.add_argument("--heartbeat", type=float, default=ServerSettings.HEARTBEAT_INTERVAL,
+                        help="seconds between full keyframes when nothing changes")
+    parser.add_argument("--stats-interval", type=float, default=ServerSettings.STATS_INTERVAL,
+                        help="seconds between tick stats log lines")
+    parser.add_argument("--metrics-path", default=ServerSettings.METRICS_PATH,
+                        help="HTTP path serving Prometheus metrics (empty to disable)")
+    parser.add_argument("--loop-stall-threshold", type=float, default=ServerSettings.LOOP_STALL_THRESHOLD,
+                        help="seconds a callback may hold the event loop before it is reported (0 disables)")
+    parser.add_argument("--no-compression", action="store_true", help="disable permessage-deflate")
+    parser.add_argument("--compression-window-bits", type=int, default=ServerSettings.COMPRESSION_WINDOW_BITS,
+                        help="deflate window size, 9-15")
+    parser.add_argument("--compression-mem-level", type=int, default=ServerSettings.COMPRESSION_MEM_LEVEL,
+                        help="deflate memory level, 1-9")
+    parser.add_argument("--no-context-takeover", action="store_true",
+                        help="reset the deflate window after every message")
+    parser.add_argument("--inbound-rate", type=float, default=ServerSettings.INBOUND_RATE,
+                        help="messages per second a client may send (0 = unlimited)")
+    parser.add_argument("--inbound-burst", type=float, default=ServerSettings.INBOUND_BURST,
+                        help="messages a client may send back to back")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="apply every player_update instead of the newest one per tick")
+    parser.add_argument("--maps-dir", default=ServerSettings.MAPS_DIR,
+                        help="directory whose *.tmx names clients may report (empty accepts any name)")
+    parser.add_argument("--max-maps", type=int, default=ServerSettings.MAX_MAPS,
+                        help="distinct maps tracked at once when --maps-dir is empty")
+    parser.add_argument("--map-state-ttl", type=float, default=ServerSettings.MAP_STATE_TTL,
+                        help="seconds an empty map keeps its sequence number and delta history")
+    parser.add_argument("--resume-grace", type=float, default=ServerSettings.RESUME_GRACE,
+                        help="seconds a dropped player is kept for a resume (0 disables)")
+    parser.add_argument("--checkpoint-path", default=ServerSettings.CHECKPOINT_PATH,
+                        help="state file written periodically and restored on start (empty to disable)")
+    parser.add_argument("--checkpoint-interval", type=float, default=ServerSettings.CHECKPOINT_INTERVAL,
+                        help="seconds between checkpoints")
+    parser.add_argument("--chat-capacity", type=int, default=ServerSettings.CHAT_CAPACITY,
+                        help="chat messages kept in memory")
+    parser.add_argument("--chat-log-dir", default=ServerSettings.CHAT_LOG_DIR,
+                        help="directory of the durable chat log (empty to disable)")
+    parser.add_argument("--chat-nearby-tiles", type=float, default=ServerSettings.CHAT_NEARBY_TILES,
+                        help="reach of the nearby chat channel in tiles")
+    parser.add_argument("--shard-config", default=ServerSettings.SHARD_CONFIG,
+                        help="routes file written by server.shards (runs this process as a shard)")
+    parser.add_argument("--shard-index", type=int, default=ServerSettings.SHARD_INDEX)
+    args = parser.parse_args()
+    ServerSettings.HOST = args.host
+    ServerSettings.PORT = args.port
+    ServerSettings.TICK_RATE = args.tick_rate
+    ServerSettings.HEARTBEAT_INTERVAL = args.heartbeat
+    ServerSettings.STATS_INTERVAL = args.stats_interval
+    ServerSettings.METRICS_PATH = args.metrics_path
+    ServerSettings.LOOP_STALL_THRESHOLD = args.loop_stall_threshold
+    ServerSettings.COMPRESSION = not args.no_compression
+    ServerSettings.COMPRESSION_WINDOW_BITS = args.compression_window_bits
+    ServerSettings.COMPRESSION_MEM_LEVEL = args.compression_mem_level
+    ServerSettings.COMPRESSION_CONTEXT_TAKEOVER = not args.no_context_takeover
+    ServerSettings.INBOUND_RATE = args.inbound_rate
+    ServerSettings.INBOUND_BURST = args.inbound_burst
+    ServerSettings.COALESCE_UPDATES = not args.no_coalesce
+    ServerSettings.MAPS_DIR = args.maps_dir
+    ServerSettings.MAX_MAPS = args.max_maps
+    ServerSettings.MAP_STATE_TTL = args.map_state_ttl
+    ServerSettings.RESUME_GRACE = args.resume_grace
+    ServerSettings.CHECKPOINT_PATH = args.checkpoint_path
+    ServerSettings.CHECKPOINT_INTERVAL = args.checkpoint_interval
+    ServerSettings.CHAT_CAPACITY = args.chat_capacity
+    ServerSettings.CHAT_LOG_DIR = args.chat_log_dir
+    ServerSettings.CHAT_NEARBY_TILES = args.chat_nearby_tiles
+    ServerSettings.SHARD_CONFIG = args.shard_config
+    ServerSettings.SHARD_INDEX = args.shard_index
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parse_args()
+    asyncio.run(main())
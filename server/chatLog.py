@@ -0,0 +1,191 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Optional
+
+# Record: little-endian uint32 payload length, then the JSON payload
+_LENGTH = struct.Struct("<I")
+SEGMENT_PREFIX = "chat-"
+
+
+class _Segment:
+    """One log file plus its sidecar index of record offsets.
+
+    Ids inside a segment are consecutive starting at ``first_id``, so the
+    index is just an array of offsets and id -> offset is a direct lookup.
+    """
+    def __init__(self, directory: str, first_id: int) -> None:
+        self.first_id = first_id
+        base = os.path.join(directory, f"{SEGMENT_PREFIX}{first_id:012d}")
+        self.log_path = base + ".log"
+        self.idx_path = base + ".idx"
+        self.offsets = array("Q")
+        self.size = 0
+        self._map: Optional[mmap.mmap] = None
+        self._file = None
+
+    @property
+    def end_id(self) -> int:
+        """One past the last id stored in this segment."""
+        return self.first_id + len(self.offsets)
+
+    def load_index(self) -> None:
+        self.size = os.path.getsize(self.log_path)
+        if os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as f:
+                self.offsets.frombytes(f.read())
+
+    def recover(self) -> None:
+        """Rebuild the index of a segment that may have been cut off mid-write."""
+        self.size = os.path.getsize(self.log_path)
+        offsets = array("Q")
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, pos)
+            if pos + _LENGTH.size + length > len(data):
+                break
+            offsets.append(pos)
+            pos += _LENGTH.size + length
+        if pos != len(data):
+            # Drop a partially written trailing record
+            with open(self.log_path, "r+b") as f:
+                f.truncate(pos)
+            self.size = pos
+        if offsets != self.offsets:
+            with open(self.idx_path, "wb") as f:
+                f.write(offsets.tobytes())
+        self.offsets = offsets
+
+    # Writing (active segment only)
+    def append(self, payload: bytes) -> None:
+        if self._file is None:
+            self._file = open(self.log_path, "ab")
+            self._idx_file = open(self.idx_path, "ab")
+        offset = self.size
+        self._file.write(_LENGTH.pack(len(payload)))
+        self._file.write(payload)
+        self._file.flush()
+        self._idx_file.write(struct.pack("<Q", offset))
+        self._idx_file.flush()
+        self.offsets.append(offset)
+        self.size += _LENGTH.size + len(payload)
+
+    # Reading
+    def read(self, start_id: int, end_id: int) -> list[dict]:
+        if start_id >= end_id or self.size == 0:
+            return []
+        if self._map is None or len(self._map) < self.size:
+            # (Re)map to cover records appended since the last read
+            self.close_map()
+            with open(self.log_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self._map
+        out = []
+        for i in range(start_id - self.first_id, end_id - self.first_id):
+            offset = self.offsets[i]
+            (length,) = _LENGTH.unpack_from(view, offset)
+            start = offset + _LENGTH.size
+            out.append(json.loads(view[start:start + length]))
+        return out
+
+    def close_map(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self) -> None:
+        self.close_map()
+        if self._file is not None:
+            self._file.close()
+            self._idx_file.close()
+            self._file = None
+
+    def delete(self) -> None:
+        self.close()
+        for path in (self.log_path, self.idx_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class ChatLog:
+    """Durable append-only chat history split into size-bounded segments.
+
+    Each message is one length-prefixed JSON record; a sidecar ``.idx`` file
+    holds the record offsets so any id is found without scanning. History is
+    read by memory-mapping a segment and slicing records out of it, so old
+    messages are not kept around as Python objects. When the active segment
+    passes ``segment_bytes`` a new one is started, and compaction deletes the
+    oldest segments beyond ``max_segments`` to bound disk use.
+    """
+    def __init__(self, directory: str, *, segment_bytes: int = 4 * 1024 * 1024, max_segments: int = 16) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_segments)
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments: list[_Segment] = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(".log"):
+                first_id = int(name[len(SEGMENT_PREFIX):-len(".log")])
+                segment = _Segment(directory, first_id)
+                segment.load_index()
+                self._segments.append(segment)
+        if self._segments:
+            # Only the segment being written when we stopped can be torn
+            self._segments[-1].recover()
+        self._first_ids = [s.first_id for s in self._segments]
+
+    @property
+    def first_id(self) -> int:
+        return self._segments[0].first_id if self._segments else 1
+
+    @property
+    def next_id(self) -> int:
+        return self._segments[-1].end_id if self._segments else 1
+
+    def append(self, message: dict) -> None:
+        """Append a message; its id must be ``next_id``."""
+        if not self._segments or self._segments[-1].size >= self.segment_bytes:
+            self._rotate(int(message["id"]))
+        payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self._segments[-1].append(payload)
+
+    def read(self, start_id: int, end_id: int) -> list[dict]:
+        """Messages with ``start_id <= id < end_id`` that are still on disk."""
+        start_id = max(start_id, self.first_id)
+        end_id = min(end_id, self.next_id)
+        out: list[dict] = []
+        if start_id >= end_id:
+            return out
+        i = bisect.bisect_right(self._first_ids, start_id) - 1
+        while i < len(self._segments) and start_id < end_id:
+            segment = self._segments[i]
+            chunk_end = min(end_id, segment.end_id)
+            out.extend(segment.read(start_id, chunk_end))
+            start_id = chunk_end
+            i += 1
+        return out
+
+    def _rotate(self, first_id: int) -> None:
+        if self._segments:
+            self._segments[-1].close()
+        self._segments.append(_Segment(self.directory, first_id))
+        self._first_ids.append(first_id)
+        self.compact()
+
+    def compact(self) -> None:
+        """Drop the oldest segments beyond ``max_segments``."""
+        while len(self._segments) > self.max_segments:
+            self._segments.pop(0).delete()
+            self._first_ids.pop(0)
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Iterable
+
+from server.spatialGrid import SpatialGrid
+
+# "global" reaches everyone, "map" the players on the sender's map,
+# "nearby" the players within CHAT_NEARBY_TILES of the sender
+CHANNELS = ("global", "map", "nearby")
+
+
+class ChatRouter:
+    """Finds the recipients of map and proximity chat without scanning every client.
+
+    Sessions are indexed by the map they receive snapshots of, and player
+    positions are kept in a SpatialGrid fed with each tick's changes, so
+    resolving a message costs about as much as the audience it reaches.
+    Global chat needs no routing; it goes to every client anyway.
+    """
+    def __init__(self, nearby_radius: float) -> None:
+        self.nearby_radius = nearby_radius
+        self._by_map: Dict[str, set[Any]] = {}
+        self._map_of: Dict[Any, str] = {}
+        self.grid = SpatialGrid(nearby_radius)
+
+    # Subscriptions (sessions)
+    def subscribe(self, session: Any, map_name: str) -> None:
+        old = self._map_of.get(session)
+        if old == map_name:
+            return
+        if old is not None:
+            members = self._by_map[old]
+            members.discard(session)
+            if not members:
+                del self._by_map[old]
+        self._map_of[session] = map_name
+        self._by_map.setdefault(map_name, set()).add(session)
+
+    def unsubscribe(self, session: Any) -> None:
+        old = self._map_of.pop(session, None)
+        if old is not None:
+            members = self._by_map[old]
+            members.discard(session)
+            if not members:
+                del self._by_map[old]
+
+    def on_map(self, map_name: str) -> Iterable[Any]:
+        return self._by_map.get(map_name, ())
+
+    # Positions (players)
+    def apply_changes(self, changes: Dict[str, tuple[dict, list[int]]]) -> None:
+        """Track positions from PlayerHandler.collect_changes()."""
+        for map_name, (changed, removed) in changes.items():
+            for pid in removed:
+                # A player who switched maps is removed from the old one and changed on the new one
+                self.grid.remove(pid, map_name)
+            for pid, row in changed.items():
+                self.grid.move(pid, map_name, row["x"], row["y"])
+
+    def nearby(self, pid: int) -> list[int]:
+        """Players within the radius of ``pid`` (including ``pid``), or [] if its position is unknown."""
+        position = self.grid.position(pid)
+        if position is None:
+            return []
+        return self.grid.near(*position, self.nearby_radius)
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Optional
+
+from server.chatLog import ChatLog
+
+# How many messages a fresh client gets, and the cap for a catch-up request
+RECENT_LIMIT = 100
+SINCE_LIMIT = 200
+
+
+class ChatStore:
+    """Fixed-capacity ring buffer of chat messages.
+
+    Message ids are consecutive, so id ``i`` always lives in slot
+    ``i % capacity``: appends are O(1) with no bulk copy, and
+    ``list_since`` slices the ring directly in O(k) for k returned messages.
+    Once full, each new message overwrites the oldest one.
+
+    With a ``ChatLog`` every message is also appended to disk, the ring is
+    refilled from the log's tail on startup, and ids older than the ring are
+    read back from the log instead of being lost.
+    """
+    def __init__(self, capacity: int = 1000, log: Optional[ChatLog] = None) -> None:
+        self._lock = threading.Lock()
+        self._capacity = max(1, int(capacity))
+        self._slots: list[Optional[dict]] = [None] * self._capacity
+        self._next_id = 1
+        # Lowest id still available; above 1 after restore() or a compacted log
+        self._first_id = 1
+        self._log = log
+        if log is not None:
+            # Rebuild the in-memory tail from the log in one pass. Compaction may
+            # have left fewer messages on disk than the ring holds; ids below the
+            # log's first one are gone and must not show up as empty slots.
+            self._next_id = log.next_id
+            self._first_id = max(self._first_id, log.first_id)
+            for msg in log.read(self._oldest_id(), self._next_id):
+                self._slots[int(msg["id"]) % self._capacity] = msg
+
+    def add(self, sender_id: int, text: str, channel: str = "global", map_name: str = "") -> dict:
+        # Sanitize
+        t = (text or "").strip()
+        if len(t) > 200:
+            t = t[:200]
+        if not t:
+            raise ValueError("empty")
+        with self._lock:
+            msg = {
+                "id": self._next_id,
+                "from": sender_id,
+                "text": t,
+                "ts": time.time(),
+                "channel": channel,
+            }
+            if channel != "global":
+                msg["map"] = map_name
+            if self._log is not None:
+                self._log.append(msg)
+            self._slots[self._next_id % self._capacity] = msg
+            self._next_id += 1
+            return msg
+
+    def list_since(self, since_id: int) -> list[dict]:
+        with self._lock:
+            end = self._next_id
+            if since_id <= 0:
+                start = end - RECENT_LIMIT  # cap response size
+            else:
+                start = max(since_id + 1, end - SINCE_LIMIT)
+            oldest = self._oldest_id()
+            out: list[dict] = []
+            if start < oldest and self._log is not None:
+                # Older than the ring: serve from the on-disk log
+                out = self._log.read(start, oldest)
+            start = max(start, oldest)
+            out.extend(self._slots[i % self._capacity] for i in range(start, end))
+            return out
+
+    def snapshot(self) -> list[dict]:
+        """Messages held in memory, oldest first (for a checkpoint)."""
+        with self._lock:
+            return [self._slots[i % self._capacity] for i in range(self._oldest_id(), self._next_id)]
+
+    def restore(self, messages: list[dict]) -> None:
+        """Refill an empty store from snapshot(); ids continue after the last message."""
+        with self._lock:
+            if self._next_id != 1 or not messages:
+                return
+            messages = messages[-self._capacity:]
+            for msg in messages:
+                self._slots[int(msg["id"]) % self._capacity] = msg
+            self._first_id = int(messages[0]["id"])
+            self._next_id = int(messages[-1]["id"]) + 1
+
+    def _oldest_id(self) -> int:
+        # Caller must hold the lock
+        return max(self._first_id, self._next_id - self._capacity)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._next_id - self._oldest_id()
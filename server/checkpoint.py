@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+from server.codec import dumps, loads
+
+# Bumped whenever the layout of the captured state changes; older files are ignored
+FORMAT_VERSION = 1
+# zlib level: the state is mostly repeated keys and map names, level 1 already gets most of it
+COMPRESS_LEVEL = 1
+
+
+def write_checkpoint(path: str, state: dict) -> int:
+    """Write ``state`` as zlib-compressed JSON; returns the file size.
+
+    The file is written next to ``path`` and renamed over it, so a crash or
+    a kill mid-write leaves the previous checkpoint in place.
+    """
+    payload = zlib.compress(dumps({"version": FORMAT_VERSION, "saved_at": time.time(), **state}),
+                            COMPRESS_LEVEL)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(payload)
+
+
+def read_checkpoint(path: str) -> Optional[dict]:
+    """The state saved by write_checkpoint(), or None if there is no usable file."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        state = loads(zlib.decompress(data))
+    except (zlib.error, ValueError) as e:
+        print(f"[Server] Ignoring unreadable checkpoint {path}: {e}")
+        return None
+    if not isinstance(state, dict) or state.get("version") != FORMAT_VERSION:
+        print(f"[Server] Ignoring checkpoint {path} in an old format")
+        return None
+    return state
+
+
+class Checkpointer:
+    """Saves the server state every ``interval`` seconds without stalling the loop.
+
+    ``capture`` runs on the event loop, between ticks, so the state it
+    copies is consistent; it should only copy (columns to lists, dicts to
+    dicts). Serializing, compressing and writing the copy happen in a
+    worker thread.
+    """
+    def __init__(self, path: str, interval: float, capture: Callable[[], dict[str, Any]]) -> None:
+        self.path = path
+        self.interval = interval
+        self.capture = capture
+        # Size and duration of the last write, for the metrics endpoint
+        self.last_bytes = 0
+        self.last_seconds = 0.0
+        self.saves = 0
+        # A periodic save and the one at shutdown must not share the temporary file;
+        # save() holds it until the worker thread is done, even when cancelled
+        self._lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except OSError as e:
+                print(f"[Server] Checkpoint to {self.path} failed: {e}")
+
+    async def save(self) -> int:
+        async with self._lock:
+            state = self.capture()
+            started = time.perf_counter()
+            write = asyncio.ensure_future(asyncio.to_thread(write_checkpoint, self.path, state))
+            try:
+                self.last_bytes = await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # The thread cannot be interrupted; release the lock only once it stops using the file
+                await asyncio.wait([write])
+                raise
+            self.last_seconds = time.perf_counter() - started
+            self.saves += 1
+            return self.last_bytes
@@ -0,0 +1,146 @@
+import asyncio
+import time
+import traceback
+from collections import deque
+from typing import Any, Optional
+
+from websockets.exceptions import ConnectionClosed
+
+from server.codec import EncodedMessage
+from server.metrics import BYTES_OUT, MESSAGES_OUT
+from server.tokenBucket import TokenBucket
+
+# Reliable messages (chat, replies) a client may have waiting before it is dropped
+MAX_RELIABLE_BACKLOG = 256
+# A client whose outbound queue has not drained for this long is disconnected
+BACKLOG_TIMEOUT = 5.0
+
+
+class ClientSession:
+    """A connected websocket, the player/map it is subscribed to and its outbound queue.
+
+    The broadcaster and message handlers only enqueue; a per-connection writer
+    task does the actual ``send`` so one slow client never stalls the others.
+    Position snapshots are latest-wins: a newer one replaces an unsent one,
+    and since the replaced frame may have been a delta the client is resynced
+    with a keyframe on the next tick. Reliable messages are queued in order.
+    """
+    def __init__(self, websocket: Any, player_id: int, codec: Any,
+                 inbound: Optional[TokenBucket] = None) -> None:
+        self.websocket = websocket
+        self.player_id = player_id
+        # Wire codec negotiated through the websocket subprotocol
+        self.codec = codec
+        # Rate limit on messages from the client (None = unlimited)
+        self.inbound = inbound
+        # Inbound messages dropped by the rate limit / player updates superseded before a tick
+        self.rate_limited = 0
+        self.updates_coalesced = 0
+        # Map whose snapshots this client receives; "" until the first update
+        self.map_name = ""
+        # Send a full snapshot of map_name on the next tick (join / map switch / dropped frame)
+        self.needs_keyframe = True
+        self.snapshots_dropped = 0
+        self.closed = False
+        # Sent a redirect to the shard that owns the player's new map
+        self.redirected = False
+
+        self._snapshot: Optional[EncodedMessage] = None
+        self._reliable: deque[EncodedMessage] = deque()
+        self._wakeup = asyncio.Event()
+        # When the outbound queue last went from empty to non-empty
+        self._pending_since: Optional[float] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    # Writer
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._run_writer(), name=f"writer-{self.player_id}")
+
+    async def stop(self) -> None:
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_writer(self) -> None:
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._reliable or self._snapshot is not None:
+                    if self._reliable:
+                        message = self._reliable.popleft()
+                    else:
+                        message, self._snapshot = self._snapshot, None
+                    data = message.encode(self.codec)
+                    await self.websocket.send(data, text=self.codec.text_frames)
+                    kind = message.message.get("type", "")
+                    MESSAGES_OUT.inc(kind)
+                    BYTES_OUT.inc(kind, amount=len(data))
+                self._pending_since = None
+        except asyncio.CancelledError:
+            raise
+        except ConnectionClosed:
+            # Connection is gone; handle_client notices and cleans up
+            self.closed = True
+        except Exception as e:
+            # Encoding or sending failed on an open connection. Close it, or the reader loop
+            # keeps the client connected without ever sending it another frame.
+            self.closed = True
+            print(f"[Server] Writer for player {self.player_id} failed: {e!r}")
+            traceback.print_exc()
+            await self.websocket.close(1011, "internal error")
+
+    # Enqueue (never awaits network I/O)
+    def push_snapshot(self, message: EncodedMessage) -> None:
+        if self.closed:
+            return
+        if self._snapshot is not None:
+            self.snapshots_dropped += 1
+            self.needs_keyframe = True
+        self._snapshot = message
+        self._mark_pending()
+
+    def push_reliable(self, message: EncodedMessage | dict, replaces_snapshot: bool = False) -> None:
+        """Queue a message that is sent in order and never dropped.
+
+        ``replaces_snapshot`` is for a players frame that carries other
+        payload (chat) and so must be reliable: it takes the place of an
+        unsent snapshot, which would otherwise go out after it.
+        """
+        if self.closed:
+            return
+        if len(self._reliable) >= MAX_RELIABLE_BACKLOG:
+            self.disconnect("outbound backlog full")
+            return
+        if isinstance(message, dict):
+            message = EncodedMessage(message)
+        if replaces_snapshot and self._snapshot is not None:
+            self._snapshot = None
+            self.snapshots_dropped += 1
+            self.needs_keyframe = True
+        self._reliable.append(message)
+        self._mark_pending()
+
+    def _mark_pending(self) -> None:
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        self._wakeup.set()
+
+    # Backpressure
+    def queue_depth(self) -> int:
+        return len(self._reliable) + (1 if self._snapshot is not None else 0)
+
+    def is_backlogged(self, now: float) -> bool:
+        return self._pending_since is not None and now - self._pending_since > BACKLOG_TIMEOUT
+
+    def disconnect(self, reason: str) -> None:
+        """Close the connection without waiting for it (handle_client cleans up)."""
+        if self.closed:
+            return
+        self.closed = True
+        print(f"[Server] Disconnecting player {self.player_id}: {reason}")
+        asyncio.create_task(self.websocket.close(1013, reason))
@@ -0,0 +1,333 @@
+import json
+import struct
+import time
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+# ------------------------------
+# Wire codecs shared by server.py and OnlineManager
+# ------------------------------
+# The codec is chosen per connection through the websocket subprotocol
+# offered by the client during the handshake. Clients that offer nothing
+# (or servers that do not answer) fall back to plain JSON text frames.
+SUBPROTOCOL_BINARY = "i2p.bin.v1"
+SUBPROTOCOL_JSON = "i2p.json.v1"
+
+# Same row order as the player Animation ("down", "left", "right", "up")
+DIRECTIONS = ("down", "left", "right", "up")
+DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+
+# Positions are sent as unsigned 16-bit fixed point in 1/POSITION_SCALE pixels
+POSITION_SCALE = 4
+POSITION_MAX = 0xFFFF
+
+# Player record flags: low 2 bits are the direction code
+FLAG_DIR_MASK = 0x03
+FLAG_MOVING = 0x04
+
+# ------------------------------
+# JSON backend
+# ------------------------------
+# orjson when installed (several times faster on both ends), else the stdlib.
+# Either way dumps() returns compact UTF-8 bytes and loads() takes str or bytes.
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        # Player tables are keyed by int id
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    JSON_BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    loads = json.loads
+
+# Frame tags (first byte of every binary frame)
+TAG_JSON = 0             # message without a binary layout, JSON payload follows
+TAG_PLAYERS_UPDATE = 1   # keyframe: full player list of one map
+TAG_PLAYERS_DELTA = 2    # changed/removed players of one map
+TAG_PLAYER_UPDATE = 3    # client -> server own position
+
+# Map ids are unsigned 16-bit
+MAP_ID_LIMIT = 0x10000
+
+# tag, seq, timestamp, frame map id, map defs count
+_FRAME_HEADER = struct.Struct("<BIdHH")
+# map id, name length
+_MAP_DEF = struct.Struct("<HB")
+_COUNT = struct.Struct("<H")
+_PLAYER_ID = struct.Struct("<I")
+# id, x, y, flags, map id
+_PLAYER_RECORD = struct.Struct("<IHHBH")
+# tag, x, y, flags, map name length
+_PLAYER_UPDATE = struct.Struct("<BHHBB")
+
+
+class DecodeError(ValueError):
+    """Raised when an incoming frame cannot be decoded."""
+
+
+class MapTableFull(ValueError):
+    """Raised by MapInterner when every map id is taken."""
+
+
+class MapInterner:
+    """Assigns small integer ids to map names on the encoding side.
+
+    Ids are 16-bit on the wire, so at most ``capacity`` names are interned at
+    once. ``forget`` frees the id of a map that is no longer used; handing it
+    to another map is safe because every players frame defines its map ids.
+    """
+    def __init__(self, capacity: int = MAP_ID_LIMIT) -> None:
+        self.capacity = capacity
+        self._ids: dict[str, int] = {}
+        self._names: list[Optional[str]] = []
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def intern(self, name: str) -> int:
+        map_id = self._ids.get(name)
+        if map_id is None:
+            if self._free:
+                map_id = self._free.pop()
+                self._names[map_id] = name
+            elif len(self._names) < self.capacity:
+                map_id = len(self._names)
+                self._names.append(name)
+            else:
+                raise MapTableFull(f"all {self.capacity} map ids are in use")
+            self._ids[name] = map_id
+        return map_id
+
+    def name(self, map_id: int) -> str:
+        return self._names[map_id]
+
+    def names(self) -> list[str]:
+        return list(self._ids)
+
+    def forget(self, name: str) -> None:
+        map_id = self._ids.pop(name, None)
+        if map_id is not None:
+            self._names[map_id] = None
+            self._free.append(map_id)
+
+
+def _quantize(value: float) -> int:
+    q = int(round(float(value) * POSITION_SCALE))
+    return 0 if q < 0 else POSITION_MAX if q > POSITION_MAX else q
+
+
+def _flags(direction: str, moving: bool) -> int:
+    return DIRECTION_CODES.get(direction, 0) | (FLAG_MOVING if moving else 0)
+
+
+class JsonCodec:
+    """Text JSON frames, the original protocol.
+
+    ``encode`` returns UTF-8 bytes; send them with ``text=codec.text_frames``
+    so they still go out as text frames without a decode/encode round trip.
+    """
+    subprotocol = SUBPROTOCOL_JSON
+    text_frames = True
+
+    def encode(self, message: dict) -> bytes:
+        return dumps(message)
+
+    def decode(self, data: Any) -> dict:
+        try:
+            return loads(data)
+        except ValueError as e:
+            # JSONDecodeError and UnicodeDecodeError are both ValueErrors
+            raise DecodeError(str(e)) from e
+
+
+class BinaryCodec:
+    """Struct-packed frames for the per-tick player messages.
+
+    Player records are fixed width: id, quantized x/y, a flags byte holding
+    the direction code and the moving bit, and an interned map id. Every
+    players frame carries the id -> name definitions for the maps it
+    references (usually just its own map, a few bytes), so a delta decodes
+    on a connection that has not seen a keyframe yet, e.g. a resumed one.
+    A players frame that carries chat (``"chat"`` field) has the chat list
+    appended as JSON after the records. Other message types are sent as a JSON payload behind ``TAG_JSON``.
+
+    Decoding keeps the map table of one connection, so use one instance per
+    connection on the receiving side.
+    """
+    subprotocol = SUBPROTOCOL_BINARY
+    text_frames = False
+
+    def __init__(self, interner: Optional[MapInterner] = None) -> None:
+        self._interner = interner if interner is not None else MapInterner()
+        self._map_names: dict[int, str] = {}
+
+    # Encoding
+    def encode(self, message: dict) -> bytes:
+        msg_type = message.get("type")
+        try:
+            if msg_type == "players_update":
+                return self._encode_players(TAG_PLAYERS_UPDATE, message, message.get("players", {}), ())
+            if msg_type == "players_delta":
+                return self._encode_players(TAG_PLAYERS_DELTA, message, message.get("changed", {}),
+                                            message.get("removed", ()))
+        except MapTableFull:
+            # No map id left for this frame: it still goes out, as JSON (decodes to the same message)
+            return bytes((TAG_JSON,)) + dumps(message)
+        if msg_type == "player_update":
+            map_bytes = str(message.get("map", "")).encode("utf-8")[:255]
+            return _PLAYER_UPDATE.pack(
+                TAG_PLAYER_UPDATE,
+                _quantize(message.get("x", 0)),
+                _quantize(message.get("y", 0)),
+                _flags(message.get("direction", "down"), bool(message.get("is_moving", False))),
+                len(map_bytes),
+            ) + map_bytes
+        return bytes((TAG_JSON,)) + dumps(message)
+
+    def _encode_players(self, tag: int, message: dict, players: dict, removed) -> bytes:
+        intern = self._interner.intern
+        frame_map_id = intern(str(message.get("map", "")))
+        records = [
+            _PLAYER_RECORD.pack(int(p["id"]), _quantize(p["x"]), _quantize(p["y"]),
+                                _flags(p["dir"], p["moving"]), intern(p["map"]))
+            for p in players.values()
+        ]
+        map_ids = {frame_map_id}
+        map_ids.update(intern(p["map"]) for p in players.values())
+        defs = []
+        for map_id in map_ids:
+            name_bytes = self._interner.name(map_id).encode("utf-8")[:255]
+            defs.append(_MAP_DEF.pack(map_id, len(name_bytes)) + name_bytes)
+        parts = [_FRAME_HEADER.pack(tag, int(message.get("seq", 0)), float(message.get("timestamp", 0.0)),
+                                    frame_map_id, len(defs))]
+        parts.extend(defs)
+        parts.append(_COUNT.pack(len(removed)))
+        parts.extend(_PLAYER_ID.pack(int(pid)) for pid in removed)
+        parts.append(_COUNT.pack(len(records)))
+        parts.extend(records)
+        if message.get("chat"):
+            parts.append(dumps(message["chat"]))
+        return b"".join(parts)
+
+    # Decoding
+    def decode(self, data: Any) -> dict:
+        if isinstance(data, str):
+            # Text frames are always JSON
+            return JsonCodec().decode(data)
+        try:
+            tag = data[0]
+            if tag == TAG_PLAYERS_UPDATE or tag == TAG_PLAYERS_DELTA:
+                return self._decode_players(tag, data)
+            if tag == TAG_PLAYER_UPDATE:
+                _, x, y, flags, map_len = _PLAYER_UPDATE.unpack_from(data, 0)
+                start = _PLAYER_UPDATE.size
+                return {
+                    "type": "player_update",
+                    "x": x / POSITION_SCALE,
+                    "y": y / POSITION_SCALE,
+                    "map": bytes(data[start:start + map_len]).decode("utf-8"),
+                    "direction": DIRECTIONS[flags & FLAG_DIR_MASK],
+                    "is_moving": bool(flags & FLAG_MOVING),
+                }
+            if tag == TAG_JSON:
+                return loads(bytes(data[1:]))
+        except (IndexError, struct.error, ValueError) as e:
+            raise DecodeError(str(e)) from e
+        raise DecodeError(f"unknown frame tag {tag}")
+
+    def _decode_players(self, tag: int, data: bytes) -> dict:
+        _, seq, timestamp, frame_map_id, n_defs = _FRAME_HEADER.unpack_from(data, 0)
+        offset = _FRAME_HEADER.size
+        for _ in range(n_defs):
+            map_id, name_len = _MAP_DEF.unpack_from(data, offset)
+            offset += _MAP_DEF.size
+            self._map_names[map_id] = bytes(data[offset:offset + name_len]).decode("utf-8")
+            offset += name_len
+        (n_removed,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        removed = [pid for (pid,) in _PLAYER_ID.iter_unpack(data[offset:offset + n_removed * _PLAYER_ID.size])]
+        offset += n_removed * _PLAYER_ID.size
+        (n_players,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        end = offset + n_players * _PLAYER_RECORD.size
+        if end > len(data):
+            raise DecodeError("truncated players frame")
+        map_names = self._map_names
+        players = {}
+        for pid, x, y, flags, map_id in _PLAYER_RECORD.iter_unpack(data[offset:end]):
+            players[pid] = {
+                "id": pid,
+                "x": x / POSITION_SCALE,
+                "y": y / POSITION_SCALE,
+                "map": map_names.get(map_id, ""),
+                "dir": DIRECTIONS[flags & FLAG_DIR_MASK],
+                "moving": bool(flags & FLAG_MOVING),
+            }
+        message = {
+            "map": map_names.get(frame_map_id, ""),
+            "seq": seq,
+            "timestamp": timestamp,
+        }
+        if tag == TAG_PLAYERS_UPDATE:
+            message["type"] = "players_update"
+            message["players"] = players
+        else:
+            message["type"] = "players_delta"
+            message["changed"] = players
+            message["removed"] = removed
+        if end < len(data):
+            message["chat"] = loads(bytes(data[end:]))
+        return message
+
+
+def negotiate_subprotocol(offered) -> Optional[str]:
+    """Server side: pick the best codec among the subprotocols a client offered."""
+    for subprotocol in (SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON):
+        if subprotocol in offered:
+            return subprotocol
+    return None
+
+
+class EncodedMessage:
+    """A message encoded at most once per codec and shared by every recipient.
+
+    This is the pre-serialized form of a broadcast: a snapshot going to a
+    hundred clients is serialized once per codec in use, and the same bytes
+    object is handed to every connection.
+    """
+    # Called with the seconds each encode took; the server points it at its metrics, clients leave it unset
+    observe_encode: Optional[Callable[[float], None]] = None
+
+    def __init__(self, message: dict) -> None:
+        self.message = message
+        self._encoded: dict[str, bytes] = {}
+
+    def encode(self, codec: JsonCodec | BinaryCodec) -> bytes:
+        data = self._encoded.get(codec.subprotocol)
+        if data is None:
+            observe = EncodedMessage.observe_encode
+            if observe is None:
+                data = self._encoded[codec.subprotocol] = codec.encode(self.message)
+            else:
+                start = time.perf_counter()
+                data = self._encoded[codec.subprotocol] = codec.encode(self.message)
+                observe(time.perf_counter() - start)
+        return data
+
+
+def select_codec(subprotocol: Optional[str], interner: Optional[MapInterner] = None) -> JsonCodec | BinaryCodec:
+    """Codec for the subprotocol negotiated on a connection (JSON when none)."""
+    if subprotocol == SUBPROTOCOL_BINARY:
+        return BinaryCodec(interner)
+    return JsonCodec()
@@ -0,0 +1,49 @@
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    ServerPerMessageDeflateFactory,
+)
+
+# ------------------------------
+# permessage-deflate settings shared by server.py and OnlineManager
+# ------------------------------
+# window_bits (9-15): LZ77 window, larger finds more repetition between
+#   snapshots but costs 2**window_bits bytes per connection and direction.
+# mem_level (1-9): zlib compressor state, trades memory/CPU for ratio.
+# context_takeover: keep the window across messages. Consecutive snapshots
+#   are nearly identical, so this is where most of the saving comes from;
+#   turning it off frees the per-connection state between messages.
+
+
+def _check(window_bits: int, mem_level: int) -> None:
+    if not 9 <= window_bits <= 15:
+        raise ValueError(f"compression window bits must be 9-15, got {window_bits}")
+    if not 1 <= mem_level <= 9:
+        raise ValueError(f"compression memory level must be 1-9, got {mem_level}")
+
+
+def server_extensions(enabled: bool, window_bits: int, mem_level: int, context_takeover: bool) -> list:
+    """Extensions argument for ``serve`` (pass ``compression=None`` alongside)."""
+    if not enabled:
+        return []
+    _check(window_bits, mem_level)
+    return [ServerPerMessageDeflateFactory(
+        server_no_context_takeover=not context_takeover,
+        client_no_context_takeover=not context_takeover,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"memLevel": mem_level},
+    )]
+
+
+def client_extensions(enabled: bool, window_bits: int, mem_level: int, context_takeover: bool) -> list:
+    """Extensions argument for ``connect`` (pass ``compression=None`` alongside)."""
+    if not enabled:
+        return []
+    _check(window_bits, mem_level)
+    return [ClientPerMessageDeflateFactory(
+        server_no_context_takeover=not context_takeover,
+        client_no_context_takeover=not context_takeover,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"memLevel": mem_level},
+    )]
@@ -0,0 +1,45 @@
+from dataclasses import dataclass
+
+@dataclass
+class Settings:
+    # Network
+    HOST: str = "0.0.0.0"
+    PORT: int = 8989
+    # Broadcast loop
+    TICK_RATE: float = 20.0             # Broadcast ticks per second (clients interpolate between them)
+    HEARTBEAT_INTERVAL: float = 2.0     # Full keyframe at least this often, even when nothing changed
+    STATS_INTERVAL: float = 5.0         # Seconds between tick stats log lines
+    METRICS_PATH: str = "/metrics"      # Prometheus scrape path on the websocket port ("" disables)
+    LOOP_MONITOR_INTERVAL: float = 0.05 # Seconds between event loop lag samples
+    LOOP_STALL_THRESHOLD: float = 0.1   # Report a step holding the loop this long (0 disables the monitor)
+    # permessage-deflate (see server/compression.py)
+    COMPRESSION: bool = True
+    COMPRESSION_WINDOW_BITS: int = 12   # 9-15; larger compresses better, 2**bits bytes per connection
+    COMPRESSION_MEM_LEVEL: int = 5      # 1-9
+    COMPRESSION_CONTEXT_TAKEOVER: bool = True   # Keep the window between messages (best ratio for snapshots)
+    # Inbound limits (per connection)
+    INBOUND_RATE: float = 90.0          # Messages per second a client may send on average (0 = unlimited)
+    INBOUND_BURST: float = 30.0         # Messages a client may send back to back
+    COALESCE_UPDATES: bool = True       # Apply only the newest player_update per client each tick
+    # Maps clients may be on
+    MAPS_DIR: str = "assets/maps"       # Only the *.tmx names in here are accepted ("" accepts any name)
+    MAX_MAP_NAME_BYTES: int = 64        # Longest map name accepted when MAPS_DIR is empty (UTF-8 bytes)
+    MAX_MAPS: int = 64                  # Distinct maps tracked at once when MAPS_DIR is empty
+    MAP_STATE_TTL: float = 60.0         # Seconds an empty map keeps its seq and delta history
+    # Session resume
+    RESUME_GRACE: float = 10.0          # Seconds a disconnected player is kept for a resume (0 disables)
+    # Chat
+    CHAT_CAPACITY: int = 10000          # Messages kept in the in-memory ring buffer
+    CHAT_LOG_DIR: str = "server_data/chat"  # Append-only chat log ("" keeps chat in memory only)
+    CHAT_SEGMENT_BYTES: int = 4 * 1024 * 1024   # Start a new log segment past this size
+    CHAT_MAX_SEGMENTS: int = 16         # Oldest segments beyond this are deleted
+    CHAT_NEARBY_TILES: float = 8.0      # Reach of the "nearby" chat channel
+    TILE_SIZE: int = 64                 # Pixels per tile (GameSettings.TILE_SIZE); positions are in pixels
+    # Checkpoint for hot restarts (see server/checkpoint.py)
+    CHECKPOINT_PATH: str = "server_data/checkpoint.bin"    # "" disables checkpoints and restore
+    CHECKPOINT_INTERVAL: float = 10.0   # Seconds between checkpoints; one more is written on shutdown
+    # Sharding (see server/shards.py); unsharded when SHARD_CONFIG is empty
+    SHARD_CONFIG: str = ""              # Routes file written by the launcher
+    SHARD_INDEX: int = 0                # Which shard of the routes file this process is
+
+ServerSettings = Settings()
@@ -0,0 +1,39 @@
+from collections import deque
+from typing import Dict, Optional
+
+
+class DeltaHistory:
+    """When each player of one map last changed or left, by players seq.
+
+    A resuming client that last saw seq ``S`` of the map catches up with a
+    single delta (every player changed after ``S`` plus every player who
+    left after ``S``) instead of a keyframe. Only the newest
+    ``max_removals`` departures are remembered; a client older than that
+    gets a keyframe.
+    """
+    def __init__(self, max_removals: int = 1024) -> None:
+        self.max_removals = max_removals
+        # Seq of the newest frame of this map
+        self.seq = 0
+        self._changed_at: Dict[int, int] = {}
+        self._removed: deque[tuple[int, int]] = deque()
+        # Clients older than this seq cannot be answered with a delta
+        self._floor = 0
+
+    def record(self, seq: int, changed_ids=(), removed_ids=()) -> None:
+        self.seq = seq
+        for pid in changed_ids:
+            self._changed_at[pid] = seq
+        for pid in removed_ids:
+            self._changed_at.pop(pid, None)
+            self._removed.append((seq, pid))
+        while len(self._removed) > self.max_removals:
+            self._floor, _ = self._removed.popleft()
+
+    def since(self, seq: int) -> Optional[tuple[set[int], list[int]]]:
+        """(ids changed, ids removed) after ``seq``, or None if a keyframe is needed."""
+        if seq < self._floor or seq > self.seq:
+            return None
+        changed = {pid for pid, at in self._changed_at.items() if at > seq}
+        removed = [pid for at, pid in self._removed if at > seq and pid not in changed]
+        return changed, removed
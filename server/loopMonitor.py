@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+# Innermost frames of the loop thread's stack shown for a stall
+STACK_DEPTH = 4
+
+
+class LoopMonitor:
+    """Event loop health: scheduling lag and a watchdog for steps that block it.
+
+    A sampler task sleeps ``interval`` seconds at a time; how late it wakes
+    up is the loop's scheduling lag (``observe`` gets every sample). A
+    watchdog thread checks that the sampler keeps waking up. If it has not
+    for ``stall_threshold`` seconds, some callback or coroutine step is
+    holding the loop, and the watchdog reports the task running on the loop
+    thread and the innermost frames of its stack. It reports while the stall
+    is still going on, so a tick that hangs forever is reported too.
+
+    Costs one wakeup per ``interval`` on the loop and two per threshold in
+    the watchdog thread, so it can stay on in production.
+    """
+    def __init__(self, interval: float = 0.05, stall_threshold: float = 0.1,
+                 observe: Optional[Callable[[float], None]] = None,
+                 on_stall: Optional[Callable[[str], None]] = None) -> None:
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        # Receive every lag sample in seconds / the name of the task behind each stall
+        self._observe = observe
+        self._on_stall = on_stall
+
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        # Monotonic time the sampler last woke up; written by the loop, read by the watchdog
+        self._beat = 0.0
+        self._reported_beat = 0.0
+        # Stall reported by the watchdog whose total length the sampler logs when it ends
+        self._open_stall = ""
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._beat = now
+                lag = max(0.0, now - expected)
+                if self._observe is not None:
+                    self._observe(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+                if self._open_stall:
+                    print(f"[LoopMonitor] Loop was blocked {lag * 1000:.0f} ms in {self._open_stall}")
+                    self._open_stall = ""
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def report(self) -> dict:
+        """Largest lag since the previous report; starts a new window."""
+        stats = {"max_lag_ms": self.max_lag * 1000, "stalls": self.stalls}
+        self.max_lag = 0.0
+        return stats
+
+    # Watchdog thread
+    def _watch(self) -> None:
+        while not self._stop.wait(self.stall_threshold / 2):
+            beat = self._beat
+            # The sampler is due at beat + interval; anything past that is the loop being held
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.stall_threshold and beat != self._reported_beat:
+                self._reported_beat = beat
+                self._report_stall(blocked)
+
+    def _report_stall(self, blocked: float) -> None:
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            # A plain callback (call_soon, transport protocol method), not a coroutine step
+            where = "callback"
+        else:
+            where = getattr(task.get_coro(), "__qualname__", task.get_name())
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:] if frame is not None else []
+        self.stalls += 1
+        self._open_stall = where
+        if self._on_stall is not None:
+            self._on_stall(where)
+        print(f"[LoopMonitor] Loop blocked for {blocked * 1000:.0f} ms so far in {where}, at: "
+              + " <- ".join(f"{entry.name} ({entry.filename.rsplit('/', 1)[-1]}:{entry.lineno})"
+                            for entry in reversed(stack)))
@@ -0,0 +1,172 @@
+"""Process-wide server metrics rendered in the Prometheus text format.
+
+Recording is a dict update (counters) or a bisect plus two additions
+(histograms), so it can stay on in production. A few series are recorded
+from other threads (the loop watchdog), so rendering copies the values
+before walking them instead of iterating dicts that may be growing. Values that are cheap to
+read from server state (clients, players per map, queue depths) are not
+tracked at all; they are gauges whose callback runs only when ``/metrics``
+is scraped.
+"""
+import bisect
+from typing import Callable, Iterable, Optional
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) for every series."""
+        return ()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count, optionally split by label values."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        values = self._values
+        values[label_values] = values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        # dict() copies in one step under the GIL; a concurrent inc() cannot break the iteration
+        for label_values, value in sorted(dict(self._values).items()):
+            yield "", _format_labels(self.label_names, label_values), value
+
+
+class Gauge(Metric):
+    """Current value; either set explicitly or read by ``callback`` at scrape time.
+
+    The callback returns a number for an unlabelled gauge, or a dict of
+    label values (a tuple, or a plain string for one label) to numbers.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 callback: Optional[Callable[[], float | dict]] = None) -> None:
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        values = dict(self._values)
+        if self.callback is not None:
+            current = self.callback()
+            if not isinstance(current, dict):
+                current = {(): current}
+            values = {key if isinstance(key, tuple) else (key,): value for key, value in current.items()}
+        for label_values, value in sorted(values.items()):
+            yield "", _format_labels(self.label_names, label_values), value
+
+
+class Histogram(Metric):
+    """Distribution over fixed upper bounds (seconds for the timing histograms)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float]) -> None:
+        super().__init__(name, help_text)
+        self.bounds = sorted(buckets)
+        # Per-bucket (not cumulative) counts; the last one is +Inf
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.bounds, value)] += 1
+        self._sum += value
+
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        total = 0
+        for bound, count in zip(self.bounds + [float("inf")], list(self._counts)):
+            total += count
+            yield "_bucket", _format_labels((), (), f'le="{_format_value(float(bound))}"'), total
+        yield "_sum", "", self._sum
+        yield "_count", "", total
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback must not take the whole endpoint down
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Ticks take well under a millisecond when idle and must stay under 1 / TICK_RATE
+TICK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.016, 0.025, 0.05, 0.1, 0.25)
+# Loop lag is well under a millisecond on a healthy loop; anything near a tick period is a stall
+LOOP_LAG_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.016, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SERIALIZE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+TICK_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "i2p_tick_duration_seconds", "Time spent in one broadcast tick.", TICK_BUCKETS))
+SERIALIZE_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "i2p_serialize_duration_seconds", "Time to encode one outbound message for one codec.", SERIALIZE_BUCKETS))
+MESSAGES_OUT: Counter = REGISTRY.register(Counter(
+    "i2p_messages_sent_total", "Websocket messages sent to clients.", ("type",)))
+BYTES_OUT: Counter = REGISTRY.register(Counter(
+    "i2p_bytes_sent_total", "Payload bytes sent to clients.", ("type",)))
+MESSAGES_IN: Counter = REGISTRY.register(Counter(
+    "i2p_messages_received_total", "Websocket messages received from clients.", ("type",)))
+BYTES_IN: Counter = REGISTRY.register(Counter(
+    "i2p_bytes_received_total", "Payload bytes received from clients.", ("type",)))
+LOOP_LAG_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "i2p_loop_lag_seconds", "How late the event loop ran a sleeping task (scheduling lag).", LOOP_LAG_BUCKETS))
+LOOP_STALLS: Counter = REGISTRY.register(Counter(
+    "i2p_loop_stalls_total", "Times one callback or coroutine step held the event loop past the threshold.",
+    ("task",)))
+INBOUND_DROPPED: Counter = REGISTRY.register(Counter(
+    "i2p_inbound_dropped_total", "Client messages dropped by the rate limit, superseded before a tick or naming an unknown map.",
+    ("reason",)))
@@ -1,121 +1,346 @@
-import threading
 import time
-import copy
-from dataclasses import dataclass
-from typing import Dict, Optional
+from array import array
+from typing import Container, Dict, Optional
+
+import numpy as np
+
+from server.codec import DIRECTIONS, DIRECTION_CODES
 
 TIMEOUT_TIME = 60.0
 CHECK_INTERVAL_TIME = 10.0
-
-@dataclass
-class Player:
-    id: int
-    x: float
-    y: float
-    map: str
-    dir: str
-    moving: bool
-    last_update: float
-
-    def update(self, x: float, y: float, map: str, dir: str, moving: bool) -> None:
-        # Update last_update only when meaningful fields change
-        if (x != self.x or y != self.y or map != self.map or
-                dir != self.dir or moving != self.moving):
-            self.last_update = time.monotonic()
-        self.x = x
-        self.y = y
-        self.map = map
-        self.dir = dir
-        self.moving = moving
-
-    def is_inactive(self) -> bool:
-        now = time.monotonic()
-        return (now - self.last_update) >= TIMEOUT_TIME
+INITIAL_CAPACITY = 64
 
 
 class PlayerHandler:
-    _lock: threading.Lock
-    _stop_event: threading.Event
-    _thread: threading.Thread | None
-    
-    players: Dict[int, Player]
-    _next_id: int
-
-    def __init__(self, *, timeout_seconds: float = 120.0, check_interval_seconds: float = 5.0):
-        self._lock = threading.Lock()
-        self._stop_event = threading.Event()
-        self._thread = None
-        
-        self.players = {}
-        self._next_id = 0
-        
-    # Threading
-    def start(self) -> None:
-        if self._thread and self._thread.is_alive():
-            return
-        self._stop_event.clear()
-        self._thread = threading.Thread(target=self._cleaner, name="PlayerCleaner", daemon=True)
-        self._thread.start()
+    """Columnar player table owned by the server's event loop (no locks, no threads).
+
+    Player state lives in NumPy arrays indexed by slot (x, y, direction code,
+    moving flag, map code, last_update) instead of one Python object per
+    player. Slots of players that left go on a free-list and are reused, and
+    the arrays double when full.
+
+    ``update`` only stages the new state (latest wins per player); staged
+    updates are applied in one batch before anything reads the table, where
+    comparing against the columns gives the dirty set without a Python loop.
+    Snapshots, per-map change collection and the inactivity sweep are array
+    operations as well, so their cost per player stays flat as the server
+    fills up.
+    """
+    _slot_of: Dict[int, int]
+    _free: list[int]
+    # Map names are interned; the map column holds the code. Codes of pruned maps are reused
+    _map_names: list[Optional[str]]
+    _map_codes: Dict[str, int]
+    _free_map_codes: list[int]
+    # Per-map players that left (or moved away) since the last collect_changes()
+    _removed: Dict[str, set[int]]
+
+    def __init__(self, *, timeout_seconds: float = TIMEOUT_TIME, check_interval_seconds: float = CHECK_INTERVAL_TIME,
+                 first_id: int = 0, capacity: int = INITIAL_CAPACITY):
+        self.timeout = timeout_seconds
+        self.check_interval = check_interval_seconds
+        self._next_check = 0.0
+        self._next_id = first_id
+        self._slot_of = {}
+        self._free = []
+        # Slots handed out so far; columns are only looked at up to here
+        self._size = 0
+        self._map_names = []
+        self._map_codes = {}
+        self._free_map_codes = []
+        self._removed = {}
+        # Updates staged since the last flush, one typed array per column
+        self._staged_slot = array("q")
+        self._staged_x = array("d")
+        self._staged_y = array("d")
+        self._staged_map = array("i")
+        self._staged_dir = array("B")
+        self._staged_moving = array("B")
+        # Any dirty slot since the last collect_changes()
+        self._any_dirty = False
+        self._capacity = 0
+        self._grow(max(1, capacity))
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self._slot_of
 
-    def stop(self) -> None:
-        self._stop_event.set()
-        if self._thread:
-            self._thread.join(timeout=2.0)
+    # Storage
+    def _grow(self, capacity: int) -> None:
+        def resize(old: Optional[np.ndarray], dtype) -> np.ndarray:
+            new = np.zeros(capacity, dtype=dtype)
+            if old is not None:
+                new[:self._capacity] = old
+            return new
 
-    def _cleaner(self) -> None:
-        while not self._stop_event.wait(CHECK_INTERVAL_TIME):
+        first = self._capacity == 0
+        self._ids = resize(None if first else self._ids, np.int64)
+        self._x = resize(None if first else self._x, np.float64)
+        self._y = resize(None if first else self._y, np.float64)
+        self._dir = resize(None if first else self._dir, np.uint8)
+        self._moving = resize(None if first else self._moving, np.bool_)
+        self._map = resize(None if first else self._map, np.int32)
+        self._last_update = resize(None if first else self._last_update, np.float64)
+        self._active = resize(None if first else self._active, np.bool_)
+        # Joined or changed since the last collect_changes()
+        self._dirty = resize(None if first else self._dirty, np.bool_)
+        self._capacity = capacity
+
+    def _alloc_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size == self._capacity:
+            self._grow(self._capacity * 2)
+        self._size += 1
+        return self._size - 1
+
+    def _map_code(self, map_name: str) -> int:
+        code = self._map_codes.get(map_name)
+        if code is None:
+            if self._free_map_codes:
+                code = self._free_map_codes.pop()
+                self._map_names[code] = map_name
+            else:
+                code = len(self._map_names)
+                self._map_names.append(map_name)
+            self._map_codes[map_name] = code
+        return code
+
+    def _rows(self, slots: np.ndarray) -> dict:
+        """Player dicts of ``slots`` keyed by id (the wire format of snapshots)."""
+        names = self._map_names
+        return {
+            pid: {"id": pid, "x": x, "y": y, "map": names[m], "dir": DIRECTIONS[d], "moving": moving}
+            for pid, x, y, m, d, moving in zip(
+                self._ids[slots].tolist(), self._x[slots].tolist(), self._y[slots].tolist(),
+                self._map[slots].tolist(), self._dir[slots].tolist(), self._moving[slots].tolist())
+        }
+
+    def expire(self, now: Optional[float] = None, keep: Container[int] = ()) -> list[int]:
+        """Remove players inactive for the timeout; they show up as "left" in the next changes.
+
+        The sweep is one vectorized comparison over last_update, run at most
+        every ``check_interval`` seconds. Players in ``keep`` (e.g. those with
+        an open connection, who may simply be standing still) are never
+        removed; their timeout starts over instead.
+        """
+        if now is None:
             now = time.monotonic()
-            to_remove: list[int] = []
-            with self._lock:
-                for pid, p in list(self.players.items()):
-                    if now - p.last_update >= TIMEOUT_TIME:
-                        to_remove.append(pid)
-                for pid in to_remove:
-                    _ = self.players.pop(pid, None)
-                    
+        if now < self._next_check:
+            return []
+        self._next_check = now + self.check_interval
+        self._flush()
+        n = self._size
+        slots = np.flatnonzero(self._active[:n] & (self._last_update[:n] <= now - self.timeout))
+        expired = self._ids[slots].tolist()
+        if keep:
+            alive = np.fromiter((pid in keep for pid in expired), dtype=bool, count=len(expired))
+            self._last_update[slots[alive]] = now
+            expired = [pid for pid, kept in zip(expired, alive) if not kept]
+        for pid in expired:
+            self.unregister(pid)
+        return expired
+
+    def _insert(self, pid: int, x: float, y: float, map_name: str, dir_code: int, moving: bool) -> None:
+        slot = self._alloc_slot()
+        self._slot_of[pid] = slot
+        self._ids[slot] = pid
+        self._x[slot] = x
+        self._y[slot] = y
+        self._dir[slot] = dir_code
+        self._moving[slot] = moving
+        self._map[slot] = self._map_code(map_name)
+        self._last_update[slot] = time.monotonic()
+        self._active[slot] = True
+        self._dirty[slot] = True
+        self._any_dirty = True
+        self._removed.get(map_name, set()).discard(pid)
+
     # API
     def register(self) -> int:
-        with self._lock:
-            pid = self._next_id
-            self._next_id += 1
-            self.players[pid] = Player(
-                pid,
-                0.0,
-                0.0,
-                "",
-                "down",
-                False,
-                time.monotonic(),
-            )
-            return pid
+        pid = self._next_id
+        self._next_id += 1
+        self._insert(pid, 0.0, 0.0, "", DIRECTION_CODES["down"], False)
+        return pid
 
     def update(self, pid: int, x: float, y: float, map_name: str, dir_name: str, moving: bool) -> bool:
-        with self._lock:
-            p = self.players.get(pid)
-            if not p:
-                return False
-            else:
-                p.update(float(x), float(y), str(map_name), str(dir_name), bool(moving))
-                return True
-
-    def list_players(self) -> dict:
-        with self._lock:
-            player_list = {}
-            for p in self.players.values():
-                player_list[p.id] = {
-                    "id": p.id,
-                    "x": p.x,
-                    "y": p.y,
-                    "map": p.map,
-                    "dir": p.dir,
-                    "moving": p.moving,
-                }
-            return player_list
+        slot = self._slot_of.get(pid)
+        if slot is None:
+            return False
+        self._staged_slot.append(slot)
+        self._staged_x.append(float(x))
+        self._staged_y.append(float(y))
+        self._staged_map.append(self._map_code(str(map_name)))
+        self._staged_dir.append(DIRECTION_CODES.get(str(dir_name), DIRECTION_CODES["down"]))
+        self._staged_moving.append(bool(moving))
+        return True
+
+    def _flush(self) -> None:
+        """Apply the staged updates; only rows that really changed become dirty."""
+        if not self._staged_slot:
+            return
+        slots = np.frombuffer(self._staged_slot, dtype=np.int64)
+        # Latest update wins when a player sent several since the last flush
+        _, last = np.unique(slots[::-1], return_index=True)
+        pick = len(slots) - 1 - last
+        slots = slots[pick]
+        x = np.frombuffer(self._staged_x, dtype=np.float64)[pick]
+        y = np.frombuffer(self._staged_y, dtype=np.float64)[pick]
+        code = np.frombuffer(self._staged_map, dtype=np.int32)[pick]
+        direction = np.frombuffer(self._staged_dir, dtype=np.uint8)[pick]
+        moving = np.frombuffer(self._staged_moving, dtype=np.bool_)[pick]
+        for staged in (self._staged_slot, self._staged_x, self._staged_y, self._staged_map,
+                       self._staged_dir, self._staged_moving):
+            del staged[:]
+        old_code = self._map[slots]
+        changed = ((x != self._x[slots]) | (y != self._y[slots]) | (code != old_code) |
+                   (direction != self._dir[slots]) | (moving != self._moving[slots]))
+        if not changed.any():
+            return
+        slots = slots[changed]
+        code = code[changed]
+        old_code = old_code[changed]
+        self._x[slots] = x[changed]
+        self._y[slots] = y[changed]
+        self._map[slots] = code
+        self._dir[slots] = direction[changed]
+        self._moving[slots] = moving[changed]
+        # last_update only moves on a meaningful change
+        self._last_update[slots] = time.monotonic()
+        self._dirty[slots] = True
+        self._any_dirty = True
+        switched = np.flatnonzero(code != old_code)
+        for pid, old, new in zip(self._ids[slots[switched]].tolist(), old_code[switched].tolist(),
+                                 code[switched].tolist()):
+            self._leave_map(pid, self._map_names[old])
+            removed = self._removed.get(self._map_names[new])
+            if removed:
+                removed.discard(pid)
+
+    def get_map(self, pid: int) -> Optional[str]:
+        """Map the player is currently on, or None if the player is gone."""
+        slot = self._slot_of.get(pid)
+        if slot is None:
+            return None
+        self._flush()
+        return self._map_names[self._map[slot]]
+
+    def list_players(self, map_name: Optional[str] = None) -> dict:
+        """Snapshot of all players, or only those on ``map_name``."""
+        self._flush()
+        n = self._size
+        mask = self._active[:n]
+        if map_name is not None:
+            code = self._map_codes.get(map_name)
+            if code is None:
+                return {}
+            mask = mask & (self._map[:n] == code)
+        return self._rows(np.flatnonzero(mask))
+
+    def count_by_map(self) -> Dict[str, int]:
+        """Number of players on each map that has any."""
+        self._flush()
+        n = self._size
+        counts = np.bincount(self._map[:n][self._active[:n]], minlength=len(self._map_names))
+        return {self._map_names[code]: count for code, count in enumerate(counts.tolist()) if count}
+
+    def has_map(self, map_name: str) -> bool:
+        return map_name in self._map_codes
+
+    def map_count(self) -> int:
+        """Number of map names currently interned (including maps nobody is on yet or anymore)."""
+        return len(self._map_codes)
+
+    def prune_maps(self, keep: Container[str] = ()) -> list[str]:
+        """Forget the names of maps without players (except those in ``keep``); returns them.
+
+        A map with departures not collected yet is kept, its name is still
+        needed for the "removed" list. The freed codes are handed to new maps.
+        """
+        self._flush()
+        n = self._size
+        occupied = np.bincount(self._map[:n][self._active[:n]], minlength=len(self._map_names))
+        pruned = [name for name, code in self._map_codes.items()
+                  if not occupied[code] and name not in keep and name not in self._removed]
+        for name in pruned:
+            code = self._map_codes.pop(name)
+            self._map_names[code] = None
+            self._free_map_codes.append(code)
+        return pruned
+
+    def has_changes(self) -> bool:
+        """Cheap check whether collect_changes() would return anything."""
+        return self._any_dirty or bool(self._removed) or bool(self._staged_slot)
+
+    def collect_changes(self) -> Dict[str, tuple[dict, list[int]]]:
+        """Return {map: (changed players, removed ids)} since the previous call and reset tracking."""
+        self._flush()
+        changes: Dict[str, tuple[dict, list[int]]] = {}
+        if self._any_dirty:
+            slots = np.flatnonzero(self._dirty[:self._size])
+            self._dirty[slots] = False
+            for pid, row in self._rows(slots).items():
+                changed = changes.get(row["map"])
+                if changed is None:
+                    changed = changes[row["map"]] = ({}, [])
+                changed[0][pid] = row
+        for map_name, removed in self._removed.items():
+            if removed:
+                changes.setdefault(map_name, ({}, []))[1].extend(removed)
+        self._any_dirty = False
+        self._removed.clear()
+        return changes
+
+    # Change tracking
+    def _leave_map(self, pid: int, map_name: str) -> None:
+        self._removed.setdefault(map_name, set()).add(pid)
+
+    # Checkpoint
+    def snapshot(self) -> dict:
+        """Plain-data copy of every player, column by column, for a checkpoint."""
+        self._flush()
+        slots = np.flatnonzero(self._active[:self._size])
+        names = self._map_names
+        return {
+            "next_id": self._next_id,
+            "ids": self._ids[slots].tolist(),
+            "x": self._x[slots].tolist(),
+            "y": self._y[slots].tolist(),
+            "map": [names[code] for code in self._map[slots].tolist()],
+            "dir": [DIRECTIONS[code] for code in self._dir[slots].tolist()],
+            "moving": self._moving[slots].tolist(),
+        }
+
+    def restore(self, state: dict) -> list[int]:
+        """Re-insert the players of a snapshot() (after a restart); returns their ids.
+
+        Ids keep counting from where the snapshot left off, so a restored id
+        is never handed to a new player. Restored players count as active
+        from now on.
+        """
+        restored = []
+        for pid, x, y, map_name, dir_name, moving in zip(state["ids"], state["x"], state["y"], state["map"],
+                                                          state["dir"], state["moving"]):
+            pid = int(pid)
+            if pid in self._slot_of:
+                continue
+            self._insert(pid, float(x), float(y), str(map_name),
+                         DIRECTION_CODES.get(dir_name, DIRECTION_CODES["down"]), bool(moving))
+            restored.append(pid)
+        self._next_id = max(self._next_id, int(state["next_id"]))
+        return restored
 
     def unregister(self, pid: int) -> bool:
         """Remove a player by ID."""
-        with self._lock:
-            if pid in self.players:
-                del self.players[pid]
-                return True
+        if pid not in self._slot_of:
             return False
+        # Staged rows refer to the slot, which may be handed to someone else
+        self._flush()
+        slot = self._slot_of.pop(pid)
+        self._active[slot] = False
+        self._dirty[slot] = False
+        self._leave_map(pid, self._map_names[self._map[slot]])
+        self._free.append(slot)
+        return True
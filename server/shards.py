@@ -0,0 +1,215 @@
+"""Multi-process server sharded by map.
+
+Each shard is a normal ``server.py`` process that owns a group of maps. A
+thin front door on the public port only tells new clients which shard to
+connect to; when a player walks onto a map owned by another shard, that
+shard sends a ``redirect`` and the client reconnects there. Global chat is
+relayed between shards over a local Unix-socket bus hosted by the launcher.
+
+Usage:
+    python -m server.shards --maps-per-shard 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from websockets.asyncio.server import serve
+
+# Player ids of shard i start at i * SHARD_ID_STRIDE so they never collide
+SHARD_ID_STRIDE = 1_000_000
+# Started for every shard, whatever the launcher's working directory
+SERVER_SCRIPT = Path(__file__).resolve().parent.parent / "server.py"
+# Seconds shards get to write their checkpoint and exit before they are killed
+SHUTDOWN_TIMEOUT = 5.0
+
+
+@dataclass
+class ShardRoutes:
+    """Which shard owns which map, shared by the launcher and every shard."""
+    urls: list[str]
+    maps: list[list[str]]
+    bus_path: str = ""
+    default_shard: int = 0
+    _owner: dict[str, int] = field(default_factory=dict, repr=False)
+
+    def __post_init__(self) -> None:
+        self._owner = {name: i for i, group in enumerate(self.maps) for name in group}
+
+    def shard_for(self, map_name: str) -> int:
+        if not map_name:
+            return self.default_shard
+        owner = self._owner.get(map_name)
+        if owner is None:
+            # Maps nobody listed are spread by a stable hash
+            owner = zlib.crc32(map_name.encode("utf-8")) % len(self.urls)
+        return owner
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"urls": self.urls, "maps": self.maps, "bus_path": self.bus_path,
+                       "default_shard": self.default_shard}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ShardRoutes":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["urls"], data["maps"], data.get("bus_path", ""), data.get("default_shard", 0))
+
+
+# ------------------------------
+# Chat bus (newline-delimited JSON over a Unix socket)
+# ------------------------------
+class ChatBusHub:
+    """Relays every line a shard publishes to all the other shards."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while line := await reader.readline():
+                for other in list(self._writers):
+                    if other is not writer:
+                        other.write(line)
+        except (ConnectionError, asyncio.CancelledError):
+            # Shard went away or the launcher is shutting down
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+class ChatBusClient:
+    """A shard's connection to the hub; reconnects if the hub goes away."""
+    def __init__(self, path: str, on_message: Callable[[dict], None]) -> None:
+        self.path = path
+        self._on_message = on_message
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    def publish(self, message: dict) -> None:
+        if self._writer is not None:
+            self._writer.write(json.dumps(message).encode("utf-8") + b"\n")
+
+    async def run(self) -> None:
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                while line := await reader.readline():
+                    try:
+                        self._on_message(json.loads(line))
+                    except (ValueError, KeyError) as e:
+                        print(f"[Shard] Bad bus message: {e}")
+            except OSError as e:
+                print(f"[Shard] Chat bus unavailable ({e}), retrying")
+            self._writer = None
+            await asyncio.sleep(1.0)
+
+
+# ------------------------------
+# Front door and launcher
+# ------------------------------
+async def run_front_door(routes: ShardRoutes, host: str, port: int, stop: asyncio.Event) -> None:
+    """Tell each new client which shard to talk to, then hang up."""
+    async def handle(websocket: Any) -> None:
+        await websocket.send(json.dumps({"type": "redirect", "url": routes.urls[routes.default_shard]}))
+        await websocket.close()
+
+    async with serve(handle, host, port):
+        print(f"[FrontDoor] Listening on ws://{host}:{port}, {len(routes.urls)} shards")
+        await stop.wait()
+
+
+def group_maps(maps_dir: str, maps_per_shard: int) -> list[list[str]]:
+    names = sorted(name for name in os.listdir(maps_dir) if name.endswith(".tmx"))
+    # The spawn map goes first so shard 0 (the default shard) owns it
+    if "map.tmx" in names:
+        names.remove("map.tmx")
+        names.insert(0, "map.tmx")
+    return [names[i:i + maps_per_shard] for i in range(0, len(names), maps_per_shard)]
+
+
+async def launch(args: argparse.Namespace) -> None:
+    groups = group_maps(args.maps_dir, args.maps_per_shard)
+    bus_path = args.bus or os.path.join(tempfile.gettempdir(), f"i2p-chat-bus-{args.port}.sock")
+    routes = ShardRoutes(
+        urls=[f"ws://{args.public_host}:{args.base_port + i}" for i in range(len(groups))],
+        maps=groups,
+        bus_path=bus_path,
+    )
+    routes_path = os.path.join(tempfile.gettempdir(), f"i2p-shards-{args.port}.json")
+    routes.save(routes_path)
+
+    hub = ChatBusHub(bus_path)
+    await hub.start()
+
+    workers = []
+    for i, group in enumerate(groups):
+        cmd = [sys.executable, str(SERVER_SCRIPT),
+               "--host", args.host, "--port", str(args.base_port + i),
+               "--shard-config", routes_path, "--shard-index", str(i),
+               "--chat-log-dir", os.path.join("server_data", f"shard{i}", "chat"),
+               "--checkpoint-path", os.path.join("server_data", f"shard{i}", "checkpoint.bin")] + args.server_args
+        print(f"[Launcher] Shard {i} on port {args.base_port + i}: {', '.join(group)}")
+        workers.append(subprocess.Popen(cmd))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await run_front_door(routes, args.host, args.port, stop)
+    finally:
+        print("[Launcher] Stopping shards")
+        hub.close()
+        for worker in workers:
+            worker.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers:
+            try:
+                worker.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[Launcher] Shard process {worker.pid} did not stop in time, killing it")
+                worker.kill()
+                worker.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8989, help="public front door port")
+    parser.add_argument("--public-host", default="localhost", help="host name clients use to reach the shards")
+    parser.add_argument("--base-port", type=int, default=9001, help="shard i listens on base-port + i")
+    parser.add_argument("--maps-dir", default=os.path.join("assets", "maps"))
+    parser.add_argument("--maps-per-shard", type=int, default=1)
+    parser.add_argument("--bus", default="", help="Unix socket path of the chat bus")
+    parser.add_argument("server_args", nargs=argparse.REMAINDER, help="extra arguments passed to every shard")
+    args = parser.parse_args()
+    if args.server_args[:1] == ["--"]:
+        args.server_args = args.server_args[1:]
+    asyncio.run(launch(args))
+
+
+if __name__ == "__main__":
+    main()
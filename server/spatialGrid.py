@@ -0,0 +1,68 @@
+from typing import Dict, Optional
+
+Cell = tuple[str, int, int]
+
+
+class SpatialGrid:
+    """Player positions bucketed into square cells per map.
+
+    With cells as large as the query radius, everyone within the radius of
+    a point is in the 3x3 block of cells around it, so a query only looks
+    at the players near the point instead of everyone on the server.
+    Moving a player is O(1) and only touches the grid when it changes cell.
+    """
+    def __init__(self, cell_size: float) -> None:
+        self.cell_size = float(cell_size)
+        self._cells: Dict[Cell, set[int]] = {}
+        # Player id -> (map, x, y) and the cell it is filed under
+        self._positions: Dict[int, tuple[str, float, float]] = {}
+        self._cell_of: Dict[int, Cell] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _cell(self, map_name: str, x: float, y: float) -> Cell:
+        return map_name, int(x // self.cell_size), int(y // self.cell_size)
+
+    def move(self, pid: int, map_name: str, x: float, y: float) -> None:
+        self._positions[pid] = (map_name, x, y)
+        cell = self._cell(map_name, x, y)
+        old = self._cell_of.get(pid)
+        if old == cell:
+            return
+        if old is not None:
+            self._discard(pid, old)
+        self._cell_of[pid] = cell
+        self._cells.setdefault(cell, set()).add(pid)
+
+    def remove(self, pid: int, map_name: Optional[str] = None) -> None:
+        """Forget ``pid``; with ``map_name`` only if the player is still filed on that map."""
+        cell = self._cell_of.get(pid)
+        if cell is None or (map_name is not None and cell[0] != map_name):
+            return
+        del self._cell_of[pid]
+        del self._positions[pid]
+        self._discard(pid, cell)
+
+    def _discard(self, pid: int, cell: Cell) -> None:
+        members = self._cells[cell]
+        members.discard(pid)
+        if not members:
+            del self._cells[cell]
+
+    def position(self, pid: int) -> Optional[tuple[str, float, float]]:
+        return self._positions.get(pid)
+
+    def near(self, map_name: str, x: float, y: float, radius: float) -> list[int]:
+        """Ids of the players on ``map_name`` within ``radius`` of (x, y)."""
+        _, cx, cy = self._cell(map_name, x, y)
+        reach = max(1, int(-(-radius // self.cell_size)))
+        radius_sq = radius * radius
+        found = []
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                for pid in self._cells.get((map_name, gx, gy), ()):
+                    _, px, py = self._positions[pid]
+                    if (px - x) ** 2 + (py - y) ** 2 <= radius_sq:
+                        found.append(pid)
+        return found
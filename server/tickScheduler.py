@@ -0,0 +1,94 @@
+import asyncio
+import time
+import traceback
+from typing import Callable, Optional
+
+
+class TickScheduler:
+    """Runs a callback at a fixed rate against a monotonic deadline.
+
+    Sleeping a fixed period after each tick makes the real rate drift below
+    the target by however long the work takes; here every deadline is
+    ``start + n * period``. A tick that runs past its successor's deadline
+    counts as an overrun, and the missed slots are skipped instead of being
+    replayed in a burst. A tick that raises is counted and logged (the first
+    traceback of each report window) and the schedule goes on, so one bad
+    tick does not stop the loop for good.
+    """
+    def __init__(self, rate_hz: float, tick: Callable[[], None],
+                 observe: Optional[Callable[[float], None]] = None) -> None:
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self._tick = tick
+        # Receives every tick duration in seconds (e.g. a metrics histogram)
+        self._observe = observe
+
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        # Measured rate over the last report window
+        self.measured_rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_ticks = 0
+        self._window_busy = 0.0
+        self._window_errors = 0
+
+    async def run(self) -> None:
+        next_deadline = time.monotonic() + self.period
+        while True:
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start = time.monotonic()
+            try:
+                self._tick()
+            except Exception as e:
+                self.errors += 1
+                self._window_errors += 1
+                if self._window_errors == 1:
+                    print(f"[Server] Tick failed: {e!r}")
+                    traceback.print_exc()
+            end = time.monotonic()
+
+            self.ticks += 1
+            self._window_ticks += 1
+            self.last_duration = end - start
+            self._window_busy += self.last_duration
+            if self._observe is not None:
+                self._observe(self.last_duration)
+            if self.last_duration > self.max_duration:
+                self.max_duration = self.last_duration
+            next_deadline += self.period
+            if end > next_deadline:
+                missed = int((end - next_deadline) / self.period) + 1
+                self.overruns += 1
+                self.skipped += missed
+                next_deadline += missed * self.period
+
+    def report(self) -> dict:
+        """Update the measured rate, return the stats and start a new window."""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed > 0:
+            self.measured_rate = self._window_ticks / elapsed
+        stats = {
+            "rate_hz": self.rate_hz,
+            "measured_rate_hz": self.measured_rate,
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "window_errors": self._window_errors,
+            "last_tick_ms": self.last_duration * 1000,
+            "mean_tick_ms": self._window_busy / self._window_ticks * 1000 if self._window_ticks else 0.0,
+            "max_tick_ms": self.max_duration * 1000,
+        }
+        self._window_start = now
+        self._window_ticks = 0
+        self._window_busy = 0.0
+        self._window_errors = 0
+        self.max_duration = 0.0
+        return stats
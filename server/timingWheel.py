@@ -0,0 +1,73 @@
+from typing import Dict, Hashable, List
+
+
+class TimingWheel:
+    """Hashed timing wheel for inactivity deadlines.
+
+    Keys are hashed into ``slots`` buckets of ``resolution`` seconds by their
+    deadline. Touching a key only moves its deadline forward (O(1)); the key
+    stays in its bucket and is re-hashed lazily when that bucket comes due and
+    the deadline turns out to have moved. ``advance`` only looks at the
+    buckets that came due since the previous call.
+    """
+    def __init__(self, timeout: float, *, resolution: float = 1.0, slots: int = 0) -> None:
+        self.timeout = timeout
+        self.resolution = resolution
+        # Enough buckets to cover one timeout, so most keys are looked at once per timeout
+        self.slots = slots or int(timeout / resolution) + 1
+        self._buckets: List[set] = [set() for _ in range(self.slots)]
+        self._deadlines: Dict[Hashable, float] = {}
+        self._bucket_of: Dict[Hashable, int] = {}
+        self._current_tick = -1
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def touch(self, key: Hashable, now: float) -> None:
+        """(Re)start the timeout of ``key`` from ``now``."""
+        if self._current_tick < 0:
+            self._current_tick = int(now / self.resolution) - 1
+        known = key in self._deadlines
+        self._deadlines[key] = now + self.timeout
+        if not known:
+            self._schedule(key, now + self.timeout)
+
+    def discard(self, key: Hashable) -> None:
+        if self._deadlines.pop(key, None) is not None:
+            self._buckets[self._bucket_of.pop(key)].discard(key)
+
+    def advance(self, now: float) -> list:
+        """Expire and return the keys whose deadline is at or before ``now``."""
+        target_tick = int(now / self.resolution)
+        if self._current_tick < 0:
+            self._current_tick = target_tick - 1
+        expired = []
+        # After a long stall every bucket is visited at most once
+        steps = min(target_tick - self._current_tick, self.slots)
+        self._current_tick = target_tick - steps
+        for _ in range(steps):
+            self._current_tick += 1
+            index = self._current_tick % self.slots
+            bucket = self._buckets[index]
+            if not bucket:
+                continue
+            keys = list(bucket)
+            bucket.clear()
+            for key in keys:
+                deadline = self._deadlines[key]
+                if deadline <= now:
+                    del self._deadlines[key]
+                    del self._bucket_of[key]
+                    expired.append(key)
+                else:
+                    self._schedule(key, deadline)
+        return expired
+
+    def _schedule(self, key: Hashable, deadline: float) -> None:
+        tick = max(int(deadline / self.resolution), self._current_tick + 1)
+        index = tick % self.slots
+        self._buckets[index].add(key)
+        self._bucket_of[key] = index
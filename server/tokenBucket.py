@@ -0,0 +1,26 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, in bursts of up to ``burst``.
+
+    The bucket is refilled lazily from the elapsed time whenever it is
+    checked, so an idle connection costs nothing.
+    """
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._last = time.monotonic()
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """Take one token; False (and nothing taken) when the bucket is empty."""
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
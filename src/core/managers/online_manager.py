@@ -6,12 +6,14 @@
 import asyncio
 import threading
 import time
-import queue
 import collections
-import json
 from collections import deque
 from typing import Optional
+from urllib.parse import urlencode
 from src.utils import Logger, GameSettings
+from src.utils.interpolation import PlayersSnapshot, RemotePlayer, SnapshotBuffer
+from server.codec import DecodeError, JsonCodec, SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON, select_codec
+from server.compression import client_extensions
 
 try:
     import websockets
@@ -21,12 +23,14 @@ except ImportError:
 
 from typing import Any
 
+# 尚未送出的聊天訊息上限（超過時 send_chat 回傳 False）
+CHAT_OUTBOX_LIMIT = 50
+
 
 class OnlineManager:
     # ===== 線上玩家管理器主類 =====
     # 負責與遠端伺服器通訊、玩家位置同步、聊天消息交換
     # ===== 屬性定義 =====
-    list_players: list[dict]           # 遠端伺服器上的其他玩家列表
     player_id: int                     # 此玩家連線後得到的唯一 ID
     # ===== WebSocket 連線狀態 =====
     _ws: Optional[Any]                 # WebSocket 連線物件
@@ -34,10 +38,17 @@ class OnlineManager:
     _ws_thread: Optional[threading.Thread]         # 執行 WebSocket 的獨立執行緒
     _stop_event: threading.Event       # 停止信號，用於優雅關閉
     _lock: threading.Lock              # 執行緒安全的互斥鎖
-    _update_queue: queue.Queue         # 位置更新佇列（主執行緒 -> WebSocket 執行緒）
-    _chat_out_queue: queue.Queue       # 聊天訊息發出佇列
+    _pending_update: Optional[dict]    # 尚未送出的最新位置（只在 WebSocket 執行緒存取）
+    _chat_outbox: collections.deque    # 尚未送出的聊天訊息（只在 WebSocket 執行緒存取）
+    _send_wakeup: Optional[asyncio.Event]  # 有東西要送時喚醒 sender
     _chat_messages: collections.deque  # 接收的聊天訊息歷史
     _last_chat_id: int                 # 最後一條聊天訊息的 ID
+    _players_seq: int                  # 最後套用的 players 封包序號
+    _players_map: str                  # 伺服器目前推送給我們的地圖（只收到同地圖的玩家）
+    _codec: Any                        # 此連線協商出的編碼 (JSON / binary)
+    _redirect_url: Optional[str]       # 分片伺服器要求改連的 URL（換地圖時交接）
+    _snapshots: SnapshotBuffer         # 遠端玩家表與位置時間軸（發佈不可變快照，渲染時內插）
+    _last_sent: Optional[tuple]        # 上次送出的 (x, y, 地圖, 方向, 移動, 時間, vx, vy)，只在遊戲執行緒存取
 
     def __init__(self):
         """初始化線上管理器，檢查依賴並設定 WebSocket URL"""
@@ -60,16 +71,25 @@ class OnlineManager:
 
         # ===== 初始化狀態 =====
         self.player_id = -1                # 未連接時為 -1
-        self.list_players = []             # 其他玩家列表
         self._ws = None                    # 連線物件
         self._ws_loop = None               # 事件迴圈
         self._ws_thread = None             # 執行緒物件
         self._stop_event = threading.Event()                    # 停止信號
         self._lock = threading.Lock()                           # 互斥鎖
-        self._update_queue = queue.Queue(maxsize=10)            # 位置更新佇列
-        self._chat_out_queue = queue.Queue(maxsize=50)          # 聊天佇列
+        self._pending_update = None                             # 最新位置（新的覆蓋舊的）
+        self._last_sent = None                                  # 上次送出的位置與推算速度
+        self._chat_outbox = deque()                             # 聊天發送佇列
+        self._send_wakeup = None                                # 事件迴圈啟動時建立
         self._chat_messages = deque(maxlen=200)                 # 聊天歷史
         self._last_chat_id = 0                                  # 聊天 ID 追蹤
+        self._players_seq = 0                                   # players 封包序號
+        self._players_map = ""                                  # 訂閱中的地圖
+        self._snapshots = SnapshotBuffer(GameSettings.ONLINE_INTERPOLATION_DELAY,
+                                         GameSettings.ONLINE_MAX_EXTRAPOLATION)
+        self._codec = JsonCodec()                               # 連線後依子協定更新
+        self._redirect_url = None                               # 分片交接目標
+        self._resume_token = None                               # 斷線重連時用來接回同一個玩家
+        self._players_synced = False                            # 玩家表與 _players_seq 一致（沒漏掉封包）
 
         Logger.info("OnlineManager initialized")
 
@@ -81,13 +101,20 @@ class OnlineManager:
         """退出遊戲場景時停止 WebSocket 連線"""
         self.stop()
 
-    def get_list_players(self) -> list[dict]:
-        """Get list of players"""
-        with self._lock:
-            return list(self.list_players)
+    def get_players_snapshot(self) -> PlayersSnapshot:
+        """目前版本的遠端玩家快照（不可變，不需要加鎖；version 沒變就不用重建渲染資料）"""
+        return self._snapshots.current
+
+    def get_list_players(self) -> tuple[RemotePlayer, ...]:
+        """其他玩家在伺服器上的最新狀態"""
+        return self._snapshots.current.players
+
+    def get_interpolated_players(self) -> list[RemotePlayer]:
+        """其他玩家在渲染時間點的位置（內插伺服器快照）"""
+        return self._snapshots.current.sample()
 
     def update(self, x: float, y: float, map_name: str, direction: str = "down", is_moving: bool = False) -> bool:
-        """隊列位置更新，包含方向和移動狀態。
+        """隊列位置更新，包含方向和移動狀態。每一幀都可以呼叫，實際只在需要時送出（見 _should_send）。
         
         參數:
             x, y: 玩家座標
@@ -97,19 +124,75 @@ class OnlineManager:
         """
         if self.player_id == -1:
             return False
+        now = time.monotonic()
+        if not self._should_send(x, y, map_name, direction, is_moving, now):
+            # 其他玩家依上次送出的狀態推算得到的位置仍然夠準
+            return True
+        # 追蹤玩家方向和移動狀態，用於線上玩家動畫渲染
+        if not self._post(self._set_pending_update, {
+            "x": x,
+            "y": y,
+            "map": map_name,
+            "direction": direction,
+            "is_moving": is_moving,
+        }):
+            return False
+        self._remember_sent(x, y, map_name, direction, is_moving, now)
+        return True
+
+    def _should_send(self, x: float, y: float, map_name: str, direction: str, is_moving: bool, now: float) -> bool:
+        """只在以下情況送出位置：
+        - 所在格子、地圖、方向或移動狀態改變
+        - 實際位置偏離 dead reckoning 預測（上次送出的位置 + 速度 × 經過時間）超過 ONLINE_SEND_DRIFT
+        - 距離上次送出超過 ONLINE_SEND_HEARTBEAT
+        """
+        last = self._last_sent
+        if last is None:
+            return True
+        last_x, last_y, last_map, last_direction, last_moving, sent_at, vx, vy = last
+        if map_name != last_map or direction != last_direction or is_moving != last_moving:
+            return True
+        tile = GameSettings.TILE_SIZE
+        if int(x // tile) != int(last_x // tile) or int(y // tile) != int(last_y // tile):
+            return True
+        elapsed = now - sent_at
+        predicted_x = last_x + vx * elapsed
+        predicted_y = last_y + vy * elapsed
+        if (x - predicted_x) ** 2 + (y - predicted_y) ** 2 > GameSettings.ONLINE_SEND_DRIFT ** 2:
+            return True
+        return elapsed >= GameSettings.ONLINE_SEND_HEARTBEAT
+
+    def _remember_sent(self, x: float, y: float, map_name: str, direction: str, is_moving: bool, now: float) -> None:
+        # 速度由最近兩次送出的位置推算（接收端內插快照時看到的也是同樣的兩點）
+        vx = vy = 0.0
+        last = self._last_sent
+        if is_moving and last is not None and last[2] == map_name and last[4] and now > last[5]:
+            vx = (x - last[0]) / (now - last[5])
+            vy = (y - last[1]) / (now - last[5])
+        self._last_sent = (x, y, map_name, direction, is_moving, now, vx, vy)
+
+    def _post(self, callback, *args) -> bool:
+        """從遊戲執行緒把工作交給 WebSocket 事件迴圈，並立即喚醒它（不需要輪詢）"""
+        loop = self._ws_loop
+        if loop is None:
+            return False
         try:
-            # 追蹤玩家方向和移動狀態，用於線上玩家動畫渲染
-            self._update_queue.put_nowait({
-                "x": x,
-                "y": y,
-                "map": map_name,
-                "direction": direction,
-                "is_moving": is_moving,
-            })
+            loop.call_soon_threadsafe(callback, *args)
             return True
-        except queue.Full:
+        except RuntimeError:
+            # 事件迴圈已關閉
             return False
 
+    def _set_pending_update(self, update: dict) -> None:
+        # 在 WebSocket 執行緒執行：只保留最新位置
+        self._pending_update = update
+        self._send_wakeup.set()
+
+    def _queue_chat(self, text: str, channel: str) -> None:
+        # 在 WebSocket 執行緒執行
+        self._chat_outbox.append((text, channel))
+        self._send_wakeup.set()
+
     def start(self) -> None:
         if self._ws_thread and self._ws_thread.is_alive():
             return
@@ -154,19 +237,35 @@ class OnlineManager:
 
     async def _ws_main(self) -> None:
         """Main WebSocket connection and message handling"""
+        # asyncio 物件必須在這個執行緒的事件迴圈中建立
+        self._send_wakeup = asyncio.Event()
         reconnect_delay = 1.0
         max_reconnect_delay = 30.0
 
         while not self._stop_event.is_set():
+            # 被分片伺服器導向時連到指定的分片，否則連到入口
+            base_url = self._redirect_url or self.ws_url
+            url = self._resume_url(base_url)
             try:
                 # Connect to WebSocket server
+                # 提供 binary 子協定；伺服器不支援時退回 JSON
+                subprotocols = [SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON] if GameSettings.ONLINE_BINARY_CODEC else None
                 async with websockets.connect(
-                    self.ws_url,
+                    url,
                     ping_interval=20,
-                    ping_timeout=10
+                    ping_timeout=10,
+                    subprotocols=subprotocols,
+                    compression=None,
+                    extensions=client_extensions(
+                        GameSettings.ONLINE_COMPRESSION,
+                        GameSettings.ONLINE_COMPRESSION_WINDOW_BITS,
+                        GameSettings.ONLINE_COMPRESSION_MEM_LEVEL,
+                        GameSettings.ONLINE_COMPRESSION_CONTEXT_TAKEOVER,
+                    ),
                 ) as websocket:
                     self._ws = websocket
-                    Logger.info("WebSocket connected")
+                    self._codec = select_codec(websocket.subprotocol)
+                    Logger.info(f"WebSocket connected (codec={self._codec.subprotocol})")
                     reconnect_delay = 1.0  # Reset delay on successful connection
 
                     # Start sender task
@@ -189,107 +288,159 @@ class OnlineManager:
 
             except Exception as e:
                 Logger.warning(f"WebSocket connection error: {e}, reconnecting in {reconnect_delay}s")
+                # 連不上分片時退回入口重新分配
+                self._redirect_url = None
                 await asyncio.sleep(reconnect_delay)
                 reconnect_delay = min(reconnect_delay * 2, max_reconnect_delay)
             finally:
                 self._ws = None
-                if not self._stop_event.is_set():
+                # 剛收到導向時立即改連，不等待
+                if not self._stop_event.is_set() and (self._redirect_url or self.ws_url) == base_url:
                     await asyncio.sleep(0.5)
 
-    async def _handle_message(self, message: str) -> None:
+    def _resume_url(self, url: str) -> str:
+        """重連時附上 resume token：伺服器接回同一個玩家，只補送漏掉的聊天與玩家差量"""
+        if not self._resume_token:
+            return url
+        with self._lock:
+            params = {"resume": self._resume_token, "chat_since": self._last_chat_id}
+            if self._players_synced:
+                params["map"] = self._players_map
+                params["seq"] = self._players_seq
+        return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+    async def _handle_message(self, message: str | bytes) -> None:
         """Handle incoming WebSocket message"""
         try:
-            data = json.loads(message)
+            data = self._codec.decode(message)
             msg_type = data.get("type")
 
+            if data.get("chat"):
+                # 伺服器把同一個 tick 的聊天訊息併入玩家封包（即使該封包屬於舊地圖也要先收下聊天）
+                with self._lock:
+                    self._apply_chat(data["chat"])
+
             if msg_type == "registered":
                 self.player_id = int(data.get("id", -1))
-                Logger.info(f"OnlineManager registered with id={self.player_id}")
+                self._resume_token = data.get("resume") or None
+                # 重新連線後立即送出目前位置
+                self._last_sent = None
+                self._snapshots.local_id = self.player_id
+                if data.get("resumed"):
+                    Logger.info(f"OnlineManager resumed session id={self.player_id}")
+                else:
+                    # 新的玩家：之前的玩家表作廢，等待 keyframe
+                    with self._lock:
+                        self._players_synced = False
+                    Logger.info(f"OnlineManager registered with id={self.player_id}")
+
+            elif msg_type == "redirect":
+                # 分片模式：目前的地圖由另一個伺服器負責，改連過去（新伺服器會重新註冊並送出聊天紀錄）
+                self._redirect_url = str(data.get("url", "")) or None
+                Logger.info(f"OnlineManager redirected to {self._redirect_url}")
+                self.player_id = -1
+                # 新的分片不認得這個 token
+                self._resume_token = None
+                with self._lock:
+                    self._chat_messages.clear()
+                    self._last_chat_id = 0
+                    self._snapshots.clear()
+                if self._ws:
+                    await self._ws.close()
 
             elif msg_type == "players_update":
-                players_data = data.get("players", {})
-                Logger.info(f"[OnlineManager] Received players_update: {len(players_data)} players from server")
+                # 完整快照 (keyframe)：直接取代本地玩家表
+                # 伺服器只送出與我們同一張地圖的玩家，切換地圖時會收到新地圖的 keyframe
                 with self._lock:
-                    filtered = []
-                    for pid_str, player_data in players_data.items():
-                        pid = int(pid_str)
-                        if pid != self.player_id:
-                            # 包含方向和移動狀態，用於渲染線上玩家的動畫
-                            # 伺服器使用 "dir" 和 "moving"，客戶端統一為 "direction" 和 "is_moving"
-                            filtered.append({
-                                "id": pid,
-                                "x": float(player_data.get("x", 0)),
-                                "y": float(player_data.get("y", 0)),
-                                "map": str(player_data.get("map", "")),
-                                "direction": str(player_data.get("dir", "down")),
-                                "is_moving": bool(player_data.get("moving", False)),
-                            })
-                    Logger.info(f"[OnlineManager] After filtering (excluding self, id={self.player_id}): {len(filtered)} other players")
-                    for fp in filtered:
-                        Logger.info(f"  Player {fp['id']}: map='{fp['map']}', pos=({fp['x']}, {fp['y']}), dir={fp['direction']}, moving={fp['is_moving']}")
-                    self.list_players = filtered
+                    self._players_seq = int(data.get("seq", 0))
+                    self._players_map = str(data.get("map", ""))
+                    self._players_synced = True
+                    self._snapshots.keyframe(float(data.get("timestamp", 0.0)), data.get("players", {}))
+
+            elif msg_type == "players_delta":
+                # 差量封包：只包含加入、變動或離開的玩家
+                seq = int(data.get("seq", 0))
+                with self._lock:
+                    if str(data.get("map", "")) != self._players_map:
+                        # 切換地圖前的舊地圖差量，等待新地圖的 keyframe
+                        return
+                    if seq != self._players_seq + 1:
+                        # 漏掉封包時仍套用差量，下一個 keyframe 會重新同步
+                        Logger.debug(f"[OnlineManager] players_delta gap: {self._players_seq} -> {seq}")
+                        self._players_synced = False
+                    self._snapshots.delta(float(data.get("timestamp", 0.0)), data.get("changed", {}),
+                                          data.get("removed", []))
+                    self._players_seq = seq
 
             elif msg_type == "chat_update":
-                messages = data.get("messages", [])
                 with self._lock:
-                    for m in messages:
-                        self._chat_messages.append(m)
-                        mid = int(m.get("id", self._last_chat_id))
-                        if mid > self._last_chat_id:
-                            self._last_chat_id = mid
+                    self._apply_chat(data.get("messages", []))
 
             elif msg_type == "error":
                 Logger.warning(f"Server error: {data.get('message', 'unknown')}")
 
-        except json.JSONDecodeError as e:
+        except DecodeError as e:
             Logger.warning(f"Failed to parse WebSocket message: {e}")
         except Exception as e:
             Logger.warning(f"Error handling WebSocket message: {e}")
 
+    def _apply_chat(self, messages: list) -> None:
+        """加入新的聊天訊息，略過已收過的 ID（呼叫者需持有 _lock）"""
+        for m in messages:
+            mid = int(m.get("id", 0))
+            if mid and mid <= self._last_chat_id:
+                # 連線時的聊天紀錄與下一個 tick 的批次可能重疊
+                continue
+            self._chat_messages.append(m)
+            if mid > self._last_chat_id:
+                self._last_chat_id = mid
+
     async def _ws_sender(self, websocket: Any) -> None:
-        """Send updates to server via WebSocket"""
-        update_interval = 0.0167  # 60 updates per second
-        last_update = time.monotonic()
+        """Send updates to server via WebSocket
+
+        沒有東西要送時完全休眠，update() / send_chat() 會透過 call_soon_threadsafe 喚醒。
+        位置平均最多每 update_interval 送一次，等待期間的新位置覆蓋舊的，只送出最新的。
+        """
+        update_interval = 1 / 60  # 60 updates per second
+        # 下一次允許送出位置的時間；依排程累加而非實際送出時間，避免畫面時間抖動累積成延遲
+        next_update = 0.0
 
         while not self._stop_event.is_set():
             try:
-                # Send position updates
-                now = time.monotonic()
-                if now - last_update >= update_interval:
-                    # Collapse queue to latest entry to avoid sending stale movement
-                    latest_update = None
-                    try:
-                        while True:
-                            latest_update = self._update_queue.get_nowait()
-                    except queue.Empty:
-                        pass
-
-                    if latest_update and self.player_id >= 0:
-                        # 發送玩家位置和狀態（包含方向和移動標誌），讓其他玩家能正確渲染這個玩家的動畫
-                        message = {
-                            "type": "player_update",
-                            "x": latest_update.get("x"),
-                            "y": latest_update.get("y"),
-                            "map": latest_update.get("map"),
-                            "direction": latest_update.get("direction", "down"),
-                            "is_moving": latest_update.get("is_moving", False),
-                        }
-                        await websocket.send(json.dumps(message))
-                        last_update = now
+                await self._send_wakeup.wait()
+                self._send_wakeup.clear()
 
                 # Send chat messages
-                try:
-                    chat_text = self._chat_out_queue.get_nowait()
-                    if self.player_id >= 0:
-                        message = {
-                            "type": "chat_send",
-                            "text": chat_text
-                        }
-                        await websocket.send(json.dumps(message))
-                except queue.Empty:
-                    pass
-
-                await asyncio.sleep(0.01)  # Small sleep to prevent busy waiting
+                while self._chat_outbox and self.player_id >= 0:
+                    chat_text, channel = self._chat_outbox.popleft()
+                    message = {
+                        "type": "chat_send",
+                        "text": chat_text,
+                        "channel": channel
+                    }
+                    await websocket.send(self._codec.encode(message), text=self._codec.text_frames)
+
+                # Send position updates
+                if self._pending_update is not None and self.player_id >= 0:
+                    now = time.monotonic()
+                    # 閒置期間最多累積一次的額度
+                    next_update = max(next_update, now - update_interval)
+                    wait = next_update - now
+                    if wait > 0:
+                        # 等待期間的新位置會覆蓋 _pending_update
+                        await asyncio.sleep(wait)
+                    latest_update, self._pending_update = self._pending_update, None
+                    # 發送玩家位置和狀態（包含方向和移動標誌），讓其他玩家能正確渲染這個玩家的動畫
+                    message = {
+                        "type": "player_update",
+                        "x": latest_update.get("x"),
+                        "y": latest_update.get("y"),
+                        "map": latest_update.get("map"),
+                        "direction": latest_update.get("direction", "down"),
+                        "is_moving": latest_update.get("is_moving", False),
+                    }
+                    await websocket.send(self._codec.encode(message), text=self._codec.text_frames)
+                    next_update += update_interval
 
             except Exception as e:
                 Logger.warning(f"WebSocket send error: {e}")
@@ -298,17 +449,16 @@ class OnlineManager:
     # -----------------------------
     # Chat API
     # -----------------------------
-    def send_chat(self, text: str) -> bool:
+    def send_chat(self, text: str, channel: str = "global") -> bool:
+        """送出聊天訊息；channel 為 "global"（所有人）、"map"（同地圖）或 "nearby"（附近玩家）"""
         if self.player_id == -1:
             return False
         t = (text or "").strip()
         if not t:
             return False
-        try:
-            self._chat_out_queue.put_nowait(t)
-            return True
-        except queue.Full:
+        if len(self._chat_outbox) >= CHAT_OUTBOX_LIMIT:
             return False
+        return self._post(self._queue_chat, t, channel)
 
     def get_recent_chat(self, limit: int = 50) -> list[dict]:
         with self._lock:
@@ -5,6 +5,10 @@ from .component import UIComponent
 from src.core.services import input_manager
 from src.utils import Logger
 
+# 聊天頻道（與伺服器的 chat_send "channel" 對應）與顯示名稱，按 Tab 切換
+CHAT_CHANNELS = ("global", "map", "nearby")
+CHANNEL_LABELS = {"global": "All", "map": "Map", "nearby": "Near"}
+
 
 class ChatOverlay(UIComponent):
     """Lightweight chat UI similar to Minecraft: toggle with a key, type, press Enter to send."""
@@ -13,14 +17,15 @@ class ChatOverlay(UIComponent):
     _cursor_timer: float
     _cursor_visible: bool
     _just_opened: bool
-    _send_callback: Callable[[str], bool] | None    #  NOTE: This is a callable function, you need to give it a function that sends the message
+    _channel: str
+    _send_callback: Callable[[str, str], bool] | None    #  NOTE: This is a callable function, you need to give it a function that sends the message (text, channel)
     _get_messages: Callable[[int], list[dict]] | None # NOTE: This is a callable function, you need to give it a function that gets the messages
     _font_msg: pg.font.Font
     _font_input: pg.font.Font
 
     def __init__(
         self,
-        send_callback: Callable[[str], bool] | None = None,
+        send_callback: Callable[[str, str], bool] | None = None,
         get_messages: Callable[[int], list[dict]] | None = None,
         *,
         font_path: str = "assets/fonts/Minecraft.ttf"
@@ -30,6 +35,7 @@ class ChatOverlay(UIComponent):
         self._cursor_timer = 0.0
         self._cursor_visible = True
         self._just_opened = False
+        self._channel = CHAT_CHANNELS[0]
         self._send_callback = send_callback
         self._get_messages = get_messages
 
@@ -59,14 +65,27 @@ class ChatOverlay(UIComponent):
         else:
             self.open()
 
+    @property
+    def channel(self) -> str:
+        return self._channel
+
+    def next_channel(self) -> None:
+        """切換到下一個聊天頻道"""
+        index = CHAT_CHANNELS.index(self._channel)
+        self._channel = CHAT_CHANNELS[(index + 1) % len(CHAT_CHANNELS)]
+
     def _handle_typing(self) -> None:
         """
         處理文本輸入
         - 字母、數字、特殊字符：添加到聊天框
         - Backspace：刪除最後一個字元
+        - Tab：切換聊天頻道
         - Enter：發送聊天訊息
         - Escape：關閉聊天框
         """
+        if input_manager.key_pressed(pg.K_TAB):
+            self.next_channel()
+
         # 處理字母輸入（大小寫）
         shift = input_manager.key_down(pg.K_LSHIFT) or input_manager.key_down(pg.K_RSHIFT)
         for k in range(pg.K_a, pg.K_z + 1):
@@ -114,7 +133,7 @@ class ChatOverlay(UIComponent):
                 ok = False
                 try:
                     # 調用發送回調函數發送聊天訊息
-                    ok = self._send_callback(txt)
+                    ok = self._send_callback(txt, self._channel)
                 except Exception as e:
                     Logger.error(f"Failed to send chat message: {e}")
                     ok = False
@@ -188,7 +207,10 @@ class ChatOverlay(UIComponent):
                 # 訊息格式：[發送者]: 訊息內容
                 sender = str(m.get("from", ""))
                 text = str(m.get("text", ""))
-                surf = self._font_msg.render(f"{sender}: {text}", True, (255, 255, 255))
+                channel = m.get("channel", "global")
+                # 非全體頻道的訊息加上頻道標籤
+                tag = "" if channel == "global" else f"[{CHANNEL_LABELS.get(channel, channel)}] "
+                surf = self._font_msg.render(f"{tag}{sender}: {text}", True, (255, 255, 255))
                 # 從下往上排列
                 draw_y -= surf.get_height() + 4
                 if draw_y >= container_y + 4:
@@ -210,8 +232,8 @@ class ChatOverlay(UIComponent):
         bg2.fill((0, 0, 0, 160))
         _ = screen.blit(bg2, (x, box_y))
         
-        # 繪製使用者輸入的文本
-        txt = self._input_text
+        # 繪製使用者輸入的文本，前面顯示目前的頻道
+        txt = f"[{CHANNEL_LABELS[self._channel]}] {self._input_text}"
         # 限制顯示寬度，避免超出邊界
         display_text = txt
         text_surf = self._font_input.render(display_text, True, (255, 255, 255))
@@ -206,6 +206,8 @@ class GameScene(Scene):
         # 為在線玩家創建動畫精靈（而不是靜態圖標）
         # 使用字典為每個玩家ID維護單獨的動畫實例
         self.online_player_animations = {}
+        # 動畫表對應的玩家快照版本（版本沒變就不重建）
+        self.online_players_version = -1
         self.sprite_online = Sprite("ingame_ui/options1.png", (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE))
         
         # 初始化聊天系統 - 聊天頻道用於遊戲中玩家間的交流
@@ -642,6 +644,20 @@ class GameScene(Scene):
         except Exception:
             return False
 
+    def _rebuild_online_animations(self, snapshot) -> None:
+        """依玩家快照建立動畫表：新玩家建立動畫實例，已離開的玩家移除（保留其餘玩家的動畫進度）"""
+        animations = {}
+        for player_id in snapshot.ids:
+            anim = self.online_player_animations.get(player_id)
+            if anim is None:
+                anim = Animation(
+                    "character/ow1.png", ["down", "left", "right", "up"], 4,
+                    (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE)
+                )
+            animations[player_id] = anim
+        self.online_player_animations = animations
+        self.online_players_version = snapshot.version
+
     def draw(self, screen: pg.Surface):
         overlay_active = hasattr(self, "overlay") and self.overlay.is_active
 
@@ -671,33 +687,24 @@ class GameScene(Scene):
             # 渲染其他玩家
             # 從線上管理器獲取其他玩家的位置、方向、移動狀態資訊
             try:
-                list_online = self.online_manager.get_list_players()
-                # 調試：打印在線玩家列表
+                # 不可變的玩家快照，讀取不需要鎖；只有版本變了（收到玩家封包）才重建動畫表
+                snapshot = self.online_manager.get_players_snapshot()
+                if snapshot.version != self.online_players_version:
+                    self._rebuild_online_animations(snapshot)
+
+                # 以稍微延遲的時間點內插伺服器快照，低 tick rate 下也能平滑移動
                 current_map_name = self.game_manager.current_map.path_name
-                # Logger.info(f"[Draw] Online players count: {len(list_online)}, Current map: '{current_map_name}'")
-                for p in list_online:
-                    same_map = "✓" if p['map'] == current_map_name else "✗"
-                    Logger.info(f"  {same_map} Player {p['id']}: pos=({p['x']}, {p['y']}), map='{p['map']}', dir={p['direction']}, moving={p['is_moving']}")
-                
-                for player in list_online:
-                    if player["map"] == self.game_manager.current_map.path_name:
-                        player_id = player["id"]
+                for player in snapshot.sample():
+                    # 伺服器只推送同地圖的玩家；此檢查只是在切換地圖、新 keyframe 到達前的保護
+                    if player.map == current_map_name:
                         cam = self.game_manager.player.camera
-                        pos = cam.transform_position_as_position(Position(player["x"], player["y"]))
-                        
-                        # 為此玩家ID創建或獲取動畫實例
-                        if player_id not in self.online_player_animations:
-                            self.online_player_animations[player_id] = Animation(
-                                "character/ow1.png", ["down", "left", "right", "up"], 4,
-                                (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE)
-                            )
-                        
-                        anim = self.online_player_animations[player_id]
+                        pos = cam.transform_position_as_position(Position(player.x, player.y))
+                        anim = self.online_player_animations[player.id]
                         
                         # 取得玩家的方向和移動狀態
                         # 方向決定動畫的朝向，移動狀態決定是否顯示移動動畫
-                        player_direction = player.get("direction", "down")
-                        is_moving = player.get("is_moving", False)
+                        player_direction = player.direction
+                        is_moving = player.is_moving
                         
                         # 根據方向改變動畫朝向
                         anim.switch(player_direction)
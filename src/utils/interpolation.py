@@ -0,0 +1,210 @@
+# ============================================
+# 遠端玩家快照插值
+# 功能: 依伺服器 timestamp 保存每位玩家的位置時間軸，
+#       以稍微延遲的時間點內插位置，封包延遲時有限度地外插
+# 執行緒: WebSocket 執行緒寫入 SnapshotBuffer，每個封包發佈一個新的 PlayersSnapshot；
+#         渲染執行緒只讀取目前的 PlayersSnapshot，不需要加鎖
+# ============================================
+import time
+from typing import Optional
+
+# 每位玩家最多保留的樣本數（正常只需要渲染時間前後各一個）
+MAX_SAMPLES = 32
+# 最新封包之前保留多久的樣本/已離開的玩家（秒，需大於插值延遲）
+HISTORY = 1.0
+# 伺服器時鐘偏移的平滑係數（越小越不受網路抖動影響）
+OFFSET_SMOOTHING = 0.1
+
+
+class RemotePlayer:
+    """一位遠端玩家在某個時間點的狀態（建立後不修改，可在執行緒間共用）"""
+    __slots__ = ("id", "x", "y", "map", "direction", "is_moving")
+
+    def __init__(self, pid: int, x: float, y: float, map_name: str, direction: str, is_moving: bool) -> None:
+        # 每一幀每位玩家都會建立一個，保持最便宜的寫法（不攔截 __setattr__）
+        self.id = pid
+        self.x = x
+        self.y = y
+        self.map = map_name
+        self.direction = direction
+        self.is_moving = is_moving
+
+    def __repr__(self) -> str:
+        return (f"RemotePlayer(id={self.id}, pos=({self.x}, {self.y}), map='{self.map}', "
+                f"dir={self.direction}, moving={self.is_moving})")
+
+
+class PlayersSnapshot:
+    """某一版本的遠端玩家狀態（發佈後不再修改，渲染執行緒不加鎖讀取）
+
+    version: 每收到一個玩家封包加一；版本沒變時 players 與時間軸都沒變
+    players: 伺服器最新狀態的 RemotePlayer（不內插）
+    ids:     時間軸上的玩家 ID（包含已離開、但渲染時間還沒到離開時間的玩家）
+    """
+    __slots__ = ("version", "players", "ids", "_timelines", "_removed_at", "_offset", "_delay",
+                 "_max_extrapolation")
+
+    def __init__(self, version: int, players: tuple, timelines: dict, removed_at: dict,
+                 offset: Optional[float], delay: float, max_extrapolation: float) -> None:
+        self.version = version
+        self.players = players
+        self.ids = tuple(timelines)
+        self._timelines = timelines
+        self._removed_at = removed_at
+        self._offset = offset
+        self._delay = delay
+        self._max_extrapolation = max_extrapolation
+
+    def render_time(self, now: Optional[float] = None) -> Optional[float]:
+        """目前要渲染的伺服器時間；還沒收到任何封包時為 None"""
+        if self._offset is None:
+            return None
+        return (time.monotonic() if now is None else now) + self._offset - self._delay
+
+    def sample(self, now: Optional[float] = None) -> list[RemotePlayer]:
+        """所有遠端玩家在渲染時間的位置"""
+        t = self.render_time(now)
+        if t is None:
+            return []
+        out = []
+        for pid, timeline in self._timelines.items():
+            removed_at = self._removed_at.get(pid)
+            if removed_at is not None and removed_at <= t:
+                continue
+            out.append(RemotePlayer(pid, *self._sample_timeline(timeline, t)))
+        return out
+
+    def _sample_timeline(self, timeline: tuple, t: float) -> tuple:
+        first = timeline[0]
+        if t < first[0] or len(timeline) == 1:
+            # 剛出現的玩家畫在第一個位置；只有一個樣本時停在原地
+            return first[1:]
+        # 渲染時間所在的區間 [a, b]；超過最後一個樣本時 a、b 是最後兩個樣本
+        i = len(timeline) - 2
+        while i > 0 and timeline[i][0] > t:
+            i -= 1
+        a, b = timeline[i], timeline[i + 1]
+        if a[3] != b[3]:
+            # 換地圖不內插
+            return b[1:] if t >= b[0] else a[1:]
+        span = b[0] - a[0]
+        if t < b[0]:
+            k = (t - a[0]) / span
+            # 方向與移動狀態取目標樣本，走路動畫才會和位移同步
+            return a[1] + (b[1] - a[1]) * k, a[2] + (b[2] - a[2]) * k, b[3], b[4], b[5]
+        if not b[5]:
+            # 已停下的玩家不外插
+            return b[1:]
+        # 封包遲到：依最後兩個樣本的速度外插，最多 max_extrapolation 秒
+        ahead = min(t - b[0], self._max_extrapolation) / span
+        return b[1] + (b[1] - a[1]) * ahead, b[2] + (b[2] - a[2]) * ahead, b[3], b[4], b[5]
+
+
+class SnapshotBuffer:
+    """每位遠端玩家一條時間軸：(伺服器時間, x, y, 地圖, 方向, 是否移動)
+
+    畫面以「估計的伺服器現在時間 - delay」渲染，所以通常有兩個樣本可以
+    內插；delay 要比一個 tick 的間隔稍長，伺服器 10–20 Hz 也能平滑移動。
+    封包遲到、或移動中的玩家還沒送出下一個位置（客戶端只在偏離預測時才送），
+    渲染時間超過最後一個樣本時，依最後兩個樣本的速度外插，最多
+    max_extrapolation 秒，之後停在外插的位置等新封包。
+
+    只有 WebSocket 執行緒呼叫 keyframe / delta / clear；每次呼叫後以一次
+    參考賦值發佈新的 current，渲染執行緒讀 current 不需要加鎖。
+    時間軸以 tuple 保存，沒變動的玩家在新舊版本間共用同一個 tuple。
+    """
+    def __init__(self, delay: float = 0.1, max_extrapolation: float = 0.1) -> None:
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        # 本地玩家的 ID：伺服器封包裡的自己不放進快照
+        self.local_id = -1
+        self._timelines: dict[int, tuple] = {}
+        # 伺服器最新狀態；沒變動的玩家沿用同一個 RemotePlayer
+        self._records: dict[int, RemotePlayer] = {}
+        # 玩家離開的伺服器時間；渲染時間到了才移除，和位置一樣延遲
+        self._removed_at: dict[int, float] = {}
+        # 伺服器時間 - 本地時間 的估計值
+        self._offset: Optional[float] = None
+        # 上一個封包的伺服器時間
+        self._last_frame_ts = 0.0
+        self._version = 0
+        self.current = PlayersSnapshot(0, (), {}, {}, None, delay, max_extrapolation)
+
+    def clear(self) -> None:
+        self._timelines.clear()
+        self._records.clear()
+        self._removed_at.clear()
+        self._last_frame_ts = 0.0
+        self._publish()
+
+    # ===== 收到封包（WebSocket 執行緒）=====
+    def keyframe(self, timestamp: float, players: dict) -> None:
+        """完整快照：不在快照裡的玩家移除"""
+        self._observe_clock(timestamp)
+        for pid in list(self._timelines):
+            if str(pid) not in players and pid not in players:
+                del self._timelines[pid]
+                self._records.pop(pid, None)
+                self._removed_at.pop(pid, None)
+        self._apply(timestamp, players)
+        self._publish()
+
+    def delta(self, timestamp: float, changed: dict, removed: list) -> None:
+        self._observe_clock(timestamp)
+        for pid in removed:
+            pid = int(pid)
+            self._records.pop(pid, None)
+            if pid in self._timelines:
+                self._removed_at[pid] = timestamp
+        self._apply(timestamp, changed)
+        # 渲染時間早已超過離開時間的玩家不再需要時間軸
+        for pid, removed_at in list(self._removed_at.items()):
+            if removed_at < timestamp - HISTORY:
+                del self._removed_at[pid]
+                self._timelines.pop(pid, None)
+        self._publish()
+
+    def _apply(self, timestamp: float, players: dict) -> None:
+        previous = self._last_frame_ts
+        horizon = timestamp - self.delay - HISTORY
+        for pid, p in players.items():
+            pid = int(pid)
+            if pid == self.local_id:
+                continue
+            sample = (timestamp, float(p.get("x", 0)), float(p.get("y", 0)), str(p.get("map", "")),
+                      str(p.get("dir", "down")), bool(p.get("moving", False)))
+            timeline = self._timelines.get(pid, ())
+            if timeline and timeline[-1][1:] == sample[1:]:
+                # keyframe 重述沒變的狀態：時間軸保留原本的時間點，否則移動中的玩家會被內插成停下再追上
+                self._removed_at.pop(pid, None)
+                continue
+            if timeline and timeline[-1][0] < previous and not timeline[-1][5]:
+                # 上一個封包沒有這位靜止的玩家 = 位置沒變；補一個靜止樣本，避免把停留時間內插成緩慢移動
+                # （移動中的玩家只在偏離預測時才送出位置，中間的空檔照速度內插）
+                timeline += ((previous, *timeline[-1][1:]),)
+            if timeline and timeline[-1][0] >= timestamp:
+                # 同一時間的重複樣本（重連後的差量等）以新的為準
+                timeline = timeline[:-1]
+            timeline += (sample,)
+            # 丟掉渲染時間早已經過的樣本（至少保留兩個，外插需要速度）
+            start = max(0, len(timeline) - MAX_SAMPLES)
+            while start < len(timeline) - 2 and timeline[start + 1][0] <= horizon:
+                start += 1
+            self._timelines[pid] = timeline[start:]
+            self._records[pid] = RemotePlayer(pid, *sample[1:])
+            self._removed_at.pop(pid, None)
+        self._last_frame_ts = max(previous, timestamp)
+
+    def _observe_clock(self, timestamp: float) -> None:
+        sample = timestamp - time.monotonic()
+        if self._offset is None:
+            self._offset = sample
+        else:
+            self._offset += (sample - self._offset) * OFFSET_SMOOTHING
+
+    def _publish(self) -> None:
+        # 複製的只有 dict 本身（參考），時間軸與 RemotePlayer 都是不可變物件，可以直接共用
+        self._version += 1
+        self.current = PlayersSnapshot(self._version, tuple(self._records.values()), dict(self._timelines),
+                                       dict(self._removed_at), self._offset, self.delay,
+                                       self.max_extrapolation)
@@ -16,5 +16,17 @@ class Settings:
     # Online - 啟用線上多人模式以同步玩家位置、方向和聊天
     IS_ONLINE: bool = True
     ONLINE_SERVER_URL: str = "ws://localhost:8989"
+    ONLINE_BINARY_CODEC: bool = True    # Offer the compact binary wire codec (falls back to JSON)
+    # permessage-deflate (see server/compression.py); the server may still decline it
+    ONLINE_COMPRESSION: bool = True
+    ONLINE_COMPRESSION_WINDOW_BITS: int = 12        # 9-15
+    ONLINE_COMPRESSION_MEM_LEVEL: int = 5           # 1-9
+    ONLINE_COMPRESSION_CONTEXT_TAKEOVER: bool = True
+    # 遠端玩家快照插值（見 src/utils/interpolation.py）
+    ONLINE_INTERPOLATION_DELAY: float = 0.1        # 渲染落後伺服器的秒數，需大於一個 tick（20 Hz = 0.05 秒）
+    ONLINE_MAX_EXTRAPOLATION: float = 0.25         # 超過最後一個快照時最多外插的秒數（涵蓋移動中兩次送出的間隔）
+    # 只在狀態改變時送出位置（dead reckoning，見 OnlineManager.update）
+    ONLINE_SEND_DRIFT: float = 16.0                # 實際位置偏離預測位置超過這麼多像素就送出
+    ONLINE_SEND_HEARTBEAT: float = 1.0             # 沒有變化時也至少每隔這麼多秒送一次
     
 GameSettings = Settings()
\ No newline at end of file
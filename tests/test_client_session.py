@@ -0,0 +1,31 @@
+import asyncio
+
+from server.clientSession import ClientSession
+from server.codec import JsonCodec
+
+
+class FailingWebSocket:
+    """Stands in for a websocket whose send() raises something other than ConnectionClosed."""
+    def __init__(self) -> None:
+        self.close_code = None
+
+    async def send(self, data, text=False) -> None:
+        raise RuntimeError("send failed")
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        self.close_code = code
+
+
+def test_writer_failure_closes_the_connection():
+    async def run() -> FailingWebSocket:
+        websocket = FailingWebSocket()
+        session = ClientSession(websocket, 1, JsonCodec())
+        session.start()
+        session.push_reliable({"type": "chat_update", "messages": []})
+        await asyncio.wait_for(session._writer, 1.0)
+        assert session.closed
+        return websocket
+
+    websocket = asyncio.run(run())
+    # 1011: internal error, so handle_client's reader loop ends and the player is cleaned up
+    assert websocket.close_code == 1011
@@ -0,0 +1,33 @@
+from server.codec import BinaryCodec, MapInterner
+
+
+def _keyframe(map_name: str) -> dict:
+    return {"type": "players_update", "map": map_name, "seq": 1, "timestamp": 2.0,
+            "players": {7: {"id": 7, "x": 10.0, "y": 20.0, "map": map_name, "dir": "up", "moving": True}}}
+
+
+def test_frames_still_encode_when_map_ids_run_out():
+    interner = MapInterner(capacity=1)
+    encoder = BinaryCodec(interner)
+    encoder.encode(_keyframe("a.tmx"))
+
+    # No id left for b.tmx: the frame falls back to JSON instead of raising
+    message = BinaryCodec().decode(encoder.encode(_keyframe("b.tmx")))
+
+    assert message["map"] == "b.tmx"
+    assert message["players"]["7"]["map"] == "b.tmx"
+
+
+def test_forgotten_map_ids_are_reused():
+    interner = MapInterner(capacity=2)
+    encoder = BinaryCodec(interner)
+    decoder = BinaryCodec()
+    decoder.decode(encoder.encode(_keyframe("a.tmx")))
+    decoder.decode(encoder.encode(_keyframe("b.tmx")))
+
+    interner.forget("a.tmx")
+    message = decoder.decode(encoder.encode(_keyframe("c.tmx")))
+
+    assert interner.intern("c.tmx") == 0
+    assert message["map"] == "c.tmx"
+    assert message["players"][7]["map"] == "c.tmx"
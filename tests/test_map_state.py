@@ -0,0 +1,61 @@
+import importlib.util
+from pathlib import Path
+
+from server.playerHandler import PlayerHandler
+
+# server.py shares its name with the server/ package, so load it by path
+_spec = importlib.util.spec_from_file_location("server_main", Path(__file__).resolve().parent.parent / "server.py")
+server_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(server_main)
+
+
+def test_only_known_maps_are_accepted(monkeypatch):
+    monkeypatch.setattr(server_main, "KNOWN_MAPS", server_main.load_known_maps("assets/maps"))
+
+    assert server_main.accept_map("map.tmx")
+    assert not server_main.accept_map("made-up.tmx")
+
+
+def test_map_names_are_capped_without_a_map_list(monkeypatch):
+    monkeypatch.setattr(server_main, "KNOWN_MAPS", None)
+    monkeypatch.setattr(server_main, "PLAYER_HANDLER", PlayerHandler())
+    monkeypatch.setattr(server_main.ServerSettings, "MAX_MAPS", 2)
+    handler = server_main.PLAYER_HANDLER
+    pid = handler.register()
+
+    assert not server_main.accept_map("x" * (server_main.ServerSettings.MAX_MAP_NAME_BYTES + 1))
+    assert server_main.accept_map("a.tmx")
+    handler.update(pid, 1.0, 1.0, "a.tmx", "down", False)
+    # "" (where registered players start) and "a.tmx" fill the cap
+    assert not server_main.accept_map("b.tmx")
+    assert server_main.accept_map("a.tmx")
+
+
+def test_empty_maps_are_forgotten_after_the_ttl(monkeypatch):
+    handler = PlayerHandler()
+    monkeypatch.setattr(server_main, "PLAYER_HANDLER", handler)
+    monkeypatch.setattr(server_main, "NEXT_MAP_SWEEP", 0.0)
+    monkeypatch.setattr(server_main.ServerSettings, "MAP_STATE_TTL", 10.0)
+    pid = handler.register()
+    handler.update(pid, 1.0, 1.0, "old.tmx", "down", False)
+    handler.collect_changes()
+    server_main.PLAYERS_SEQ["old.tmx"] = 3
+    server_main.DELTA_HISTORY["old.tmx"] = server_main.DeltaHistory()
+    server_main.MAP_INTERNER.intern("old.tmx")
+
+    server_main.prune_map_state(100.0)
+    handler.update(pid, 1.0, 1.0, "new.tmx", "down", False)
+    handler.collect_changes()
+    server_main.prune_map_state(105.0)
+    assert "old.tmx" in server_main.PLAYERS_SEQ
+
+    server_main.prune_map_state(110.0)
+    assert "old.tmx" not in server_main.PLAYERS_SEQ
+    assert "old.tmx" not in server_main.DELTA_HISTORY
+    assert not handler.has_map("old.tmx")
+    assert "old.tmx" not in server_main.MAP_INTERNER.names()
+    assert handler.get_map(pid) == "new.tmx"
+    # The freed code goes to the next new map without disturbing the players on others
+    other = handler.register()
+    handler.update(other, 2.0, 2.0, "third.tmx", "up", True)
+    assert handler.count_by_map() == {"new.tmx": 1, "third.tmx": 1}
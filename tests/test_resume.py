@@ -0,0 +1,61 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+from server.clientSession import ClientSession
+from server.codec import JsonCodec
+
+# server.py shares its name with the server/ package, so load it by path
+_spec = importlib.util.spec_from_file_location("server_main", Path(__file__).resolve().parent.parent / "server.py")
+server_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(server_main)
+
+
+class IdleWebSocket:
+    async def send(self, data, text=False) -> None:
+        pass
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+
+def _player_on_map(map_name: str) -> int:
+    pid = server_main.PLAYER_HANDLER.register()
+    server_main.PLAYER_HANDLER.update(pid, 64.0, 64.0, map_name, "down", False)
+    return pid
+
+
+def _resume(pid: int, map_name: str, seq: int) -> tuple[bool, ClientSession]:
+    async def run() -> tuple[bool, ClientSession]:
+        session = ClientSession(IdleWebSocket(), pid, JsonCodec())
+        return server_main.push_resume_delta(session, map_name, seq), session
+    return asyncio.run(run())
+
+
+def test_resume_with_nothing_missed_sends_nothing():
+    pid = _player_on_map("resume_idle.tmx")
+    other = _player_on_map("resume_idle.tmx")
+    history = server_main.DELTA_HISTORY.setdefault("resume_idle.tmx", server_main.DeltaHistory())
+    history.record(7, {pid, other})
+
+    resumed, session = _resume(pid, "resume_idle.tmx", 7)
+
+    assert resumed
+    assert not session.needs_keyframe
+    assert session.queue_depth() == 0
+
+
+def test_resume_after_missed_ticks_sends_one_delta():
+    pid = _player_on_map("resume_missed.tmx")
+    other = _player_on_map("resume_missed.tmx")
+    history = server_main.DELTA_HISTORY.setdefault("resume_missed.tmx", server_main.DeltaHistory())
+    history.record(3, {pid})
+    history.record(4, {other})
+
+    resumed, session = _resume(pid, "resume_missed.tmx", 3)
+
+    assert resumed
+    frame = session._snapshot.message
+    assert frame["type"] == "players_delta"
+    assert frame["seq"] == 4
+    assert set(frame["changed"]) == {other}
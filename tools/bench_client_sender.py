@@ -0,0 +1,135 @@
+"""Measure the OnlineManager send path: idle CPU, upstream rate and input-to-send latency.
+
+Runs a stub websocket server in a background thread and a real
+OnlineManager against it. Idle CPU is the process CPU time while the
+client is connected and the game sends nothing. The upstream rate is the
+player_update messages the server receives per second while the game
+calls ``update()`` every frame, first standing still, then walking.
+Latency is from the game thread calling ``update()`` to the server
+receiving that position, at the game's frame rate; positions the client
+did not send (unchanged, or coalesced into a newer one) are not sampled.
+
+Usage:
+    python -m tools.bench_client_sender [--idle 5] [--updates 600] [--fps 60]
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import websockets
+
+from server.codec import JsonCodec
+from src.core.managers.online_manager import OnlineManager
+from src.utils import GameSettings
+
+
+class StubServer:
+    """Registers every client and timestamps the player_update positions it receives."""
+    def __init__(self, port: int) -> None:
+        self.port = port
+        self.received: dict[float, float] = {}
+        self.updates = 0
+        self._ready = threading.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+
+    def start(self) -> None:
+        threading.Thread(target=lambda: asyncio.run(self._serve()), daemon=True).start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._stop.set)
+
+    async def _serve(self) -> None:
+        codec = JsonCodec()
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+
+        async def handle(websocket) -> None:
+            await websocket.send(codec.encode({"type": "registered", "id": 1}), text=True)
+            async for data in websocket:
+                now = time.perf_counter()
+                message = codec.decode(data)
+                if message.get("type") == "player_update":
+                    self.updates += 1
+                    self.received.setdefault(float(message["x"]), now)
+
+        async with websockets.serve(handle, "127.0.0.1", self.port):
+            self._ready.set()
+            await self._stop.wait()
+
+
+def percentiles(values: list[float]) -> str:
+    if not values:
+        return "no samples"
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return f"p50 {pick(0.5):.2f} ms, p95 {pick(0.95):.2f} ms, p99 {pick(0.99):.2f} ms, max {ordered[-1]:.2f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds connected without sending")
+    parser.add_argument("--updates", type=int, default=600, help="position updates sent")
+    parser.add_argument("--fps", type=float, default=60.0, help="game frames per second (update() calls)")
+    parser.add_argument("--speed", type=float, default=384.0, help="walking speed in px/s")
+    parser.add_argument("--port", type=int, default=18990)
+    args = parser.parse_args()
+
+    server = StubServer(args.port)
+    server.start()
+    GameSettings.ONLINE_SERVER_URL = f"ws://127.0.0.1:{args.port}"
+    manager = OnlineManager()
+    manager.start()
+    deadline = time.monotonic() + 5.0
+    while manager.player_id < 0:
+        if time.monotonic() > deadline:
+            raise SystemExit("client did not register with the stub server")
+        time.sleep(0.01)
+
+    # Idle: connected, nothing to send
+    cpu = time.process_time()
+    time.sleep(args.idle)
+    idle_cpu = (time.process_time() - cpu) / args.idle * 100
+
+    period = 1.0 / args.fps
+    duration = args.updates * period
+
+    # Standing still: the game still calls update() every frame
+    manager.update(0.0, 0.0, "map.tmx", "down", False)
+    time.sleep(0.2)
+    before = server.updates
+    next_frame = time.perf_counter()
+    for _ in range(args.updates):
+        manager.update(0.0, 0.0, "map.tmx", "down", False)
+        next_frame += period
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    time.sleep(0.2)
+    standing_rate = (server.updates - before) / duration
+
+    # Walking: one update per frame, each to a new x
+    sent: dict[float, float] = {}
+    before = server.updates
+    next_frame = time.perf_counter()
+    for i in range(1, args.updates + 1):
+        x = i * args.speed * period
+        sent[x] = time.perf_counter()
+        manager.update(x, 0.0, "map.tmx", "right", True)
+        next_frame += period
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    time.sleep(0.2)
+    walking_rate = (server.updates - before) / duration
+    manager.stop()
+    server.stop()
+
+    latencies = [(server.received[x] - t) * 1000 for x, t in sent.items() if x in server.received]
+    print(f"idle CPU:            {idle_cpu:.2f}% of one core")
+    print(f"upstream standing:   {standing_rate:.1f} msg/s")
+    print(f"upstream walking:    {walking_rate:.1f} msg/s")
+    print(f"input-to-send:       {percentiles(latencies)}")
+    print(f"updates received:    {len(latencies)} of {len(sent)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Compare the JSON and binary wire codecs on per-tick player frames.
+
+Also times the JSON backends (stdlib json vs orjson, when installed) on the
+real message shapes, and the cost of fanning a snapshot out to many
+clients with and without the shared pre-serialized EncodedMessage.
+
+Usage:
+    python -m tools.bench_codec [--players 10 100 1000] [--repeat 200] [--clients 100]
+"""
+import argparse
+import json
+import random
+import time
+
+from server.codec import JSON_BACKEND, BinaryCodec, EncodedMessage, JsonCodec, MapInterner, DIRECTIONS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAPS = ("map.tmx", "gym.tmx", "cave.tmx", "ice.tmx")
+
+
+def make_players(n: int, rng: random.Random) -> dict:
+    players = {}
+    for pid in range(n):
+        players[pid] = {
+            "id": pid,
+            "x": rng.randint(0, 60 * 64) + rng.choice((0.0, 0.25, 0.5)),
+            "y": rng.randint(0, 60 * 64) + rng.choice((0.0, 0.25, 0.5)),
+            "map": rng.choice(MAPS),
+            "dir": rng.choice(DIRECTIONS),
+            "moving": rng.random() < 0.5,
+        }
+    return players
+
+
+def bench(codec_factory, message: dict, repeat: int) -> tuple[int, float, float]:
+    encoder = codec_factory()
+    decoder = codec_factory()
+    data = encoder.encode(message)
+    decoder.decode(data)  # warm up (and learn map ids for the binary codec)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        data = encoder.encode(message)
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        decoder.decode(data)
+    t2 = time.perf_counter()
+    size = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+    return size, (t1 - t0) / repeat * 1e6, (t2 - t1) / repeat * 1e6
+
+
+def json_backends() -> dict:
+    backends = {
+        "json": (lambda obj: json.dumps(obj, separators=(",", ":")).encode("utf-8"), json.loads),
+    }
+    if orjson is not None:
+        backends["orjson"] = (lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), orjson.loads)
+    return backends
+
+
+def bench_backend(dumps, loads, message: dict, repeat: int) -> tuple[int, float, float]:
+    data = dumps(message)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        dumps(message)
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        loads(data)
+    t2 = time.perf_counter()
+    return len(data), (t1 - t0) / repeat * 1e6, (t2 - t1) / repeat * 1e6
+
+
+def bench_fanout(message: dict, clients: int, repeat: int) -> tuple[float, float]:
+    """Per-tick encode cost of sending ``message`` to ``clients`` JSON clients."""
+    codecs = [JsonCodec() for _ in range(clients)]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for codec in codecs:
+            codec.encode(message)
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        shared = EncodedMessage(message)
+        for codec in codecs:
+            shared.encode(codec)
+    t2 = time.perf_counter()
+    return (t1 - t0) / repeat * 1e6, (t2 - t1) / repeat * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=100, help="recipients in the fan-out benchmark")
+    args = parser.parse_args()
+
+    rng = random.Random(1234)
+    interner = MapInterner()
+    codecs = {
+        "json": JsonCodec,
+        "binary": lambda: BinaryCodec(interner),
+    }
+    print(f"{'players':>8} {'frame':>10} {'codec':>7} {'bytes':>9} {'encode us':>10} {'decode us':>10}")
+    for n in args.players:
+        players = make_players(n, rng)
+        frames = {
+            "keyframe": {"type": "players_update", "map": "map.tmx", "seq": 1,
+                         "players": players, "timestamp": time.time()},
+            "delta": {"type": "players_delta", "map": "map.tmx", "seq": 2,
+                      "changed": dict(list(players.items())[:max(1, n // 10)]),
+                      "removed": [], "timestamp": time.time()},
+        }
+        for frame_name, message in frames.items():
+            for codec_name, factory in codecs.items():
+                size, enc_us, dec_us = bench(factory, message, args.repeat)
+                print(f"{n:>8} {frame_name:>10} {codec_name:>7} {size:>9} {enc_us:>10.1f} {dec_us:>10.1f}")
+
+    print(f"\nJSON backends (server.codec uses {JSON_BACKEND})")
+    print(f"{'message':>22} {'backend':>8} {'bytes':>9} {'dumps us':>10} {'loads us':>10}")
+    players = make_players(max(args.players), rng)
+    shapes = {
+        "player_update": {"type": "player_update", "x": 1234.5, "y": 987.25, "map": "map.tmx",
+                          "direction": "left", "is_moving": True},
+        "chat_update": {"type": "chat_update", "messages": [
+            {"id": i, "from": i % 7, "text": f"message number {i}", "ts": time.time()} for i in range(20)]},
+        f"keyframe x{len(players)}": {"type": "players_update", "map": "map.tmx", "seq": 1,
+                                      "players": players, "timestamp": time.time()},
+        "delta x10": {"type": "players_delta", "map": "map.tmx", "seq": 2,
+                      "changed": dict(list(players.items())[:10]), "removed": [3], "timestamp": time.time()},
+    }
+    for shape_name, message in shapes.items():
+        for backend_name, (dumps, loads) in json_backends().items():
+            size, dumps_us, loads_us = bench_backend(dumps, loads, message, args.repeat)
+            print(f"{shape_name:>22} {backend_name:>8} {size:>9} {dumps_us:>10.1f} {loads_us:>10.1f}")
+
+    print(f"\nFan-out of one keyframe x{len(players)} to {args.clients} JSON clients")
+    per_client_us, shared_us = bench_fanout(shapes[f"keyframe x{len(players)}"], args.clients,
+                                            max(1, args.repeat // 10))
+    print(f"  encode per client: {per_client_us / 1000:8.2f} ms/tick")
+    print(f"  EncodedMessage:    {shared_us / 1000:8.2f} ms/tick")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,567 @@
+"""Load-test the websocket server with synthetic bot clients.
+
+Starts a local ``server.py`` (or targets ``--url``), connects N bots that
+speak the real ``player_update`` / ``chat_send`` protocol and reports server
+tick duration, end-to-end update latency, traffic and disconnects as JSON.
+
+Update latency is measured on each bot's own position: every move goes to a
+fresh x coordinate, and the time until that x comes back in a players frame
+is one sample. Updates the server coalesced into a later one are not
+sampled.
+
+``--restart-after`` restarts the local server with SIGTERM partway through
+the run. The bots reconnect with their resume token, as the game client
+does, and the report gains a ``restart`` section: shutdown time (including
+the final checkpoint), restart-to-ready time, time until every bot is back
+and the server CPU spent on the reconnect storm.
+
+``--compression-bench`` repeats the run for a set of server
+permessage-deflate settings and tabulates wire bytes saved against server
+CPU spent per tick, to pick the trade-off for a LAN or WAN deployment.
+
+Usage:
+    python -m tools.loadtest --bots 200 --duration 30 --output run.json
+    python -m tools.loadtest --bots 200 --baseline run.json
+    python -m tools.loadtest --bots 200 --duration 20 --compression-bench
+    python -m tools.loadtest --bots 500 --duration 20 --restart-after 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urlencode, urlsplit
+
+import websockets
+from websockets.asyncio.client import ClientConnection
+
+from server.codec import DIRECTIONS, SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON, DecodeError, select_codec
+
+MAPS = ("map.tmx", "gym.tmx", "cave.tmx", "ice.tmx")
+# Bots walk along x in [X_MIN, X_MIN + X_SPAN) so every move lands on a new, exactly encodable x
+X_MIN = 64
+X_SPAN = 3000
+# Seconds a bot waits (times 1-2, jittered) before reconnecting to a restarting server
+RECONNECT_DELAY = 0.25
+
+# Server permessage-deflate settings compared by --compression-bench (server.py arguments)
+COMPRESSION_CONFIGS = {
+    "off": ["--no-compression"],
+    "w9 m1": ["--compression-window-bits", "9", "--compression-mem-level", "1"],
+    "w12 m5 (default)": [],
+    "w15 m8": ["--compression-window-bits", "15", "--compression-mem-level", "8"],
+    "w12 m5 no takeover": ["--no-context-takeover"],
+}
+
+TICK_LINE = re.compile(
+    r"\[Server\] tick (?P<rate>[\d.]+)/(?P<target>[\d.]+) Hz, overruns (?P<overruns>\d+), "
+    r"mean tick (?P<mean>[\d.]+) ms, max tick (?P<max>[\d.]+) ms")
+
+
+@dataclass
+class BotStats:
+    latencies_ms: list[float] = field(default_factory=list)
+    chat_latencies_ms: list[float] = field(default_factory=list)
+    updates_sent: int = 0
+    chats_sent: int = 0
+    frames_received: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    # On the wire, i.e. after permessage-deflate
+    wire_bytes_received: int = 0
+    connected: bool = False
+    disconnected: bool = False
+    error: str = ""
+    # Reconnects after the server went away, and how long each took until registered again
+    reconnects: int = 0
+    resumed: int = 0
+    reconnect_ms: list[float] = field(default_factory=list)
+
+
+class CountingConnection(ClientConnection):
+    """Client connection that counts the bytes read from the socket."""
+    wire_bytes_in = 0
+
+    def data_received(self, data: bytes) -> None:
+        self.wire_bytes_in += len(data)
+        super().data_received(data)
+
+
+class Bot:
+    """One synthetic player: walks back and forth and chats at fixed rates."""
+    def __init__(self, index: int, args: argparse.Namespace, rng: random.Random) -> None:
+        self.index = index
+        self.args = args
+        self.rng = rng
+        self.map_name = args.maps[index % len(args.maps)]
+        self.y = float(rng.randint(64, 2000))
+        self.step = rng.randint(0, X_SPAN - 1)
+        self.player_id = -1
+        self.resume_token = ""
+        self.last_chat_id = 0
+        # Set while reconnecting; None once registered
+        self.down_since: Optional[float] = None
+        self.stats = BotStats()
+        # (x, send time) of updates whose echo has not come back yet
+        self._pending: deque[tuple[float, float]] = deque()
+        self._pending_chat: dict[str, float] = {}
+
+    def _next_x(self) -> float:
+        self.step += 1
+        return float(X_MIN + self.step % X_SPAN)
+
+    async def run(self, url: str, stop_at: float) -> None:
+        # Without --restart-after a lost connection ends the bot
+        while await self._connect(url, stop_at) and self.args.restart_after > 0 and time.monotonic() < stop_at:
+            if self.down_since is None:
+                self.down_since = time.monotonic()
+            await asyncio.sleep(RECONNECT_DELAY * (1 + self.rng.random()))
+
+    async def _connect(self, url: str, stop_at: float) -> bool:
+        """One connection until stop_at; True if it was lost and the bot should reconnect."""
+        subprotocols = [SUBPROTOCOL_BINARY if self.args.codec == "binary" else SUBPROTOCOL_JSON]
+        if self.resume_token:
+            # Same query the game client sends (see OnlineManager._resume_url)
+            url += "?" + urlencode({"resume": self.resume_token, "chat_since": self.last_chat_id})
+            self.stats.reconnects += 1
+        try:
+            async with websockets.connect(url, subprotocols=subprotocols,
+                                          compression=None if self.args.no_compression else "deflate",
+                                          max_queue=None, create_connection=CountingConnection) as ws:
+                self.stats.connected = True
+                self._pending.clear()
+                codec = select_codec(ws.subprotocol)
+                reader = asyncio.create_task(self._read(ws, codec))
+                writers = asyncio.gather(self._move(ws, codec, stop_at), self._chat(ws, codec, stop_at))
+                try:
+                    # The reader finishing first means the server closed the connection
+                    await asyncio.wait((reader, writers), return_when=asyncio.FIRST_COMPLETED)
+                    if reader.done():
+                        writers.cancel()
+                        try:
+                            await writers
+                        except (asyncio.CancelledError, websockets.ConnectionClosed):
+                            pass
+                        return True
+                    await writers
+                finally:
+                    reader.cancel()
+                    self.stats.wire_bytes_received += ws.wire_bytes_in
+        except websockets.ConnectionClosed as e:
+            self.stats.disconnected = True
+            self.stats.error = f"closed: {e}"
+            return True
+        except OSError as e:
+            self.stats.disconnected = True
+            self.stats.error = f"connect failed: {e}"
+            return True
+        return False
+
+    async def _send(self, ws, codec, message: dict) -> None:
+        data = codec.encode(message)
+        self.stats.bytes_sent += len(data)
+        await ws.send(data, text=codec.text_frames)
+
+    async def _move(self, ws, codec, stop_at: float) -> None:
+        if self.args.move_rate <= 0:
+            await asyncio.sleep(max(0.0, stop_at - time.monotonic()))
+            return
+        period = 1.0 / self.args.move_rate
+        # Spread the bots' sends over the period instead of sending in lockstep
+        next_send = time.monotonic() + self.rng.random() * period
+        while next_send < stop_at:
+            await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+            x = self._next_x()
+            self._pending.append((x, time.monotonic()))
+            await self._send(ws, codec, {"type": "player_update", "x": x, "y": self.y, "map": self.map_name,
+                                         "direction": DIRECTIONS[self.step % len(DIRECTIONS)],
+                                         "is_moving": True})
+            self.stats.updates_sent += 1
+            next_send += period
+
+    async def _chat(self, ws, codec, stop_at: float) -> None:
+        if self.args.chat_rate <= 0:
+            return
+        while True:
+            delay = self.rng.expovariate(self.args.chat_rate)
+            if time.monotonic() + delay >= stop_at:
+                return
+            await asyncio.sleep(delay)
+            text = f"bot{self.index}-{self.stats.chats_sent}"
+            self._pending_chat[text] = time.monotonic()
+            await self._send(ws, codec, {"type": "chat_send", "text": text})
+            self.stats.chats_sent += 1
+
+    async def _read(self, ws, codec) -> None:
+        try:
+            await self._read_frames(ws, codec)
+        except websockets.ConnectionClosed as e:
+            self.stats.disconnected = True
+            self.stats.error = f"closed: {e}"
+
+    async def _read_frames(self, ws, codec) -> None:
+        async for data in ws:
+            now = time.monotonic()
+            self.stats.frames_received += 1
+            self.stats.bytes_received += len(data)
+            try:
+                message = codec.decode(data)
+            except DecodeError:
+                continue
+            kind = message.get("type")
+            if kind == "registered":
+                self.player_id = message["id"]
+                self.resume_token = message.get("resume") or ""
+                if self.down_since is not None:
+                    self.stats.reconnect_ms.append((now - self.down_since) * 1000)
+                    self.stats.resumed += bool(message.get("resumed"))
+                    self.down_since = None
+            elif kind == "players_update":
+                self._on_players(message["players"], now)
+            elif kind == "players_delta":
+                self._on_players(message["changed"], now)
+            # Chat comes in chat_update or attached to a players frame
+            self._on_chat(message.get("messages") if kind == "chat_update" else message.get("chat"), now)
+
+    def _on_chat(self, messages: Optional[list], now: float) -> None:
+        for chat in messages or ():
+            self.last_chat_id = max(self.last_chat_id, chat.get("id", 0))
+            sent = self._pending_chat.pop(chat.get("text"), None)
+            if sent is not None:
+                self.stats.chat_latencies_ms.append((now - sent) * 1000)
+
+    def _on_players(self, players: dict, now: float) -> None:
+        me = players.get(self.player_id) or players.get(str(self.player_id))
+        if not me or not self._pending:
+            return
+        x = float(me["x"])
+        if all(pending_x != x for pending_x, _ in self._pending):
+            return
+        # Updates before the matching one were coalesced by the server
+        while self._pending[0][0] != x:
+            self._pending.popleft()
+        _, sent = self._pending.popleft()
+        self.stats.latencies_ms.append((now - sent) * 1000)
+
+
+# ------------------------------
+# Server process
+# ------------------------------
+class ServerProcess:
+    """A local server.py whose tick stats lines are collected from stdout."""
+    def __init__(self, port: int, extra_args: list[str], stats_interval: float) -> None:
+        # A private checkpoint, so a run never restores the players of an earlier one
+        self.checkpoint_path = os.path.join(tempfile.gettempdir(), f"i2p-loadtest-{port}.ckpt")
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.cmd = [sys.executable, "-u", "server.py", "--host", "127.0.0.1", "--port", str(port),
+                    "--chat-log-dir", "", "--checkpoint-path", self.checkpoint_path,
+                    "--stats-interval", str(stats_interval)] + extra_args
+        self.ticks: list[dict] = []
+        self.log_tail: deque[str] = deque(maxlen=20)
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._collecting = False
+
+    async def start(self, port: int) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            *self.cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        self._reader = asyncio.create_task(self._read_output())
+        # Wait until the port accepts connections
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.close()
+                return
+            except OSError:
+                if self._proc.returncode is not None:
+                    break
+                await asyncio.sleep(0.1)
+        raise RuntimeError("server did not start:\n" + "\n".join(self.log_tail))
+
+    def collect(self, enabled: bool) -> None:
+        """Only count tick stats while the bots are running at full load."""
+        self._collecting = enabled
+
+    async def _read_output(self) -> None:
+        while line := await self._proc.stdout.readline():
+            text = line.decode("utf-8", "replace").rstrip()
+            self.log_tail.append(text)
+            match = TICK_LINE.search(text)
+            if match and self._collecting:
+                self.ticks.append({
+                    "measured_rate_hz": float(match["rate"]),
+                    "rate_hz": float(match["target"]),
+                    "overruns": int(match["overruns"]),
+                    "mean_tick_ms": float(match["mean"]),
+                    "max_tick_ms": float(match["max"]),
+                })
+
+    async def stop(self) -> None:
+        if self._proc and self._proc.returncode is None:
+            self._proc.terminate()
+            await self._proc.wait()
+        if self._reader:
+            await self._reader
+
+
+async def restart_server(server: ServerProcess, port: int, url: str, bots: list["Bot"], at: float) -> dict:
+    """SIGTERM the server at ``at``, start it again and time the way back to full service."""
+    await asyncio.sleep(max(0.0, at - time.monotonic()))
+    print("[loadtest] restarting the server", file=sys.stderr)
+    started = time.monotonic()
+    await server.stop()
+    stopped = time.monotonic()
+    await server.start(port)
+    ready = time.monotonic()
+    # Wait until every bot that was connected is registered again
+    deadline = ready + 30.0
+    while time.monotonic() < deadline and any(bot.down_since is not None or bot.player_id < 0 for bot in bots):
+        await asyncio.sleep(0.02)
+    back = time.monotonic()
+    # The new process did nothing but boot and take the reconnects so far
+    metrics = await scrape_metrics(url)
+    reconnect_ms = [v for bot in bots for v in bot.stats.reconnect_ms]
+    return {
+        "shutdown_ms": round((stopped - started) * 1000, 1),
+        "restart_to_ready_ms": round((ready - stopped) * 1000, 1),
+        "all_reconnected_ms": round((back - ready) * 1000, 1),
+        "reconnect_storm_cpu_s": round(metrics.get("i2p_process_cpu_seconds", 0.0), 3),
+        "still_down": sum(bot.down_since is not None for bot in bots),
+        "resumed": sum(bot.stats.resumed for bot in bots),
+        "reconnects": sum(bot.stats.reconnects for bot in bots),
+        "reconnect_latency_ms": percentiles(reconnect_ms),
+    }
+
+
+# ------------------------------
+# Reporting
+# ------------------------------
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"count": len(ordered), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99),
+            "max": round(ordered[-1], 3)}
+
+
+async def scrape_metrics(url: str) -> dict[str, float]:
+    """Unlabelled samples from the server's /metrics endpoint ({} if unavailable)."""
+    parts = urlsplit(url)
+    try:
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    except OSError:
+        return {}
+    writer.write(f"GET /metrics HTTP/1.1\r\nHost: {parts.hostname}\r\nConnection: close\r\n\r\n".encode())
+    body = (await reader.read()).decode("utf-8", "replace")
+    writer.close()
+    samples = {}
+    for line in body.split("\r\n\r\n", 1)[-1].splitlines():
+        name, _, value = line.partition(" ")
+        if line.startswith("#") or "{" in name or not value:
+            continue
+        try:
+            samples[name] = float(value)
+        except ValueError:
+            pass
+    return samples
+
+
+def server_usage(before: dict, after: dict, elapsed: float) -> dict:
+    """Server CPU over the measured window, from two /metrics scrapes."""
+    cpu = after.get("i2p_process_cpu_seconds", 0.0) - before.get("i2p_process_cpu_seconds", 0.0)
+    ticks = after.get("i2p_tick_duration_seconds_count", 0.0) - before.get("i2p_tick_duration_seconds_count", 0.0)
+    if not after or elapsed <= 0:
+        return {}
+    return {
+        "cpu_percent": round(cpu / elapsed * 100, 1),
+        "cpu_ms_per_tick": round(cpu / ticks * 1000, 3) if ticks else None,
+        "ticks": int(ticks),
+    }
+
+
+def summarize(bots: list[Bot], ticks: list[dict], elapsed: float, server: dict) -> dict:
+    latencies = [v for bot in bots for v in bot.stats.latencies_ms]
+    chat_latencies = [v for bot in bots for v in bot.stats.chat_latencies_ms]
+    tick = {}
+    if ticks:
+        tick = {
+            "samples": len(ticks),
+            "measured_rate_hz": round(min(t["measured_rate_hz"] for t in ticks), 2),
+            "mean_tick_ms": round(sum(t["mean_tick_ms"] for t in ticks) / len(ticks), 3),
+            "max_tick_ms": round(max(t["max_tick_ms"] for t in ticks), 3),
+            "overruns": ticks[-1]["overruns"] - ticks[0]["overruns"],
+        }
+    return {
+        "tick": tick,
+        "server": server,
+        "update_latency_ms": percentiles(latencies),
+        "chat_latency_ms": percentiles(chat_latencies),
+        "bytes_in_per_s": round(sum(b.stats.bytes_received for b in bots) / elapsed),
+        "wire_bytes_in_per_s": round(sum(b.stats.wire_bytes_received for b in bots) / elapsed),
+        "bytes_out_per_s": round(sum(b.stats.bytes_sent for b in bots) / elapsed),
+        "frames_in_per_s": round(sum(b.stats.frames_received for b in bots) / elapsed, 1),
+        "updates_sent": sum(b.stats.updates_sent for b in bots),
+        "chats_sent": sum(b.stats.chats_sent for b in bots),
+        "connected": sum(b.stats.connected for b in bots),
+        "disconnects": sum(b.stats.disconnected for b in bots),
+        "errors": sorted({b.stats.error for b in bots if b.stats.error})[:10],
+    }
+
+
+# Metrics compared against a baseline run; True when lower is better
+COMPARED = {
+    ("tick", "mean_tick_ms"): True,
+    ("tick", "max_tick_ms"): True,
+    ("tick", "measured_rate_hz"): False,
+    ("update_latency_ms", "p50"): True,
+    ("update_latency_ms", "p95"): True,
+    ("update_latency_ms", "p99"): True,
+    ("chat_latency_ms", "p95"): True,
+    ("server", "cpu_ms_per_tick"): True,
+    ("bytes_in_per_s",): True,
+    ("wire_bytes_in_per_s",): True,
+    ("disconnects",): True,
+}
+
+
+def compare(results: dict, baseline: dict) -> None:
+    def lookup(data: dict, path: tuple):
+        for key in path:
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data
+
+    print(f"{'metric':<28} {'baseline':>12} {'this run':>12} {'change':>9}")
+    for path, lower_is_better in COMPARED.items():
+        old, new = lookup(baseline["results"], path), lookup(results["results"], path)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        worse = (new > old) if lower_is_better else (new < old)
+        flag = " !" if worse and old and abs(new - old) / old > 0.1 else ""
+        print(f"{'.'.join(path):<28} {old:>12} {new:>12} {change:>9}{flag}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    server = None
+    url = args.url
+    if not url:
+        server = ServerProcess(args.port, args.server_args, args.stats_interval)
+        await server.start(args.port)
+        url = f"ws://127.0.0.1:{args.port}"
+    rng = random.Random(args.seed)
+    bots = [Bot(i, args, random.Random(rng.random())) for i in range(args.bots)]
+    try:
+        start = time.monotonic()
+        stop_at = start + args.ramp + args.duration
+        tasks = []
+        for i, bot in enumerate(bots):
+            tasks.append(asyncio.create_task(bot.run(url, stop_at)))
+            if args.ramp > 0:
+                await asyncio.sleep(args.ramp / len(bots))
+        if server:
+            server.collect(True)
+        load_start = time.monotonic()
+        restart = None
+        if server and args.restart_after > 0:
+            restart = asyncio.create_task(
+                restart_server(server, args.port, url, bots, load_start + args.restart_after))
+        before = await scrape_metrics(url)
+        await asyncio.gather(*tasks)
+        after = await scrape_metrics(url)
+        # CPU counters start over in a restarted server; the restart section has its own numbers
+        usage = {} if restart else server_usage(before, after, time.monotonic() - load_start)
+        elapsed = time.monotonic() - start
+        restart_results = await restart if restart else None
+    finally:
+        if server:
+            await server.stop()
+    results = summarize(bots, server.ticks if server else [], elapsed, usage)
+    if restart_results:
+        results["restart"] = restart_results
+    return {
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("output", "baseline", "url", "compression_bench")},
+        "results": results,
+    }
+
+
+async def compression_bench(args: argparse.Namespace) -> dict:
+    """One run per COMPRESSION_CONFIGS entry against a fresh local server."""
+    base_server_args = args.server_args
+    runs = {}
+    for name, config_args in COMPRESSION_CONFIGS.items():
+        print(f"[loadtest] compression: {name}", file=sys.stderr)
+        args.server_args = base_server_args + config_args
+        runs[name] = await run(args)
+    args.server_args = base_server_args
+
+    off = runs["off"]["results"]["wire_bytes_in_per_s"] or 1
+    print(f"{'server compression':<22} {'wire KB/s':>10} {'saved':>7} {'cpu ms/tick':>12} "
+          f"{'cpu %':>6} {'tick ms':>8} {'p95 ms':>7}", file=sys.stderr)
+    for name, result in runs.items():
+        r = result["results"]
+        print(f"{name:<22} {r['wire_bytes_in_per_s'] / 1024:>10.1f} "
+              f"{(1 - r['wire_bytes_in_per_s'] / off) * 100:>6.1f}% "
+              f"{r['server'].get('cpu_ms_per_tick') or 0:>12.3f} {r['server'].get('cpu_percent', 0):>6.1f} "
+              f"{r['tick'].get('mean_tick_ms', 0):>8.3f} {r['update_latency_ms'].get('p95', 0):>7.1f}",
+              file=sys.stderr)
+    return {"compression_bench": runs}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds at full load")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which bots connect")
+    parser.add_argument("--move-rate", type=float, default=10.0, help="player_update messages per bot per second")
+    parser.add_argument("--chat-rate", type=float, default=0.05, help="chat messages per bot per second")
+    parser.add_argument("--maps", nargs="+", default=list(MAPS), help="maps the bots are spread over")
+    parser.add_argument("--codec", choices=("json", "binary"), default="binary")
+    parser.add_argument("--no-compression", action="store_true", help="bots do not offer permessage-deflate")
+    parser.add_argument("--compression-bench", action="store_true",
+                        help="compare server permessage-deflate settings (bytes saved vs CPU per tick)")
+    parser.add_argument("--restart-after", type=float, default=0.0,
+                        help="restart the local server this many seconds into the full-load phase")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", default="", help="load an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=18989, help="port of the local server")
+    parser.add_argument("--stats-interval", type=float, default=1.0, help="server tick stats interval")
+    parser.add_argument("--output", default="", help="write the results JSON here")
+    parser.add_argument("--baseline", default="", help="results JSON of an earlier run to compare against")
+    parser.add_argument("server_args", nargs=argparse.REMAINDER, help="extra arguments passed to server.py")
+    args = parser.parse_args()
+    if args.server_args[:1] == ["--"]:
+        args.server_args = args.server_args[1:]
+
+    if args.compression_bench and args.url:
+        parser.error("--compression-bench starts its own servers; drop --url")
+    if args.restart_after > 0 and args.url:
+        parser.error("--restart-after restarts the local server; drop --url")
+    results = asyncio.run(compression_bench(args) if args.compression_bench else run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Measure how the game client renders and reconnects under emulated network conditions.
+
+For each profile, starts a local ``server.py`` and a NetemProxy in front
+of it, then connects two real OnlineManagers through the proxy: a walker
+pacing back and forth at walking speed and an observer standing still.
+Every frame, the observer takes the walker's interpolated position the
+way GameScene.draw does, and the harness scores what the player would see:
+
+    step stdev   variation of the walker's on-screen movement per frame (px);
+                 0 is perfectly even motion
+    frozen       % of frames in which the walker did not move on screen,
+                 although it never stops
+    jumps        frames that moved more than 3x the expected step
+    hidden       % of frames in which the walker was missing from the view
+
+and how both clients came back after the proxy dropped them:
+
+    reconnects   connections lost and re-established
+    resumed      reconnects that got the same player id back (session resume)
+    recovery_ms  from losing the connection until players frames flow again
+
+Usage:
+    python -m tools.netem_harness                      # every profile in tools/netem_profiles
+    python -m tools.netem_harness --profiles tools/netem_profiles/flaky.json --duration 40
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from src.core.managers.online_manager import OnlineManager
+from src.utils import GameSettings
+from tools.loadtest import ServerProcess, percentiles
+from tools.netem_proxy import PROFILE_DIR, NetemProxy, Profile
+
+MAP = "map.tmx"
+# The walker paces along x in [X_MIN, X_MAX]; the observer stands at (X_MIN, Y)
+X_MIN = 200.0
+X_MAX = 1800.0
+Y = 300.0
+# Player walking speed in px/s (Player: 4 tiles/s * 1.5)
+WALK_SPEED = 4.0 * GameSettings.TILE_SIZE * 1.5
+# Seconds after connecting before frames are scored
+WARMUP = 2.0
+
+
+@dataclass
+class ConnectionTracker:
+    """Follows one OnlineManager's connection from the game thread."""
+    manager: OnlineManager
+    reconnects: int = 0
+    resumed: int = 0
+    recovery_ms: list[float] = field(default_factory=list)
+    _lost_at: Optional[float] = None
+    _lost_id: int = -1
+    _lost_version: int = 0
+
+    def poll(self, now: float) -> None:
+        manager = self.manager
+        connected = manager._ws is not None
+        if self._lost_at is None:
+            if not connected:
+                self._lost_at = now
+                self._lost_id = manager.player_id
+                self._lost_version = manager.get_players_snapshot().version
+            return
+        # Back when the new connection has delivered a players frame (registration comes first)
+        if connected and manager.get_players_snapshot().version != self._lost_version:
+            self.reconnects += 1
+            self.resumed += manager.player_id == self._lost_id
+            self.recovery_ms.append((now - self._lost_at) * 1000)
+            self._lost_at = None
+
+
+def walker_x(elapsed: float) -> tuple[float, str]:
+    """Position and facing of the walker ``elapsed`` seconds in."""
+    span = X_MAX - X_MIN
+    distance = (elapsed * WALK_SPEED) % (2 * span)
+    if distance < span:
+        return X_MIN + distance, "right"
+    return X_MAX - (distance - span), "left"
+
+
+def play(walker: OnlineManager, observer: OnlineManager, duration: float, fps: float) -> dict:
+    """The game loop: runs in a thread, like the real game next to the OnlineManager threads."""
+    trackers = [ConnectionTracker(walker), ConnectionTracker(observer)]
+    period = 1.0 / fps
+    expected_step = WALK_SPEED * period
+    steps: list[float] = []
+    frames = hidden = 0
+    previous_x: Optional[float] = None
+    started = time.monotonic()
+    next_frame = started
+    while (now := time.monotonic()) - started < duration:
+        x, direction = walker_x(now - started)
+        walker.update(x, Y, MAP, direction, True)
+        observer.update(X_MIN, Y, MAP, "down", False)
+        seen = next((p for p in observer.get_interpolated_players() if p.id == walker.player_id), None)
+        for tracker in trackers:
+            tracker.poll(now)
+        if now - started >= WARMUP:
+            frames += 1
+            if seen is None:
+                hidden += 1
+                previous_x = None
+            else:
+                if previous_x is not None:
+                    steps.append(abs(seen.x - previous_x))
+                previous_x = seen.x
+        next_frame += period
+        time.sleep(max(0.0, next_frame - time.monotonic()))
+
+    return {
+        "frames": frames,
+        "smoothness": {
+            "expected_step_px": round(expected_step, 2),
+            "mean_step_px": round(statistics.mean(steps), 2) if steps else 0.0,
+            "step_stdev_px": round(statistics.pstdev(steps), 2) if steps else 0.0,
+            "frozen_pct": round(100 * sum(step < 0.1 for step in steps) / max(1, len(steps)), 1),
+            "jumps": sum(step > 3 * expected_step for step in steps),
+            "hidden_pct": round(100 * hidden / max(1, frames), 1),
+        },
+        "reconnect": {
+            "reconnects": sum(t.reconnects for t in trackers),
+            "resumed": sum(t.resumed for t in trackers),
+            "still_down": sum(t._lost_at is not None for t in trackers),
+            "recovery_ms": percentiles([ms for t in trackers for ms in t.recovery_ms]),
+        },
+    }
+
+
+async def run_profile(path: str, args: argparse.Namespace) -> dict:
+    profile = Profile.load(path)
+    server = ServerProcess(args.server_port, args.server_args, stats_interval=60.0)
+    await server.start(args.server_port)
+    proxy = NetemProxy(profile, f"ws://127.0.0.1:{args.server_port}", args.seed, verbose=False)
+    stop = asyncio.Event()
+    proxy_task = asyncio.create_task(proxy.serve("127.0.0.1", args.proxy_port, stop))
+    GameSettings.ONLINE_SERVER_URL = f"ws://127.0.0.1:{args.proxy_port}"
+    walker, observer = OnlineManager(), OnlineManager()
+    try:
+        walker.start()
+        observer.start()
+        deadline = time.monotonic() + 10.0
+        while walker.player_id < 0 or observer.player_id < 0:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"clients did not register through the proxy ({profile.name})")
+            await asyncio.sleep(0.05)
+        result = await asyncio.to_thread(play, walker, observer, args.duration, args.fps)
+    finally:
+        await asyncio.to_thread(walker.stop)
+        await asyncio.to_thread(observer.stop)
+        stop.set()
+        await proxy_task
+        await server.stop()
+    return {"profile": profile.name, "description": profile.description, **result,
+            "proxy": proxy.stats}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    runs = []
+    for path in args.profiles:
+        print(f"[netem] profile {path}", file=sys.stderr)
+        runs.append(await run_profile(path, args))
+
+    print(f"\n{'profile':<10} {'stdev px':>8} {'frozen %':>8} {'jumps':>5} {'hidden %':>8} "
+          f"{'reconn':>6} {'resumed':>7} {'recovery p50 ms':>15}", file=sys.stderr)
+    for r in runs:
+        s, c = r["smoothness"], r["reconnect"]
+        print(f"{r['profile']:<10} {s['step_stdev_px']:>8.2f} {s['frozen_pct']:>8.1f} {s['jumps']:>5} "
+              f"{s['hidden_pct']:>8.1f} {c['reconnects']:>6} {c['resumed']:>7} "
+              f"{c['recovery_ms'].get('p50', 0):>15.0f}", file=sys.stderr)
+    return {"netem": runs}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json"))))
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per profile")
+    parser.add_argument("--fps", type=float, default=60.0, help="game frames per second")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-port", type=int, default=18993)
+    parser.add_argument("--proxy-port", type=int, default=18994)
+    parser.add_argument("--output", default="", help="write the results JSON here")
+    parser.add_argument("server_args", nargs=argparse.REMAINDER, help="extra arguments passed to server.py")
+    args = parser.parse_args()
+    if args.server_args[:1] == ["--"]:
+        args.server_args = args.server_args[1:]
+    if not args.profiles:
+        parser.error(f"no profiles found in {PROFILE_DIR}")
+
+    results = asyncio.run(run(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Websocket proxy that emulates bad network conditions between the game and server.py.
+
+Sits between OnlineManager and the server and forwards every message with
+added latency, jitter, a bandwidth cap, periodic bursts (messages held
+back and released together, as after a Wi-Fi scan or a mobile handover),
+retransmission delays and disconnects. The conditions come from a JSON
+profile, a list of phases played in order::
+
+    {
+      "description": "Home Wi-Fi with a short outage",
+      "loop": true,
+      "phases": [
+        {"duration": 15, "latency_ms": 30, "jitter_ms": 15, "loss": 0.01},
+        {"duration": 3, "offline": true},
+        {"duration": 10, "latency_ms": 30, "down": {"bandwidth_kbps": 256}}
+      ]
+    }
+
+Settings at the top of a phase apply to both directions; ``up`` (client
+to server) and ``down`` (server to client) override them per direction:
+
+    latency_ms       one-way delay
+    jitter_ms        uniform +/- variation of the delay
+    bandwidth_kbps   link rate, applied to message payload size (0 = unlimited)
+    loss             probability that a message is lost once and retransmitted
+    rto_ms           extra delay of a retransmitted message (default 200)
+    burst_every_s    every this many seconds the link stalls ...
+    burst_hold_ms    ... for this long and then delivers what it held at once
+
+A phase with ``"offline": true`` drops every connection when it starts
+(the client sees the connection reset, no close frame) and refuses new
+ones until it ends. Websocket runs over TCP, so messages are never
+reordered or dropped: loss shows up as head-of-line delay, as it would
+on a real link. Without ``loop`` the last phase stays in effect.
+
+The query string is passed through (resume tokens) and the proxy accepts
+the codec subprotocol the server picked. Shard redirects point at the
+shard itself and leave the proxy.
+
+Usage:
+    python -m tools.netem_proxy --profile tools/netem_profiles/wifi.json \\
+        --listen-port 8990 --upstream ws://127.0.0.1:8989
+    # then point the game at it: ONLINE_SERVER_URL = "ws://127.0.0.1:8990"
+"""
+import argparse
+import asyncio
+import http
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+import websockets
+from websockets.asyncio.server import ServerConnection, serve
+
+PROFILE_DIR = "tools/netem_profiles"
+
+
+# ------------------------------
+# Profiles
+# ------------------------------
+@dataclass
+class LinkConditions:
+    """Impairments of one direction of the link."""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    bandwidth_kbps: float = 0.0
+    loss: float = 0.0
+    rto_ms: float = 200.0
+    burst_every_s: float = 0.0
+    burst_hold_ms: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LinkConditions":
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: float(value) for key, value in data.items() if key in known})
+
+
+@dataclass
+class Phase:
+    duration: float
+    up: LinkConditions = field(default_factory=LinkConditions)
+    down: LinkConditions = field(default_factory=LinkConditions)
+    offline: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Phase":
+        shared = {key: value for key, value in data.items() if key not in ("duration", "offline", "up", "down")}
+        return cls(
+            duration=float(data.get("duration", 0.0)),
+            up=LinkConditions.from_dict({**shared, **data.get("up", {})}),
+            down=LinkConditions.from_dict({**shared, **data.get("down", {})}),
+            offline=bool(data.get("offline", False)),
+        )
+
+
+@dataclass
+class Profile:
+    name: str
+    phases: list[Phase]
+    loop: bool = False
+    description: str = ""
+
+    @classmethod
+    def load(cls, path: str) -> "Profile":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        phases = [Phase.from_dict(phase) for phase in data.get("phases", [])]
+        if not phases:
+            raise ValueError(f"profile {path} has no phases")
+        name = path.replace("\\", "/").rsplit("/", 1)[-1].removesuffix(".json")
+        return cls(name, phases, bool(data.get("loop", False)), str(data.get("description", "")))
+
+    def phase_at(self, elapsed: float) -> tuple[int, Phase, float]:
+        """Phase in effect ``elapsed`` seconds in, its index and the seconds until it ends."""
+        total = sum(phase.duration for phase in self.phases)
+        if self.loop and total > 0:
+            elapsed %= total
+        for index, phase in enumerate(self.phases):
+            if elapsed < phase.duration:
+                return index, phase, phase.duration - elapsed
+            elapsed -= phase.duration
+        return len(self.phases) - 1, self.phases[-1], float("inf")
+
+
+# ------------------------------
+# Links
+# ------------------------------
+class Link:
+    """One direction of one proxied connection: a delay line in front of ``send``."""
+    def __init__(self, proxy: "NetemProxy", direction: str, send) -> None:
+        self._proxy = proxy
+        self._direction = direction
+        self._send = send
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # The link is busy sending earlier bytes until then (bandwidth cap)
+        self._link_free = 0.0
+        # Messages leave in order, like bytes on a TCP stream
+        self._last_delivery = 0.0
+
+    def put(self, message: str | bytes) -> None:
+        conditions = self._proxy.conditions(self._direction)
+        now = time.monotonic()
+        rng = self._proxy.rng
+        delay = conditions.latency_ms + rng.uniform(-conditions.jitter_ms, conditions.jitter_ms)
+        if conditions.loss and rng.random() < conditions.loss:
+            delay += conditions.rto_ms
+        deliver_at = now + max(0.0, delay) / 1000
+        if conditions.bandwidth_kbps > 0:
+            self._link_free = max(self._link_free, now) + len(message) * 8 / (conditions.bandwidth_kbps * 1000)
+            deliver_at = max(deliver_at, self._link_free + conditions.latency_ms / 1000)
+        if conditions.burst_every_s > 0 and conditions.burst_hold_ms > 0:
+            # Held back until the current stall window ends
+            into_window = now % conditions.burst_every_s
+            hold = conditions.burst_hold_ms / 1000
+            if into_window < hold:
+                deliver_at = max(deliver_at, now - into_window + hold)
+        self._last_delivery = deliver_at = max(deliver_at, self._last_delivery)
+        self._queue.put_nowait((deliver_at, message))
+        self._proxy.stats[self._direction]["messages"] += 1
+        self._proxy.stats[self._direction]["bytes"] += len(message)
+
+    async def pump(self) -> None:
+        while True:
+            deliver_at, message = await self._queue.get()
+            wait = deliver_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._send(message)
+
+
+# ------------------------------
+# Proxy
+# ------------------------------
+class NetemProxy:
+    """Accepts game clients and connects each one to ``upstream`` through a pair of Links."""
+    def __init__(self, profile: Profile, upstream: str, seed: int = 1, verbose: bool = True) -> None:
+        self.profile = profile
+        self.verbose = verbose
+        self.upstream = upstream.rstrip("/")
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.phase_index = 0
+        self.phase = profile.phases[0]
+        self.stats = {
+            "up": {"messages": 0, "bytes": 0},
+            "down": {"messages": 0, "bytes": 0},
+            "connections": 0,
+            "refused": 0,
+            "dropped": 0,
+        }
+        self._upstreams: dict[ServerConnection, websockets.ClientConnection] = {}
+        self._active: set[ServerConnection] = set()
+
+    def conditions(self, direction: str) -> LinkConditions:
+        return self.phase.up if direction == "up" else self.phase.down
+
+    async def run_profile(self) -> None:
+        """Advance through the phases; drops every connection when an offline phase starts."""
+        self.started = time.monotonic()
+        while True:
+            index, phase, remaining = self.profile.phase_at(time.monotonic() - self.started)
+            self.phase_index, self.phase = index, phase
+            if self.verbose:
+                print(f"[netem] phase {index}: {'offline' if phase.offline else phase.down}", file=sys.stderr)
+            if phase.offline:
+                for connection in list(self._active):
+                    self.stats["dropped"] += 1
+                    # No close frame: the client sees a reset, as when the network goes away
+                    connection.transport.abort()
+            if remaining == float("inf"):
+                return
+            await asyncio.sleep(remaining + 0.001)
+
+    async def process_request(self, connection: ServerConnection, request):
+        if self.phase.offline:
+            self.stats["refused"] += 1
+            return connection.respond(http.HTTPStatus.SERVICE_UNAVAILABLE, "network offline\n")
+        # The client's TCP and websocket handshakes cross the emulated link too
+        await asyncio.sleep((self.phase.up.latency_ms + self.phase.down.latency_ms) / 1000)
+        offered = [value.strip() for header in request.headers.get_all("Sec-WebSocket-Protocol")
+                   for value in header.split(",") if value.strip()]
+        try:
+            self._upstreams[connection] = await websockets.connect(
+                self.upstream + request.path, subprotocols=offered or None, open_timeout=5)
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            return connection.respond(http.HTTPStatus.BAD_GATEWAY, f"upstream: {e}\n")
+        return None
+
+    def select_subprotocol(self, connection: ServerConnection, offered) -> Optional[str]:
+        # Whatever the server chose for this client, so both legs use the same codec
+        upstream = self._upstreams.get(connection)
+        return upstream.subprotocol if upstream is not None else None
+
+    async def handle(self, client: ServerConnection) -> None:
+        upstream = self._upstreams.pop(client)
+        self._active.add(client)
+        self.stats["connections"] += 1
+        up = Link(self, "up", upstream.send)
+        down = Link(self, "down", client.send)
+
+        async def forward(source, link: Link) -> None:
+            async for message in source:
+                link.put(message)
+
+        tasks = [asyncio.create_task(coro) for coro in
+                 (forward(client, up), forward(upstream, down), up.pump(), down.pump())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._active.discard(client)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+
+    async def serve(self, host: str, port: int, stop: asyncio.Event) -> None:
+        async with serve(self.handle, host, port,
+                         process_request=self.process_request,
+                         select_subprotocol=self.select_subprotocol):
+            profile_task = asyncio.create_task(self.run_profile())
+            await stop.wait()
+            profile_task.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", required=True, help=f"profile JSON (see {PROFILE_DIR})")
+    parser.add_argument("--listen-host", default="127.0.0.1")
+    parser.add_argument("--listen-port", type=int, default=8990)
+    parser.add_argument("--upstream", default="ws://127.0.0.1:8989", help="server.py websocket URL")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    proxy = NetemProxy(Profile.load(args.profile), args.upstream, args.seed)
+    print(f"[netem] {args.listen_host}:{args.listen_port} -> {args.upstream}, profile {proxy.profile.name}",
+          file=sys.stderr)
+
+    async def run() -> None:
+        await proxy.serve(args.listen_host, args.listen_port, asyncio.Event())
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(proxy.stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()